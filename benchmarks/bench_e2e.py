@@ -0,0 +1,242 @@
+"""
+End-to-end `parse_file` throughput against the local fake vLLM server (benchmarks/fake_vllm.py).
+
+Each scenario starts its own fake server and runs the client in a fresh subprocess, so
+peak RSS and CPU time are measured per scenario. Every scenario's results are printed as a
+JSON line; `--output` also writes them as one JSON report (with the package version, git
+commit and machine details) for tracking regressions across releases:
+
+    python benchmarks/bench_e2e.py --pages 300 --output bench-e2e.json
+    python benchmarks/bench_e2e.py --scenario loops --scenario loops-stream --pages 100
+
+Page latency is the time a page spends in the pipeline: rendering, scaling, encoding,
+queueing, requests (including retries) and post-processing, as reported by its metrics.
+"""
+
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+import click
+
+from bench_render import make_pdf
+
+FAKE_SERVER = Path(__file__).parent / "fake_vllm.py"
+
+# Fake server and client settings per scenario, on top of the command-line defaults
+SCENARIOS = {
+    "clean": {},
+    "slow-tail": {"latency": "lognormal:0.05,1.0"},
+    "errors": {"error_rate": 0.05},
+    "loops": {"loop_rate": 0.05},
+    "loops-stream": {"loop_rate": 0.05, "stream": True},
+}
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Nearest-rank percentile, `q` in [0, 100]."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))]
+
+
+def run_client(pdf_path: str, url: str, config: dict) -> dict:
+    from chandra import ChandraOCRClient
+    from chandra.model.retry import RetryPolicy
+
+    page_metrics = []
+    start = time.perf_counter()
+    with ChandraOCRClient(
+        base_url=url,
+        num_threads=config["concurrency"],
+        render_workers=config["render_workers"],
+        postprocess_workers=config["postprocess_workers"],
+        stream=config["stream"],
+        # Short backoff: the fake server recovers immediately
+        retry_policy=RetryPolicy(base_delay=0.05, max_delay=1.0),
+        metrics_hooks=[page_metrics.append],
+    ) as client:
+        pages = sum(1 for _ in client.parse_file_iter(pdf_path))
+    wall = time.perf_counter() - start
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    # Render and post-processing worker processes, once they have exited
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    latencies = [sum(m.stage_times().values()) for m in page_metrics]
+    stage_means = {
+        stage: round(
+            sum(m.stage_times()[stage] for m in page_metrics) / len(page_metrics), 4
+        )
+        for stage in page_metrics[0].stage_times()
+    }
+    return {
+        "pages": pages,
+        "wall_s": round(wall, 3),
+        "pages_per_s": round(pages / wall, 2),
+        "p50_page_latency_s": round(percentile(latencies, 50), 4),
+        "p99_page_latency_s": round(percentile(latencies, 99), 4),
+        "mean_stage_s": stage_means,
+        "cpu_s_per_page": round(cpu / pages, 4),
+        # ru_maxrss is reported in KiB on Linux
+        "peak_rss_mb": round(own.ru_maxrss / 1024, 1),
+        "peak_child_rss_mb": round(children.ru_maxrss / 1024, 1),
+        "completion_tokens": sum(m.completion_tokens for m in page_metrics),
+        "retries": sum(m.retries for m in page_metrics),
+        "failed_pages": sum(m.error for m in page_metrics),
+    }
+
+
+def start_server(config: dict) -> tuple[subprocess.Popen, str]:
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            str(FAKE_SERVER),
+            "--port",
+            "0",
+            "--latency",
+            config["latency"],
+            "--token-rate",
+            str(config["token_rate"]),
+            "--error-rate",
+            str(config["error_rate"]),
+            "--loop-rate",
+            str(config["loop_rate"]),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    return server, server.stdout.readline().strip()
+
+
+def run_scenario(name: str, pdf_path: str, config: dict) -> dict:
+    server, url = start_server(config)
+    try:
+        out = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--pdf",
+                pdf_path,
+                "--client",
+                url,
+                json.dumps(config),
+            ],
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        with urllib.request.urlopen(f"{url}/stats") as response:
+            server_stats = json.load(response)
+    finally:
+        server.terminate()
+        server.wait()
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    return {"scenario": name, "config": config, **result, "server": server_stats}
+
+
+def environment() -> dict:
+    import chandra
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "version": chandra.__version__,
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+@click.command()
+@click.option("--pages", default=300, help="Number of pages in the synthetic PDF.")
+@click.option(
+    "--page-size", default="612x792", help="Page size in points (default: Letter)."
+)
+@click.option(
+    "--pdf", "pdf_path", default=None, help="Benchmark an existing PDF instead."
+)
+@click.option(
+    "--scenario",
+    "scenarios",
+    multiple=True,
+    type=click.Choice(list(SCENARIOS)),
+    help="Scenarios to run (default: all).",
+)
+@click.option("--concurrency", default=32, help="Client num_threads.")
+@click.option("--render-workers", default=1)
+@click.option("--postprocess-workers", default=0)
+@click.option(
+    "--latency", default="lognormal:0.05,0.3", help="Fake server time to first token."
+)
+@click.option("--token-rate", default=2000.0, help="Fake server tokens/s per request.")
+@click.option("--output", default=None, help="Write a JSON report here.")
+@click.option("--client", "client_url", default=None, hidden=True)
+@click.argument("client_config", required=False)
+def main(
+    pages,
+    page_size,
+    pdf_path,
+    scenarios,
+    concurrency,
+    render_workers,
+    postprocess_workers,
+    latency,
+    token_rate,
+    output,
+    client_url,
+    client_config,
+):
+    if client_url is not None:
+        print(json.dumps(run_client(pdf_path, client_url, json.loads(client_config))))
+        return
+
+    defaults = {
+        "latency": latency,
+        "token_rate": token_rate,
+        "error_rate": 0.0,
+        "loop_rate": 0.0,
+        "stream": False,
+        "concurrency": concurrency,
+        "render_workers": render_workers,
+        "postprocess_workers": postprocess_workers,
+    }
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if pdf_path is None:
+            pdf_path = str(Path(tmp_dir) / "bench.pdf")
+            width, height = map(int, page_size.split("x"))
+            make_pdf(Path(pdf_path), pages, (width, height))
+
+        for name in scenarios or SCENARIOS:
+            result = run_scenario(name, pdf_path, {**defaults, **SCENARIOS[name]})
+            print(json.dumps(result), flush=True)
+            results.append(result)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(
+                {"benchmark": "e2e", **environment(), "results": results}, f, indent=2
+            )
+
+
+if __name__ == "__main__":
+    main()
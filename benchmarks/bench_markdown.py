@@ -0,0 +1,92 @@
+"""
+Throughput of HTML->Markdown conversion on table-heavy and math-heavy pages.
+
+Compares the shared converter used by `parse_markdown` against the previous approach of
+building a converter per call and searching ancestors for every text node:
+
+    python benchmarks/bench_markdown.py --copies 8 --iterations 5
+"""
+
+import json
+import time
+from pathlib import Path
+
+import click
+import six
+from markdownify import MarkdownConverter, re_whitespace
+
+from chandra.output import Markdownify, parse_html, parse_markdown
+
+OUTPUTS_DIR = Path(__file__).parent.parent / "tests" / "fixtures" / "outputs"
+SAMPLES = {"table_heavy": "table_page.html", "math_heavy": "math_page.html"}
+
+
+class LegacyMarkdownify(Markdownify):
+    def process_tag(self, node, parent_tags=None):
+        return MarkdownConverter.process_tag(self, node, parent_tags)
+
+    def process_text(self, el, parent_tags=None):
+        text = six.text_type(el) or ""
+        if not el.find_parent("pre"):
+            text = re_whitespace.sub(" ", text)
+        if not el.find_parent(["pre", "code", "kbd", "samp", "math"]):
+            text = self.escape(text)
+        if el.parent.name == "li" and (
+            not el.next_sibling or el.next_sibling.name in ["ul", "ol"]
+        ):
+            text = text.rstrip()
+        return text
+
+
+def legacy_markdown(html: str) -> str:
+    converter = LegacyMarkdownify(
+        heading_style="ATX",
+        bullets="-",
+        escape_misc=False,
+        escape_underscores=True,
+        escape_asterisks=True,
+        escape_dollars=True,
+        sub_symbol="<sub>",
+        sup_symbol="<sup>",
+        inline_math_delimiters=("$", "$"),
+        block_math_delimiters=("$$", "$$"),
+    )
+    return converter.convert(parse_html(html)).strip()
+
+
+def pages_per_second(convert, html: str, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        convert(html)
+    return iterations / (time.perf_counter() - start)
+
+
+@click.command()
+@click.option(
+    "--copies", default=8, help="Times each sample's layout blocks are repeated."
+)
+@click.option("--iterations", default=5, help="Timed conversions per sample.")
+def main(copies: int, iterations: int):
+    for name, filename in SAMPLES.items():
+        # Repeat the page body to get denser, deeper pages than a single fixture
+        html = (OUTPUTS_DIR / filename).read_text() * copies
+        legacy, fast = legacy_markdown(html), parse_markdown(html)
+        print(
+            json.dumps(
+                {
+                    "sample": name,
+                    "chars": len(html),
+                    "matches": legacy == fast,
+                    "legacy_pages_per_sec": round(
+                        pages_per_second(legacy_markdown, html, iterations), 2
+                    ),
+                    "fast_pages_per_sec": round(
+                        pages_per_second(parse_markdown, html, iterations), 2
+                    ),
+                }
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
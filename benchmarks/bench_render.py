@@ -0,0 +1,104 @@
+"""
+Compare direct-to-target PDF rendering against the legacy render + `scale_to_fit` path.
+
+Each mode runs in a fresh subprocess so peak RSS is measured independently:
+
+    python benchmarks/bench_render.py --pages 20 --page-size 2384x3370
+"""
+
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import click
+from PIL import Image, ImageDraw
+
+
+def make_pdf(path: Path, pages: int, page_size: tuple[int, int]):
+    """Write a synthetic PDF with `pages` pages of `page_size` points."""
+    images = []
+    for idx in range(pages):
+        image = Image.new("RGB", page_size, "white")
+        draw = ImageDraw.Draw(image)
+        for line in range(0, page_size[1] - 100, 40):
+            draw.text(
+                (60, 60 + line), f"Page {idx} line {line // 40} " * 6, fill="black"
+            )
+        images.append(image)
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=72)
+
+
+def run_mode(pdf_path: str, render_at_target: bool) -> dict:
+    from chandra.input import iter_file
+    from chandra.model.util import scale_to_fit
+
+    config = {"render_at_target": render_at_target}
+    times = []
+    start = time.perf_counter()
+    pages = iter_file(pdf_path, config)
+    while True:
+        page_start = time.perf_counter()
+        image = next(pages, None)
+        if image is None:
+            break
+        image = scale_to_fit(image)
+        times.append(time.perf_counter() - page_start)
+        size = image.size
+    total = time.perf_counter() - start
+
+    return {
+        "mode": "target" if render_at_target else "legacy",
+        "pages": len(times),
+        "output_size": list(size),
+        "total_s": round(total, 4),
+        "per_page_ms": round(1000 * total / len(times), 2),
+        "max_page_ms": round(1000 * max(times), 2),
+        # ru_maxrss is reported in KiB on Linux
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+@click.command()
+@click.option("--pages", default=20, help="Number of pages in the synthetic PDF.")
+@click.option(
+    "--page-size", default="2384x3370", help="Page size in points (default: A1)."
+)
+@click.option(
+    "--pdf", "pdf_path", default=None, help="Benchmark an existing PDF instead."
+)
+@click.option(
+    "--mode", type=click.Choice(["target", "legacy"]), default=None, hidden=True
+)
+def main(pages: int, page_size: str, pdf_path: str | None, mode: str | None):
+    if mode is not None:
+        print(json.dumps(run_mode(pdf_path, mode == "target")))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if pdf_path is None:
+            pdf_path = str(Path(tmp_dir) / "bench.pdf")
+            width, height = map(int, page_size.split("x"))
+            make_pdf(Path(pdf_path), pages, (width, height))
+
+        results = []
+        for mode_name in ("legacy", "target"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--pdf", pdf_path, "--mode", mode_name],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
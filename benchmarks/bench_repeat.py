@@ -0,0 +1,72 @@
+"""
+Micro-benchmark of the repeat detectors on the recorded outputs in tests/fixtures/outputs.
+
+Compares the markdown-based `detect_repeat_token` check used by earlier versions against
+`find_repeat` on raw output, and verifies both reach the same decision:
+
+    python benchmarks/bench_repeat.py --iterations 20
+"""
+
+import json
+import time
+from pathlib import Path
+
+import click
+
+from chandra.model.util import detect_repeat_token, find_repeat
+
+OUTPUTS_DIR = Path(__file__).parent.parent / "tests" / "fixtures" / "outputs"
+
+
+def legacy_check(raw: str) -> bool:
+    return detect_repeat_token(raw) or (
+        len(raw) > 50 and detect_repeat_token(raw, cut_from_end=50)
+    )
+
+
+def linear_check(raw: str) -> bool:
+    return find_repeat(raw, cut_from_end=50) is not None
+
+
+def time_check(check, raw: str, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        check(raw)
+    return (time.perf_counter() - start) / iterations
+
+
+@click.command()
+@click.option("--iterations", default=20, help="Timed runs per sample.")
+@click.option(
+    "--outputs-dir", default=str(OUTPUTS_DIR), help="Directory of raw .html outputs."
+)
+def main(iterations: int, outputs_dir: str):
+    mismatches = 0
+    for path in sorted(Path(outputs_dir).glob("*.html")):
+        raw = path.read_text()
+        legacy, linear = legacy_check(raw), linear_check(raw)
+        mismatches += legacy != linear
+        match = find_repeat(raw, cut_from_end=50)
+        print(
+            json.dumps(
+                {
+                    "sample": path.stem,
+                    "chars": len(raw),
+                    "legacy_detected": legacy,
+                    "linear_detected": linear,
+                    "period": match.period if match else None,
+                    "count": match.count if match else None,
+                    "legacy_ms": round(
+                        1000 * time_check(legacy_check, raw, iterations), 3
+                    ),
+                    "linear_ms": round(
+                        1000 * time_check(linear_check, raw, iterations), 3
+                    ),
+                }
+            )
+        )
+    print(json.dumps({"mismatches": mismatches}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Local OpenAI-compatible stand-in for a Chandra vLLM server, for benchmarks without a GPU.
+
+Chat completions replay the recorded outputs in tests/fixtures/outputs. Each request
+waits a time-to-first-token drawn from `--latency`, then "decodes" at `--token-rate`
+tokens per second (about 4 characters per token). `--error-rate` of requests fail with a
+503, and `--loop-rate` of them answer with one of the recorded repetition loops. Streaming
+requests (`stream: true`) are sent as server-sent events and stop decoding when the client
+disconnects. GET /stats returns request counters as JSON.
+
+    python benchmarks/fake_vllm.py --port 8000 --latency lognormal:0.2,0.5 --token-rate 2000
+
+Latency specs: `const:S`, `uniform:LO,HI`, `lognormal:MEDIAN,SIGMA`, `exp:MEAN` (seconds).
+"""
+
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, List
+
+import click
+
+OUTPUTS_DIR = Path(__file__).parent.parent / "tests" / "fixtures" / "outputs"
+CHARS_PER_TOKEN = 4
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",")] if args else []
+    if kind == "const":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1 / values[0])
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+
+def load_outputs(outputs_dir: Path) -> tuple[List[str], List[str]]:
+    """Recorded outputs, split into normal pages and repetition loops."""
+    normal, loops = [], []
+    for path in sorted(outputs_dir.glob("*.html")):
+        (loops if path.stem.startswith("degenerate_") else normal).append(
+            path.read_text()
+        )
+    return normal, loops
+
+
+class FakeVLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.endswith("/models"):
+            self._send_json(
+                200, {"object": "list", "data": [{"id": "chandra", "object": "model"}]}
+            )
+        elif self.path.endswith("/stats"):
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        raw, status, latency = server.draw()
+        if status != 200:
+            return self._send_json(status, {"error": {"message": "injected failure"}})
+
+        max_tokens = request.get("max_tokens") or 8192
+        raw = raw[: max_tokens * CHARS_PER_TOKEN]
+        tokens = max(1, math.ceil(len(raw) / CHARS_PER_TOKEN))
+        finish_reason = "length" if tokens >= max_tokens else "stop"
+        usage = {"prompt_tokens": server.prompt_tokens, "completion_tokens": tokens}
+        usage["total_tokens"] = usage["prompt_tokens"] + tokens
+
+        time.sleep(latency)
+        if request.get("stream"):
+            return self._stream(raw, usage, finish_reason, request)
+
+        time.sleep(tokens / server.token_rate)
+        server.count("completion_tokens", tokens)
+        message = {"role": "assistant", "content": raw}
+        self._send_json(
+            200,
+            {
+                "id": "fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "chandra",
+                "choices": [
+                    {"index": 0, "message": message, "finish_reason": finish_reason}
+                ],
+                "usage": usage,
+            },
+        )
+
+    def _stream(self, raw: str, usage: dict, finish_reason: str, request: dict):
+        server = self.server
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta: dict, finish: str | None = None, **extra):
+            chunk = {
+                "id": "fake",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": "chandra",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+                **extra,
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+        start = time.perf_counter()
+        sent = 0
+        try:
+            for sent, offset in enumerate(range(0, len(raw), CHARS_PER_TOKEN), start=1):
+                # Sleep in batches: per-token sleeps are far below timer resolution
+                ahead = start + sent / server.token_rate - time.perf_counter()
+                if ahead > 0.002:
+                    time.sleep(ahead)
+                event({"content": raw[offset : offset + CHARS_PER_TOKEN]})
+                self.wfile.flush()
+            event({}, finish_reason)
+            if (request.get("stream_options") or {}).get("include_usage"):
+                event({}, usage=usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up, e.g. after detecting a repetition loop
+            server.count("aborted_streams")
+        finally:
+            server.count("completion_tokens", sent)
+
+
+class FakeVLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(
+        self,
+        address: tuple[str, int] = ("127.0.0.1", 0),
+        latency: str = "const:0.05",
+        token_rate: float = 2000.0,
+        error_rate: float = 0.0,
+        loop_rate: float = 0.0,
+        prompt_tokens: int = 2650,
+        seed: int = 0,
+        outputs_dir: Path = OUTPUTS_DIR,
+    ):
+        super().__init__(address, FakeVLLMHandler)
+        self.latency = parse_latency(latency)
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.loop_rate = loop_rate
+        self.prompt_tokens = prompt_tokens
+        self.outputs, self.loops = load_outputs(outputs_dir)
+        self.url = f"http://{self.server_address[0]}:{self.server_address[1]}"
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0,
+            "injected_errors": 0,
+            "injected_loops": 0,
+            "aborted_streams": 0,
+            "completion_tokens": 0,
+        }
+
+    def draw(self) -> tuple[str, int, float]:
+        """Output, status and time to first token for the next request."""
+        with self._lock:
+            self._counters["requests"] += 1
+            latency = self.latency(self._rng)
+            roll = self._rng.random()
+            if roll < self.error_rate:
+                self._counters["injected_errors"] += 1
+                return "", 503, latency
+            if roll < self.error_rate + self.loop_rate and self.loops:
+                self._counters["injected_loops"] += 1
+                return self._rng.choice(self.loops), 200, latency
+            return self._rng.choice(self.outputs), 200, latency
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8000, show_default=True, help="0 picks a free port.")
+@click.option(
+    "--latency", default="const:0.05", show_default=True, help="Time to first token."
+)
+@click.option(
+    "--token-rate", default=2000.0, show_default=True, help="Tokens/s per request."
+)
+@click.option("--error-rate", default=0.0, show_default=True)
+@click.option("--loop-rate", default=0.0, show_default=True)
+@click.option("--seed", default=0, show_default=True)
+def main(host, port, latency, token_rate, error_rate, loop_rate, seed):
+    server = FakeVLLMServer(
+        (host, port),
+        latency=latency,
+        token_rate=token_rate,
+        error_rate=error_rate,
+        loop_rate=loop_rate,
+        seed=seed,
+    )
+    # The first line tells a parent process where to connect
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,30 @@
-from chandra.parser import ChandraOCRClient as ChandraOCRClient
+import importlib
+from typing import TYPE_CHECKING
 
 __version__ = "0.1.0"
+
+# Public names and the modules that define them. They are imported on first access, so
+# `import chandra` does not load openai, pypdfium2 or PIL until a client is needed.
+_LAZY_IMPORTS = {
+    "ChandraOCRClient": "chandra.parser",
+    "AsyncChandraOCRClient": "chandra.parser",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+if TYPE_CHECKING:
+    from chandra.parser import AsyncChandraOCRClient as AsyncChandraOCRClient
+    from chandra.parser import ChandraOCRClient as ChandraOCRClient
+
+
+def __getattr__(name):
+    module = _LAZY_IMPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_IMPORTS))
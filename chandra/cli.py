@@ -0,0 +1,481 @@
+"""
+`chandra-client`: OCR many files from the command line.
+
+    chandra-client docs/ "scans/**/*.png" -e http://gpu-a:8000 -e http://gpu-b:8000=2 -o out.jsonl
+    chandra-client report.pdf --format dir -o results/
+    chandra-client docs/ --dry-run
+"""
+
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import click
+
+from chandra.input import iter_file
+from chandra.model.cache import ResultCache
+from chandra.model.limiter import AdaptiveLimiter
+from chandra.model.metrics import PageMetrics
+from chandra.model.payload import PAYLOAD_FORMATS, PayloadConfig
+from chandra.model.prefilter import PageFilter
+from chandra.model.regions import RegionSplitter
+from chandra.model.schema import BatchInputItem
+from chandra.model.vllm import build_content
+from chandra.parser import PROMPT_MODE_MAP, ChandraOCRClient, DocumentResultDict
+from chandra.text_layer import TextLayerConfig
+
+SUPPORTED_EXTENSIONS = (
+    ".pdf",
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".webp",
+    ".tif",
+    ".tiff",
+    ".bmp",
+    ".gif",
+)
+
+
+def expand_inputs(inputs: Iterable[str]) -> List[str]:
+    """Files, directories (searched recursively for supported files) and glob patterns."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = [
+                str(path)
+                for path in sorted(Path(item).rglob("*"))
+                if path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS
+            ]
+        elif os.path.isfile(item):
+            matches = [item]
+        else:
+            matches = sorted(
+                p for p in glob.glob(item, recursive=True) if os.path.isfile(p)
+            )
+        if not matches:
+            click.echo(f"Warning: no files found for {item}", err=True)
+        paths.extend(matches)
+    # Keep the first occurrence of files named more than once
+    return list(dict.fromkeys(paths))
+
+
+def parse_endpoint(endpoint: str) -> str | Tuple[str, float]:
+    """`URL` or `URL=WEIGHT`."""
+    url, sep, weight = endpoint.rpartition("=")
+    if sep:
+        try:
+            return url, float(weight)
+        except ValueError:
+            pass
+    return endpoint
+
+
+def output_dirs(paths: List[str], root: str) -> Dict[str, str]:
+    """One output directory per input, named after its stem; repeated stems get a suffix."""
+    dirs = {}
+    used = set()
+    for path in paths:
+        stem = Path(path).stem
+        name, n = stem, 1
+        while name in used:
+            n += 1
+            name = f"{stem}_{n}"
+        used.add(name)
+        dirs[path] = os.path.join(root, name)
+    return dirs
+
+
+def write_document_dir(document: DocumentResultDict, out_dir: str):
+    """`<name>.md`, `<name>.json` (without image data) and the extracted images."""
+    os.makedirs(out_dir, exist_ok=True)
+    name = os.path.basename(out_dir)
+    pages = []
+    for page in document["pages"]:
+        images = page.get("images", {})
+        for image_name, image in images.items():
+            image.save(os.path.join(out_dir, image_name))
+        page = {key: value for key, value in page.items() if key != "images"}
+        pages.append({**page, "images": list(images)})
+
+    markdown = "\n\n".join(page["md_content"] for page in document["pages"])
+    with open(os.path.join(out_dir, f"{name}.md"), "w", encoding="utf-8") as f:
+        f.write(markdown)
+    with open(os.path.join(out_dir, f"{name}.json"), "w", encoding="utf-8") as f:
+        json.dump({**document, "pages": pages}, f, ensure_ascii=False, indent=2)
+
+
+class Progress:
+    """Running totals, redrawn as one status line on stderr."""
+
+    def __init__(self, total_docs: int, enabled: bool = True, interval: float = 0.5):
+        self.total_docs = total_docs
+        self.enabled = enabled
+        self.interval = interval
+        self.docs = 0
+        self.failed_docs = 0
+        self.pages = 0
+        self.tokens = 0
+        self.retries = 0
+        self.blank = 0
+        self.text_layer = 0
+        self.split = 0
+        self.cached = 0
+        self.bytes = 0
+        self.in_flight = 0
+        self.start = time.perf_counter()
+        self._last_draw = 0.0
+        self._lock = threading.Lock()
+
+    def add_document(self, document: DocumentResultDict):
+        with self._lock:
+            self.docs += 1
+            self.failed_docs += document["error"] is not None
+
+    def add_page(self, metrics: PageMetrics):
+        # Metrics hook, called as each page finishes
+        with self._lock:
+            self.pages += 1
+            self.tokens += metrics.completion_tokens
+            self.retries += metrics.retries
+            self.blank += metrics.blank
+            self.text_layer += metrics.text_layer
+            self.split += metrics.regions > 0
+            self.cached += metrics.cached
+
+    def add_pages(self, pages: int, num_bytes: int):
+        with self._lock:
+            self.pages += pages
+            self.bytes += num_bytes
+
+    def line(self) -> str:
+        with self._lock:
+            elapsed = max(time.perf_counter() - self.start, 1e-9)
+            parts = [
+                f"docs {self.docs}/{self.total_docs}",
+                f"pages {self.pages}",
+                f"{self.pages / elapsed:.2f} pages/s",
+            ]
+            if self.bytes:
+                parts.append(f"{self.bytes / elapsed / 1024**2:.1f} MB/s encoded")
+            else:
+                parts += [
+                    f"{self.tokens / elapsed:.0f} tok/s",
+                    f"retries {self.retries / max(self.pages, 1):.1%}",
+                    f"in flight {self.in_flight}",
+                ]
+            if self.blank or self.cached:
+                parts.append(f"blank {self.blank} | cached {self.cached}")
+            if self.text_layer:
+                parts.append(f"text layer {self.text_layer}")
+            if self.split:
+                parts.append(f"split {self.split}")
+            if self.failed_docs:
+                parts.append(f"failed {self.failed_docs}")
+            parts.append(f"{elapsed:.0f}s")
+        return " | ".join(parts)
+
+    def draw(self, force: bool = False):
+        now = time.perf_counter()
+        if not self.enabled or (not force and now - self._last_draw < self.interval):
+            return
+        self._last_draw = now
+        click.echo(f"\r\033[K{self.line()}", err=True, nl=False)
+
+    def finish(self):
+        if self.enabled:
+            self.draw(force=True)
+            click.echo(err=True)
+        else:
+            click.echo(self.line(), err=True)
+
+
+def _ticker(progress: Progress, client: ChandraOCRClient, stop: threading.Event):
+    # Keeps the in-flight count and rates moving while a long document is in progress
+    while not stop.wait(progress.interval):
+        progress.in_flight = client.pages_in_flight
+        progress.draw()
+
+
+def run_dry(
+    paths: List[str],
+    config: dict,
+    prompt_type: str,
+    payload_config: PayloadConfig,
+    workers: int,
+    progress: Progress,
+):
+    """Render and encode every page as a real run would, without sending anything."""
+
+    def encode(image) -> int:
+        item = BatchInputItem(image=image, prompt_type=prompt_type)
+        _, payload = build_content(item, payload_config)
+        return payload.num_bytes
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path in paths:
+            pending = deque()
+            try:
+                for image in iter_file(path, config):
+                    pending.append(executor.submit(encode, image))
+                    # Bound the number of rendered pages waiting to be encoded
+                    while len(pending) > 2 * workers:
+                        progress.add_pages(1, pending.popleft().result())
+                        progress.draw()
+                while pending:
+                    progress.add_pages(1, pending.popleft().result())
+                    progress.draw()
+                progress.docs += 1
+            except Exception as e:
+                click.echo(f"\nError loading {path}: {e}", err=True)
+                progress.docs += 1
+                progress.failed_docs += 1
+
+
+@click.command()
+@click.argument("inputs", nargs=-1, required=True)
+@click.option(
+    "-e",
+    "--endpoint",
+    "endpoints",
+    multiple=True,
+    default=["http://localhost:8000"],
+    show_default=True,
+    help="vLLM server URL, optionally URL=WEIGHT; repeat for several replicas.",
+)
+@click.option("--api-key", default="EMPTY", show_default=True)
+@click.option("--model", "model_name", default="chandra", show_default=True)
+@click.option(
+    "-c", "--concurrency", default=8, show_default=True, help="Requests in flight."
+)
+@click.option(
+    "--max-concurrency",
+    type=int,
+    default=None,
+    help="Adapt requests in flight (AIMD) from --concurrency up to this limit.",
+)
+@click.option("--dpi", "image_dpi", default=200, show_default=True)
+@click.option("--min-image-dim", default=1024, show_default=True)
+@click.option(
+    "--page-range",
+    default=None,
+    help='PDF pages to process, e.g. "0-9" or "1,3,5-10".',
+)
+@click.option(
+    "--render-workers",
+    default=1,
+    show_default=True,
+    help="Processes rendering PDF pages.",
+)
+@click.option(
+    "--postprocess-workers",
+    default=0,
+    show_default=True,
+    help="Processes parsing HTML output.",
+)
+@click.option(
+    "--window-size",
+    type=int,
+    default=None,
+    help="Pages in flight across all documents (default: twice the concurrency).",
+)
+@click.option(
+    "--prompt-mode",
+    type=click.Choice(list(PROMPT_MODE_MAP)),
+    default="layout",
+    show_default=True,
+)
+@click.option("--include-headers-footers", is_flag=True)
+@click.option("--max-tokens", default=8192, show_default=True)
+@click.option("--max-retries", default=6, show_default=True)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Stream completions and abort repetition loops early.",
+)
+@click.option(
+    "--text-layer",
+    is_flag=True,
+    help="Use the embedded text of born-digital PDF pages instead of OCR when it is good enough.",
+)
+@click.option(
+    "--prefilter",
+    is_flag=True,
+    help="Skip near-blank pages and send duplicate pages only once.",
+)
+@click.option(
+    "--split-regions",
+    is_flag=True,
+    help="Send dense or oversized pages as parallel requests for bands and columns.",
+)
+@click.option(
+    "--cache",
+    "cache_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="SQLite result cache.",
+)
+@click.option(
+    "--payload-format",
+    type=click.Choice(list(PAYLOAD_FORMATS)),
+    default="png",
+    show_default=True,
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["jsonl", "dir"]),
+    default="jsonl",
+    show_default=True,
+    help="JSON document per line, or a directory per document (markdown, JSON, images).",
+)
+@click.option(
+    "-o",
+    "--output",
+    default="-",
+    show_default=True,
+    help="JSONL file (- for stdout) or output directory.",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Only render and encode pages, to measure client-side throughput.",
+)
+@click.option("-q", "--quiet", is_flag=True, help="No live progress line.")
+@click.option("-v", "--verbose", is_flag=True, help="Log retries and other details.")
+def main(
+    inputs,
+    endpoints,
+    api_key,
+    model_name,
+    concurrency,
+    max_concurrency,
+    image_dpi,
+    min_image_dim,
+    page_range,
+    render_workers,
+    postprocess_workers,
+    window_size,
+    prompt_mode,
+    include_headers_footers,
+    max_tokens,
+    max_retries,
+    stream,
+    text_layer,
+    prefilter,
+    split_regions,
+    cache_path,
+    payload_format,
+    output_format,
+    output,
+    dry_run,
+    quiet,
+    verbose,
+):
+    """OCR PDFs and images (files, directories or glob patterns) with a Chandra vLLM server."""
+    logging.basicConfig(
+        level=logging.INFO if verbose else logging.WARNING,
+        format="%(levelname)s %(name)s: %(message)s",
+    )
+    paths = expand_inputs(inputs)
+    if not paths:
+        raise click.UsageError("No input files found.")
+    if output_format == "dir" and output == "-":
+        raise click.UsageError("--format dir needs an output directory (-o).")
+
+    payload_config = PayloadConfig(format=payload_format)
+    # Redraw in place only on a terminal; otherwise print one summary at the end
+    progress = Progress(len(paths), enabled=not quiet and sys.stderr.isatty())
+
+    if dry_run:
+        config = {
+            "page_range": page_range,
+            "image_dpi": image_dpi,
+            "min_image_dim": min_image_dim,
+            "render_workers": render_workers,
+        }
+        prompt_type = PROMPT_MODE_MAP[prompt_mode]
+        run_dry(paths, config, prompt_type, payload_config, concurrency, progress)
+        progress.finish()
+        sys.exit(1 if progress.failed_docs else 0)
+
+    base_url = [parse_endpoint(e) for e in endpoints]
+    if len(base_url) == 1 and isinstance(base_url[0], str):
+        base_url = base_url[0]
+    limiter = None
+    if max_concurrency:
+        limiter = AdaptiveLimiter(initial_limit=concurrency, max_limit=max_concurrency)
+    cache = ResultCache(cache_path) if cache_path else None
+    client = ChandraOCRClient(
+        base_url=base_url,
+        api_key=api_key,
+        model_name=model_name,
+        max_tokens=max_tokens,
+        num_threads=concurrency,
+        max_retries=max_retries,
+        include_headers_footers=include_headers_footers,
+        image_dpi=image_dpi,
+        min_image_dim=min_image_dim,
+        render_workers=render_workers,
+        payload_config=payload_config,
+        cache=cache,
+        stream=stream,
+        postprocess_workers=postprocess_workers,
+        limiter=limiter,
+        metrics_hooks=[progress.add_page],
+        page_filter=PageFilter() if prefilter else None,
+        text_layer=TextLayerConfig() if text_layer else None,
+        region_splitter=RegionSplitter() if split_regions else None,
+    )
+
+    dirs = output_dirs(paths, output) if output_format == "dir" else {}
+    jsonl = None
+    if output_format == "jsonl":
+        jsonl = sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+
+    stop = threading.Event()
+    ticker = threading.Thread(
+        target=_ticker, args=(progress, client, stop), daemon=True
+    )
+    ticker.start()
+    try:
+        documents = client.parse_many(
+            paths,
+            prompt_mode=prompt_mode,
+            page_range=page_range,
+            window_size=window_size,
+            extract_images=output_format == "dir",
+        )
+        for document in documents:
+            if jsonl is not None:
+                jsonl.write(json.dumps(document, ensure_ascii=False) + "\n")
+                jsonl.flush()
+            else:
+                write_document_dir(document, dirs[document["path"]])
+            progress.add_document(document)
+            progress.in_flight = client.pages_in_flight
+            progress.draw()
+    finally:
+        stop.set()
+        ticker.join()
+        client.close()
+        if cache is not None:
+            cache.close()
+        if jsonl is not None and jsonl is not sys.stdout:
+            jsonl.close()
+
+    progress.in_flight = 0
+    progress.finish()
+    sys.exit(1 if progress.failed_docs else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,436 @@
-from typing import List
+import ctypes
+import io
+import logging
+import math
+import mmap
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from multiprocessing.shared_memory import SharedMemory
+from typing import BinaryIO, Iterator, List, Tuple, Union
 import filetype
 from PIL import Image
 import pypdfium2 as pdfium
 import pypdfium2.raw as pdfium_c
 
+from chandra.model.util import MAX_IMAGE_SIZE, fit_size
 from chandra.settings import settings
+from chandra.text_layer import TEXT_LAYER_KEY, TextLayerConfig, attach_text_layer
+
+logger = logging.getLogger(__name__)
+
+# A document to load: a file path, its contents in memory, or a binary file object
+DocumentSource = Union[str, os.PathLike, bytes, bytearray, memoryview, mmap.mmap, BinaryIO]
+_BUFFER_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
+# filetype never looks further than this into a file
+_HEADER_SIZE = 8192
+
+
+def is_path(source: DocumentSource) -> bool:
+    return isinstance(source, (str, os.PathLike))
+
+
+def source_name(source: DocumentSource, index: int) -> str:
+    """Path of a document, or a placeholder naming its position for in-memory sources."""
+    if is_path(source):
+        return os.fspath(source)
+    name = getattr(source, "name", None)
+    return name if isinstance(name, str) else f"<document {index}>"
+
+
+def _readable_source(source: DocumentSource) -> DocumentSource:
+    # pdfium reads file objects at absolute offsets, so anything it cannot seek
+    # through from the start (sockets, object storage bodies) is read into memory once
+    if is_path(source) or isinstance(source, _BUFFER_TYPES):
+        return source
+    if source.seekable() and source.tell() == 0:
+        return source
+    return source.read()
+
+
+def sniff_type(source: DocumentSource) -> str | None:
+    """File extension guessed from the first bytes of the document, or None."""
+    if is_path(source):
+        with open(source, "rb") as f:
+            header = f.read(_HEADER_SIZE)
+    elif isinstance(source, _BUFFER_TYPES):
+        header = bytes(memoryview(source)[:_HEADER_SIZE])
+    else:
+        position = source.tell()
+        header = source.read(_HEADER_SIZE)
+        source.seek(position)
+    input_type = filetype.guess(header)
+    return input_type.extension if input_type else None
+
+
+def open_pdf(source: DocumentSource) -> pdfium.PdfDocument:
+    """
+    Open a PDF from a path, buffer or seekable file object.
+
+    Writable buffers (`bytearray`, writable `mmap` and views of them) and `bytes` are
+    read by pdfium in place, without a copy, and must not be resized or closed while
+    the document is open. Other read-only buffers, such as read-only mappings, are
+    read block by block as pdfium needs them.
+    """
+    if is_path(source):
+        return pdfium.PdfDocument(os.fspath(source))
+    if isinstance(source, (bytearray, memoryview, mmap.mmap)):
+        view = memoryview(source)
+        if not view.readonly:
+            return pdfium.PdfDocument((ctypes.c_char * view.nbytes).from_buffer(view))
+        if isinstance(view.obj, bytes) and view.nbytes == len(view.obj):
+            return pdfium.PdfDocument(view.obj)
+        return pdfium.PdfDocument(_BufferReader(view))
+    return pdfium.PdfDocument(source)
+
+
+class _BufferReader(io.RawIOBase):
+    """Seekable file interface over a read-only buffer, so pdfium reads it block by block."""
+
+    def __init__(self, view: memoryview):
+        self.view = view.cast("B")
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: len(self.view)}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        block = self.view[self.position : self.position + len(buffer)]
+        buffer[: len(block)] = block
+        self.position += len(block)
+        return len(block)
+
+
+def open_image(source: DocumentSource) -> Image.Image:
+    if isinstance(source, _BUFFER_TYPES):
+        source = io.BytesIO(source)
+    elif is_path(source):
+        source = os.fspath(source)
+    return Image.open(source)
 
 
 def flatten(page, flag=pdfium_c.FLAT_NORMALDISPLAY):
     rc = pdfium_c.FPDFPage_Flatten(page, flag)
     if rc == pdfium_c.FLATTEN_FAIL:
-        print(f"Failed to flatten annotations / form fields on page {page}.")
+        logger.warning("Failed to flatten annotations / form fields on page %s", page)
+    return rc
+
+
+def target_render_scale(
+    page_width: float,
+    page_height: float,
+    image_dpi: int,
+    min_image_dim: int,
+    max_size=MAX_IMAGE_SIZE,
+) -> float:
+    """
+    Scale at which rendering a page directly yields the image `scale_to_fit` would produce.
+
+    Pages are rendered at `max(image_dpi, min_image_dim-derived DPI)`, unless that exceeds the
+    model's pixel budget, in which case the scale is reduced so no second resample is needed.
+    """
+    scale = max(min_image_dim / min(page_width, page_height), image_dpi / 72)
+    width, height = math.ceil(page_width * scale), math.ceil(page_height * scale)
+    max_pixels = max_size[0] * max_size[1]
+    if width * height <= max_pixels:
+        return scale
+
+    target_width, target_height = fit_size(width, height, max_size)
+    scale = min(target_width / page_width, target_height / page_height)
+    # pdfium rounds the bitmap size up, so guard against float error pushing us over budget
+    while math.ceil(page_width * scale) * math.ceil(page_height * scale) > max_pixels:
+        scale *= 0.9999
+    return scale
+
+
+def render_page(
+    doc: pdfium.PdfDocument,
+    page: int,
+    image_dpi: int,
+    min_image_dim: int,
+    render_at_target: bool = True,
+) -> Image.Image:
+    """
+    Render one page to an RGB image.
+
+    With `render_at_target`, the page is rendered once at the final model input size, straight
+    into an RGB bitmap. Otherwise it is rendered at the configured DPI and left for
+    `scale_to_fit` to downsample.
+    """
+    page_obj = doc[page]
+    page_width, page_height = page_obj.get_width(), page_obj.get_height()
+    if render_at_target:
+        scale = target_render_scale(page_width, page_height, image_dpi, min_image_dim)
+    else:
+        scale_dpi = (min_image_dim / min(page_width, page_height)) * 72
+        scale = max(scale_dpi, image_dpi) / 72
+
+    if flatten(page_obj) == pdfium_c.FLATTEN_SUCCESS:
+        # Flattening invalidates the page handle
+        page_obj = doc[page]
+
+    if render_at_target:
+        return page_obj.render(scale=scale, rev_byteorder=True).to_pil()
+    return page_obj.render(scale=scale).to_pil().convert("RGB")
 
 
-def load_pdf_images(filepath: str, page_range: List[int], image_dpi: int = None, min_image_dim: int = None):
+# Each render worker process keeps the document it is rendering open; pdfium is not
+# thread-safe, so parallel rendering has to happen in separate processes.
+_worker_source = None
+_worker_doc = None
+_worker_shm = None
+
+
+def _worker_document(source: str | Tuple[str, int]) -> pdfium.PdfDocument:
+    """
+    The worker's open copy of `source`. A worker serving a batch of documents keeps the
+    last one open and switches when shards of the next document arrive.
+    """
+    global _worker_source, _worker_doc, _worker_shm
+    if source == _worker_source:
+        return _worker_doc
+    if _worker_doc is not None:
+        _worker_doc.close()
+        _worker_doc = None
+    if _worker_shm is not None:
+        _worker_shm.close()
+        _worker_shm = None
+    _worker_source = None
+
+    if isinstance(source, tuple):
+        # In-memory document shared by the parent: (block name, size)
+        name, size = source
+        _worker_shm = SharedMemory(name=name)
+        _worker_doc = pdfium.PdfDocument(
+            (ctypes.c_char * size).from_buffer(_worker_shm.buf)
+        )
+    else:
+        _worker_doc = pdfium.PdfDocument(source)
+    _worker_doc.init_forms()
+    _worker_source = source
+    return _worker_doc
+
+
+def _render_shard(
+    source: str | Tuple[str, int],
+    pages: List[int],
+    image_dpi: int,
+    min_image_dim: int,
+    render_at_target: bool,
+    text_layer: TextLayerConfig | None = None,
+) -> List[Tuple[str, Tuple[int, int], str | None]]:
+    """
+    Render a shard of pages into shared memory blocks, returning (block name, size,
+    text-layer HTML) per page.
+    """
+    doc = _worker_document(source)
+    rendered = []
+    for page in pages:
+        image = render_page(doc, page, image_dpi, min_image_dim, render_at_target)
+        if text_layer is not None:
+            attach_text_layer(doc, page, image, text_layer)
+        data = image.tobytes()
+        shm = SharedMemory(create=True, size=max(1, len(data)))
+        shm.buf[: len(data)] = data
+        rendered.append((shm.name, image.size, image.info.get(TEXT_LAYER_KEY)))
+        shm.close()
+    return rendered
+
+
+def render_executor(render_workers: int) -> ProcessPoolExecutor:
+    """
+    Process pool for `iter_pdf_images`, to share between documents so that each one does
+    not pay for starting worker processes.
+    """
+    return ProcessPoolExecutor(
+        max_workers=render_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def _read_shared_image(name: str, size: Tuple[int, int], layout: str | None) -> Image.Image:
+    shm = SharedMemory(name=name)
+    try:
+        image = Image.frombytes("RGB", size, shm.buf[: size[0] * size[1] * 3])
+    finally:
+        shm.close()
+        shm.unlink()
+    if layout is not None:
+        image.info[TEXT_LAYER_KEY] = layout
+    return image
+
+
+def _release_shared_images(rendered: List[Tuple[str, Tuple[int, int], str | None]]):
+    for name, *_ in rendered:
+        shm = SharedMemory(name=name)
+        shm.close()
+        shm.unlink()
+
+
+def _share_source(source: DocumentSource) -> Tuple[SharedMemory, int]:
+    """Copy an in-memory document into shared memory once, for all render workers."""
+    if isinstance(source, _BUFFER_TYPES):
+        data = memoryview(source).cast("B")
+    else:
+        source.seek(0)
+        data = memoryview(source.read())
+    shm = SharedMemory(create=True, size=max(1, data.nbytes))
+    shm.buf[: data.nbytes] = data
+    return shm, data.nbytes
+
+
+def _iter_pdf_images_parallel(
+    source: DocumentSource,
+    pages: List[int],
+    image_dpi: int,
+    min_image_dim: int,
+    render_workers: int,
+    render_at_target: bool,
+    text_layer: TextLayerConfig | None,
+    executor: ProcessPoolExecutor | None,
+) -> Iterator[Image.Image]:
+    # Small shards keep workers balanced and let the first pages arrive early
+    shard_size = max(1, min(8, math.ceil(len(pages) / (render_workers * 4))))
+    shards = iter([pages[i : i + shard_size] for i in range(0, len(pages), shard_size)])
+    pending = deque()
+
+    shared = None
+    if is_path(source):
+        worker_source = os.fspath(source)
+    else:
+        shared, size = _share_source(source)
+        worker_source = (shared.name, size)
+    try:
+        with (
+            nullcontext(executor)
+            if executor is not None
+            else render_executor(render_workers)
+        ) as executor:
+
+            def submit_next():
+                shard = next(shards, None)
+                if shard is not None:
+                    pending.append(
+                        executor.submit(
+                            _render_shard,
+                            worker_source,
+                            shard,
+                            image_dpi,
+                            min_image_dim,
+                            render_at_target,
+                            text_layer,
+                        )
+                    )
+
+            unread = []
+            try:
+                for _ in range(render_workers * 2):
+                    submit_next()
+
+                while pending:
+                    unread = deque(pending.popleft().result())
+                    submit_next()
+                    while unread:
+                        yield _read_shared_image(*unread.popleft())
+            finally:
+                # Free blocks that were rendered but never consumed
+                _release_shared_images(unread)
+                for future in pending:
+                    if not future.cancel() and future.exception() is None:
+                        _release_shared_images(future.result())
+    finally:
+        if shared is not None:
+            shared.close()
+            shared.unlink()
+
+
+def iter_pdf_images(
+    source: DocumentSource,
+    page_range: List[int],
+    image_dpi: int = None,
+    min_image_dim: int = None,
+    render_workers: int = 1,
+    render_at_target: bool = True,
+    text_layer: TextLayerConfig | None = None,
+    executor: ProcessPoolExecutor | None = None,
+) -> Iterator[Image.Image]:
+    """
+    Lazily render the selected pages of a PDF, one page per iteration.
+
+    See `render_page` for `render_at_target`. With `text_layer`, pages whose embedded text
+    meets its thresholds carry layout HTML built from that text in
+    `image.info["text_layer"]` (see `chandra.text_layer`), so they can skip OCR.
+
+    With `render_workers > 1`, pages are rendered by a process pool and handed back
+    through shared memory; images are still yielded in page order. An in-memory
+    `source` is copied into shared memory once and read there by every worker. The pool
+    is started for this document, unless a running one from `render_executor` is given
+    as `executor`.
+    """
     if image_dpi is None:
         image_dpi = settings.IMAGE_DPI
     if min_image_dim is None:
         min_image_dim = settings.MIN_IMAGE_DIM
-    
-    doc = pdfium.PdfDocument(filepath)
-    doc.init_forms()
-
-    images = []
-    for page in range(len(doc)):
-        if not page_range or page in page_range:
-            page_obj = doc[page]
-            min_page_dim = min(page_obj.get_width(), page_obj.get_height())
-            scale_dpi = (min_image_dim / min_page_dim) * 72
-            scale_dpi = max(scale_dpi, image_dpi)
-            page_obj = doc[page]
-            flatten(page_obj)
-            page_obj = doc[page]
-            pil_image = page_obj.render(scale=scale_dpi / 72).to_pil().convert("RGB")
-            images.append(pil_image)
-
-    doc.close()
-    return images
+
+    doc = open_pdf(source)
+    try:
+        pages = [page for page in range(len(doc)) if not page_range or page in page_range]
+        if render_workers > 1 and len(pages) > 1:
+            doc.close()
+            yield from _iter_pdf_images_parallel(
+                source,
+                pages,
+                image_dpi,
+                min_image_dim,
+                render_workers,
+                render_at_target,
+                text_layer,
+                executor,
+            )
+            return
+
+        doc.init_forms()
+        for page in pages:
+            image = render_page(doc, page, image_dpi, min_image_dim, render_at_target)
+            if text_layer is not None:
+                attach_text_layer(doc, page, image, text_layer)
+            yield image
+    finally:
+        doc.close()
+
+
+def load_pdf_images(
+    source: DocumentSource,
+    page_range: List[int],
+    image_dpi: int = None,
+    min_image_dim: int = None,
+    render_workers: int = 1,
+    render_at_target: bool = True,
+    text_layer: TextLayerConfig | None = None,
+):
+    return list(
+        iter_pdf_images(
+            source,
+            page_range,
+            image_dpi,
+            min_image_dim,
+            render_workers,
+            render_at_target,
+            text_layer,
+        )
+    )
 
 
 def parse_range_str(range_str: str) -> List[int]:
@@ -52,17 +446,39 @@ def parse_range_str(range_str: str) -> List[int]:
     return page_lst
 
 
-def load_file(filepath: str, config: dict):
+def iter_file(source: DocumentSource, config: dict) -> Iterator[Image.Image]:
+    """
+    Lazily yield the page images of a PDF or image.
+
+    `source` is a file path, the document's bytes (`bytes`, `bytearray`, `memoryview`,
+    `mmap`) or a binary file object; the type is detected from its first bytes.
+    """
     page_range = config.get("page_range")
     if page_range:
-        page_range = parse_range_str(page_range)
-    
+        page_range = set(parse_range_str(page_range))
+
     image_dpi = config.get("image_dpi")
     min_image_dim = config.get("min_image_dim")
+    render_workers = config.get("render_workers") or 1
+    render_at_target = config.get("render_at_target", True)
+    text_layer = config.get("text_layer")
+    render_pool = config.get("render_executor")
 
-    input_type = filetype.guess(filepath)
-    if input_type and input_type.extension == "pdf":
-        images = load_pdf_images(filepath, page_range, image_dpi, min_image_dim)
+    source = _readable_source(source)
+    if sniff_type(source) == "pdf":
+        yield from iter_pdf_images(
+            source,
+            page_range,
+            image_dpi,
+            min_image_dim,
+            render_workers,
+            render_at_target,
+            text_layer,
+            render_pool,
+        )
     else:
-        images = [Image.open(filepath).convert("RGB")]
-    return images
+        yield open_image(source).convert("RGB")
+
+
+def load_file(source: DocumentSource, config: dict):
+    return list(iter_file(source, config))
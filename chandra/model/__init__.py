@@ -1,8 +1,32 @@
-from typing import List
+import importlib
+from typing import TYPE_CHECKING, List
 
-from chandra.model.schema import BatchInputItem, BatchOutputItem
-from chandra.model.vllm import generate_vllm
-from chandra.output import parse_markdown, parse_html, parse_chunks, extract_images
+# Loaded on first access: the vLLM client pulls in openai, which dominates import time
+_LAZY_IMPORTS = {
+    "BatchInputItem": "chandra.model.schema",
+    "BatchOutputItem": "chandra.model.schema",
+    "GenerationResult": "chandra.model.schema",
+    "generate_vllm": "chandra.model.vllm",
+}
+
+if TYPE_CHECKING:
+    from chandra.model.schema import BatchInputItem as BatchInputItem
+    from chandra.model.schema import BatchOutputItem as BatchOutputItem
+    from chandra.model.schema import GenerationResult as GenerationResult
+    from chandra.model.vllm import generate_vllm as generate_vllm
+
+
+def __getattr__(name):
+    module = _LAZY_IMPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_IMPORTS))
 
 
 class InferenceManager:
@@ -18,8 +42,12 @@ class InferenceManager:
         self.model = None
 
     def generate(
-        self, batch: List[BatchInputItem], max_output_tokens=None, **kwargs
-    ) -> List[BatchOutputItem]:
+        self, batch: List["BatchInputItem"], max_output_tokens=None, **kwargs
+    ) -> List["BatchOutputItem"]:
+        from chandra.model.schema import BatchOutputItem
+        from chandra.model.vllm import generate_vllm
+        from chandra.output import extract_images, parse_page
+
         output_kwargs = {}
         if "include_headers_footers" in kwargs:
             output_kwargs["include_headers_footers"] = kwargs.pop(
@@ -30,11 +58,12 @@ class InferenceManager:
 
         output = []
         for result, input_item in zip(results, batch):
-            chunks = parse_chunks(result.raw, input_item.image)
+            page = parse_page(result.raw, input_item.image.size, **output_kwargs)
+            chunks = page.chunks
             output.append(
                 BatchOutputItem(
-                    markdown=parse_markdown(result.raw, **output_kwargs),
-                    html=parse_html(result.raw, **output_kwargs),
+                    markdown=page.markdown,
+                    html=page.html,
                     chunks=chunks,
                     raw=result.raw,
                     page_box=[0, 0, input_item.image.width, input_item.image.height],
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, replace
+from typing import Callable, Tuple
+
+from chandra.model.schema import GenerationResult
+
+
+@dataclass
+class CacheStats:
+    hits: int
+    misses: int
+    coalesced: int
+    evictions: int
+    entries: int
+    size_bytes: int
+
+
+def cache_key(content: list, model_name: str, **sampling_params) -> str:
+    """Hash of the encoded request content (image data URL + prompt), model and sampling params."""
+    digest = hashlib.sha256()
+    for part in content:
+        if part["type"] == "image_url":
+            digest.update(part["image_url"]["url"].encode())
+        else:
+            digest.update(part["text"].encode())
+        digest.update(b"\0")
+    digest.update(json.dumps([model_name, sampling_params], sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    On-disk (SQLite) cache of generation results with size-based LRU eviction.
+
+    Concurrent lookups of the same key while a request is in flight share that request
+    instead of sending their own.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 1024**3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, raw TEXT NOT NULL, token_count INTEGER NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)"
+        )
+        # Running totals, so a put does not have to scan the table
+        self._entries, self._size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        self._closed = False
+
+    def close(self):
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._conn.close()
+
+    def get(self, key: str) -> GenerationResult | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT raw, token_count FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+        return GenerationResult(raw=row[0], token_count=row[1], cached=True)
+
+    def put(self, key: str, result: GenerationResult):
+        size = len(key) + len(result.raw.encode("utf-8"))
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, raw, token_count, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, result.raw, result.token_count, size, time.time()),
+            )
+            if row is None:
+                self._entries += 1
+            else:
+                self._size -= row[0]
+            self._size += size
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            key, size = self._conn.execute(
+                "SELECT key, size FROM results ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            self.evictions += 1
+            self._entries -= 1
+            self._size -= size
+
+    def claim(self, key: str) -> Tuple[Future, bool]:
+        """
+        Register interest in computing `key`.
+
+        Returns the in-flight future for the key and whether the caller owns it. The owner must
+        finish it with `resolve`, `share` or `fail`; everyone else waits on the future, which
+        holds the shared result, or None when there is none and the waiter should claim the
+        key again.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def share(self, key: str, future: Future, result: GenerationResult | None):
+        """Finish an owned computation, handing `result` to the waiters without storing it."""
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_result(result)
+
+    def resolve(
+        self, key: str, future: Future, result: GenerationResult, cacheable: bool
+    ):
+        """
+        Finish an owned computation, storing the result if it is cacheable. Waiters only get
+        cacheable results; errors and degenerate outputs are recomputed by each of them.
+        """
+        try:
+            if cacheable:
+                self.put(key, result)
+        finally:
+            self.share(key, future, result if cacheable else None)
+
+    def fail(self, key: str, future: Future):
+        """Give up an owned computation that raised; waiters compute the key themselves."""
+        self.share(key, future, None)
+
+    def get_or_compute(
+        self, key: str, compute: Callable[[], Tuple[GenerationResult, bool]]
+    ) -> GenerationResult:
+        """
+        Return the cached result for `key`, or run `compute`, which returns the result and
+        whether it may be cached.
+        """
+        while True:
+            future, owner = self.claim(key)
+            if owner:
+                break
+            shared = future.result()
+            if shared is not None:
+                return replace(shared, cached=True)
+
+        cached = self.get(key)
+        if cached is not None:
+            self.share(key, future, cached)
+            return cached
+
+        try:
+            result, cacheable = compute()
+        except BaseException:
+            self.fail(key, future)
+            raise
+        self.resolve(key, future, result, cacheable)
+        return result
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self.hits,
+                misses=self.misses,
+                coalesced=self.coalesced,
+                evictions=self.evictions,
+                entries=self._entries,
+                size_bytes=self._size,
+            )
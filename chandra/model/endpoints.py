@@ -0,0 +1,309 @@
+import asyncio
+import socket
+import threading
+import time
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Sequence, Tuple
+
+from openai import AsyncOpenAI, OpenAI
+
+from chandra.model.retry import TRANSIENT, classify_error
+
+
+class RequestCancelled(Exception):
+    """Raised inside a request that was given up on purpose, e.g. the losing side of a hedge."""
+
+
+class RequestCancel(threading.Event):
+    """
+    Set to give up on a request from another thread. Setting it also shuts down the
+    connection of the response registered with `attach`, which unblocks the thread reading
+    it and tells the server to stop generating.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._response_lock = threading.Lock()
+        self._response = None
+
+    def attach(self, response) -> bool:
+        """Register the request's open HTTP response; False if it is already cancelled."""
+        with self._response_lock:
+            self._response = response
+        return not self.is_set()
+
+    def set(self):
+        super().set()
+        with self._response_lock:
+            response = self._response
+        if response is not None:
+            _abort(response)
+
+
+def _abort(response):
+    # Closing the response would wait for the reading thread; shutting the socket down
+    # interrupts it
+    network_stream = response.extensions.get("network_stream")
+    sock = (
+        network_stream.get_extra_info("socket") if network_stream is not None else None
+    )
+    if sock is None:
+        response.close()
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class LatencyWindow:
+    """Latencies (in seconds) of the most recent `size` requests."""
+
+    def __init__(self, size: int = 256):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def mean(self) -> float | None:
+        with self._lock:
+            if not self._samples:
+                return None
+            return sum(self._samples) / len(self._samples)
+
+    def percentile(self, q: float) -> float | None:
+        """Nearest-rank percentile, `q` in [0, 100]; None while the window is empty."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = min(len(samples) - 1, max(0, round(q / 100 * len(samples)) - 1))
+        return samples[rank]
+
+
+@dataclass
+class EndpointStats:
+    base_url: str
+    weight: float
+    healthy: bool
+    outstanding: int
+    requests: int
+    errors: int
+    consecutive_failures: int
+    mean_latency: float | None
+    p95_latency: float | None
+
+
+class Endpoint:
+    """One vLLM replica: its client plus routing and health state."""
+
+    def __init__(
+        self, base_url: str, client: OpenAI | AsyncOpenAI, weight: float = 1.0
+    ):
+        if weight <= 0:
+            raise ValueError(f"Endpoint weight must be positive, got {weight}")
+        self.base_url = base_url
+        self.client = client
+        self.weight = weight
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.latency = LatencyWindow()
+
+    def load(self) -> float:
+        return (self.outstanding + 1) / self.weight
+
+
+def normalize_base_url(base_url: str) -> str:
+    # Ensure base_url ends with /v1
+    if not base_url.rstrip("/").endswith("/v1"):
+        base_url = f"{base_url.rstrip('/')}/v1"
+    return base_url
+
+
+class EndpointPool:
+    """
+    Routes requests across several vLLM replicas.
+
+    Each request goes to the healthy replica with the fewest outstanding requests relative to
+    its weight. A replica is marked unhealthy after `failure_threshold` consecutive transient
+    failures and is skipped until a background `/v1/models` probe (every `probe_interval`
+    seconds) or a later request succeeds. If no replica is healthy, all of them are tried.
+    """
+
+    def __init__(
+        self,
+        endpoints: Sequence[str | Tuple[str, float]],
+        api_key: str = "EMPTY",
+        async_clients: bool = False,
+        failure_threshold: int = 3,
+        probe_interval: float | None = 10.0,
+        probe_timeout: float = 5.0,
+        clients: Sequence[OpenAI | AsyncOpenAI] | None = None,
+    ):
+        """`clients`, if given, are used for the endpoints in order instead of new ones."""
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        if clients is not None and len(clients) != len(endpoints):
+            raise ValueError("EndpointPool needs one client per endpoint")
+
+        client_cls = AsyncOpenAI if async_clients else OpenAI
+        self.api_key = api_key
+        self.async_clients = async_clients
+        self.failure_threshold = failure_threshold
+        self.probe_timeout = probe_timeout
+        self.endpoints: List[Endpoint] = []
+        for i, endpoint in enumerate(endpoints):
+            base_url, weight = (
+                (endpoint, 1.0) if isinstance(endpoint, str) else endpoint
+            )
+            base_url = normalize_base_url(base_url)
+            if clients is not None:
+                client = clients[i]
+            else:
+                # Failover happens here, across replicas, rather than inside the SDK
+                client = client_cls(api_key=api_key, base_url=base_url, max_retries=0)
+            self.endpoints.append(Endpoint(base_url, client, weight))
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._probe_thread = None
+        if probe_interval:
+            self._probe_thread = threading.Thread(
+                target=self._probe_loop, args=(probe_interval,), daemon=True
+            )
+            self._probe_thread.start()
+
+    @classmethod
+    def from_client(cls, client: OpenAI | AsyncOpenAI) -> "EndpointPool":
+        """Single-endpoint pool around an existing client, without background probing."""
+        return cls(
+            [str(getattr(client, "base_url", "")).rstrip("/")],
+            api_key=getattr(client, "api_key", "EMPTY"),
+            async_clients=isinstance(client, AsyncOpenAI),
+            probe_interval=None,
+            clients=[client],
+        )
+
+    def acquire(self, exclude: str | None = None) -> Endpoint:
+        """Pick the least-loaded endpoint, avoiding `exclude` (a base URL) when possible."""
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.healthy] or self.endpoints
+            others = [e for e in candidates if e.base_url != exclude]
+            endpoint = min(others or candidates, key=lambda e: (e.load(), e.requests))
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, latency: float, ok: bool | None):
+        """Record a finished request; `ok=None` (cancelled) only frees the slot."""
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok is None:
+                return
+            if ok:
+                endpoint.consecutive_failures = 0
+                endpoint.healthy = True
+            else:
+                endpoint.errors += 1
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= self.failure_threshold:
+                    endpoint.healthy = False
+        if ok:
+            endpoint.latency.add(latency)
+
+    @contextmanager
+    def route(
+        self,
+        exclude: str | None = None,
+        classify: Callable[[BaseException], str] = classify_error,
+    ) -> Iterator[Endpoint]:
+        """
+        Hold an endpoint for one request. Only an exception `classify` calls transient
+        (a connection error, timeout or 5xx) counts against the replica; a permanent error
+        such as a 400 for a bad request, or a cancellation, just frees the slot.
+        """
+        endpoint = self.acquire(exclude)
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield endpoint
+            ok = True
+        except (asyncio.CancelledError, RequestCancelled):
+            ok = None
+            raise
+        except Exception as e:
+            if classify(e) != TRANSIENT:
+                ok = None
+            raise
+        finally:
+            self.release(endpoint, time.perf_counter() - start, ok)
+
+    def probe(self, endpoint: Endpoint) -> bool:
+        request = urllib.request.Request(
+            f"{endpoint.base_url}/models",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+        )
+        try:
+            with urllib.request.urlopen(
+                request, timeout=self.probe_timeout
+            ) as response:
+                ok = response.status == 200
+        except OSError:
+            ok = False
+
+        with self._lock:
+            if ok:
+                endpoint.consecutive_failures = 0
+            endpoint.healthy = ok
+        return ok
+
+    def _probe_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            for endpoint in self.endpoints:
+                if self._stop.is_set():
+                    return
+                self.probe(endpoint)
+
+    def stats(self) -> List[EndpointStats]:
+        with self._lock:
+            return [
+                EndpointStats(
+                    base_url=e.base_url,
+                    weight=e.weight,
+                    healthy=e.healthy,
+                    outstanding=e.outstanding,
+                    requests=e.requests,
+                    errors=e.errors,
+                    consecutive_failures=e.consecutive_failures,
+                    mean_latency=e.latency.mean(),
+                    p95_latency=e.latency.percentile(95),
+                )
+                for e in self.endpoints
+            ]
+
+    def _stop_probing(self):
+        self._stop.set()
+        if self._probe_thread is not None:
+            self._probe_thread.join()
+            self._probe_thread = None
+
+    def close(self):
+        self._stop_probing()
+        for endpoint in self.endpoints:
+            endpoint.client.close()
+
+    async def aclose(self):
+        self._stop_probing()
+        for endpoint in self.endpoints:
+            await endpoint.client.close()
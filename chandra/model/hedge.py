@@ -0,0 +1,84 @@
+import threading
+from dataclasses import dataclass
+
+from chandra.model.endpoints import LatencyWindow
+
+
+@dataclass
+class HedgeStats:
+    requests: int
+    hedges: int
+    hedge_wins: int
+    hedge_rate: float
+    # Observed p99 latency, and the p99 of the first requests on their own. A cancelled
+    # first request counts with its age at cancellation, so the second figure is a lower
+    # bound.
+    p99_latency: float | None
+    p99_latency_unhedged: float | None
+
+
+class HedgePolicy:
+    """
+    Sends a second, identical request when the first has been outstanding longer than the
+    `percentile` of recently observed request latencies; the first answer wins and the other
+    request is cancelled. No hedges are sent until `min_samples` latencies have been seen,
+    and at most `max_hedge_ratio` of requests are hedged.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        max_hedge_ratio: float = 0.05,
+        min_samples: int = 20,
+        min_delay: float = 0.0,
+        window_size: int = 2048,
+    ):
+        self.percentile = percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+        self._latency = LatencyWindow(window_size)
+        self._unhedged_latency = LatencyWindow(window_size)
+        self._lock = threading.Lock()
+
+    def hedge_delay(self) -> float | None:
+        """How long to wait before hedging a new request; None while there is too little data."""
+        with self._lock:
+            self.requests += 1
+        if len(self._unhedged_latency) < max(1, self.min_samples):
+            return None
+        return max(self.min_delay, self._unhedged_latency.percentile(self.percentile))
+
+    def try_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.max_hedge_ratio * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def record(self, latency: float, hedge_won: bool = False):
+        """Latency of a (possibly hedged) request, from the first send to the winning answer."""
+        self._latency.add(latency)
+        if hedge_won:
+            with self._lock:
+                self.hedge_wins += 1
+
+    def record_first(self, latency: float):
+        """Latency of a first request, or its age when it was cancelled."""
+        self._unhedged_latency.add(latency)
+
+    def stats(self) -> HedgeStats:
+        with self._lock:
+            requests, hedges, hedge_wins = self.requests, self.hedges, self.hedge_wins
+        return HedgeStats(
+            requests=requests,
+            hedges=hedges,
+            hedge_wins=hedge_wins,
+            hedge_rate=hedges / requests if requests else 0.0,
+            p99_latency=self._latency.percentile(99),
+            p99_latency_unhedged=self._unhedged_latency.percentile(99),
+        )
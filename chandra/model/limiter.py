@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterator
+
+from openai import APITimeoutError
+
+# Status codes vLLM (or a proxy in front of it) returns when it is overloaded
+OVERLOAD_STATUS_CODES = (429, 503)
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """Timeouts and 429/503 responses: the server has more work than it can take."""
+    if isinstance(error, APITimeoutError):
+        return True
+    return getattr(error, "status_code", None) in OVERLOAD_STATUS_CODES
+
+
+@dataclass
+class LimiterStats:
+    limit: int
+    in_flight: int
+    increases: int
+    decreases: int
+    overloads: int
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on the number of in-flight requests.
+
+    Each success under full load raises the limit by `1 / limit` (about one per round trip).
+    An overload signal (timeout, 429/503) or a short-term latency average above
+    `latency_tolerance` times the long-term average (None to ignore latency) multiplies it by
+    `backoff`, at most once per long-term average latency so one burst of errors counts as one
+    signal. The limit stays within [`min_limit`, `max_limit`]. `clock` (seconds) times the
+    spacing between decreases.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        backoff: float = 0.5,
+        latency_tolerance: float | None = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError(
+                f"Invalid limits: min_limit={min_limit}, max_limit={max_limit}"
+            )
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.clock = clock
+        self.increases = 0
+        self.decreases = 0
+        self.overloads = 0
+
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._in_flight = 0
+        self._short_latency = None
+        self._long_latency = None
+        self._last_decrease = float("-inf")
+        self._cond = threading.Condition()
+        self._async_waiters = []
+
+    @property
+    def current_limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self._in_flight >= self.current_limit:
+                return False
+            self._in_flight += 1
+            return True
+
+    def acquire(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._in_flight < self.current_limit)
+            self._in_flight += 1
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        while not self.try_acquire():
+            waiter = loop.create_future()
+            with self._cond:
+                self._async_waiters.append((loop, waiter))
+            # A slot may have been freed between the failed attempt and registering
+            if self.try_acquire():
+                return
+            await waiter
+
+    def release(self, latency: float | None, overloaded: bool = False):
+        """Record the outcome of one request; `latency` is None when it failed."""
+        with self._cond:
+            was_saturated = self._in_flight >= self.current_limit
+            self._in_flight -= 1
+            now = self.clock()
+
+            congested = overloaded
+            if overloaded:
+                self.overloads += 1
+            elif latency is not None:
+                self._update_latency(latency)
+                congested = (
+                    self.latency_tolerance is not None
+                    and self._short_latency
+                    > self.latency_tolerance * self._long_latency
+                )
+
+            if congested:
+                if now - self._last_decrease >= (self._long_latency or 0.0):
+                    self._limit = max(self.min_limit, self._limit * self.backoff)
+                    self._last_decrease = now
+                    self.decreases += 1
+            elif latency is not None and was_saturated:
+                previous = self.current_limit
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+                self.increases += self.current_limit > previous
+
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+
+        for loop, waiter in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_wake, waiter)
+
+    def _update_latency(self, latency: float):
+        if self._long_latency is None:
+            self._short_latency = self._long_latency = latency
+            return
+        self._short_latency += 0.3 * (latency - self._short_latency)
+        self._long_latency += 0.02 * (latency - self._long_latency)
+
+    def _outcome(self, start: float, error: BaseException | None):
+        if error is None:
+            self.release(time.perf_counter() - start)
+        else:
+            self.release(None, overloaded=is_overload_error(error))
+
+    @contextmanager
+    def request(self) -> Iterator[None]:
+        """Hold a slot for one request; exceptions are classified as overload or not."""
+        self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self._outcome(start, e)
+            raise
+        self._outcome(start, None)
+
+    @asynccontextmanager
+    async def request_async(self) -> AsyncIterator[None]:
+        await self.acquire_async()
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self._outcome(start, e)
+            raise
+        self._outcome(start, None)
+
+    def stats(self) -> LimiterStats:
+        with self._cond:
+            return LimiterStats(
+                limit=self.current_limit,
+                in_flight=self._in_flight,
+                increases=self.increases,
+                decreases=self.decreases,
+                overloads=self.overloads,
+            )
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
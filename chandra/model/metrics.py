@@ -0,0 +1,131 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PageMetrics:
+    """Where the time and tokens went for one page. Durations are in seconds."""
+
+    # Producing the page image: PDF rendering, or loading an image file
+    render_time: float = 0.0
+    # Scaling the image to the model input size, then encoding the request payload
+    scale_time: float = 0.0
+    encode_time: float = 0.0
+    payload_bytes: int = 0
+    # Waiting for a worker and for adaptive limiter slots
+    queue_wait: float = 0.0
+    # Request latency as seen by the client, summed over attempts
+    server_time: float = 0.0
+    # HTML parsing into cells and markdown
+    postprocess_time: float = 0.0
+    # Token usage reported by the server, summed over attempts
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Streams closed early on a repetition loop, and the output tokens that saved (counted
+    # up to the max_output_tokens the request would otherwise have run to)
+    aborted: int = 0
+    tokens_saved: int = 0
+    retries: int = 0
+    # Failure kind (see chandra.model.retry) that led to each retry
+    retry_reasons: List[str] = field(default_factory=list)
+    # Served from the result cache, or shared with an identical page, without a request
+    cached: bool = False
+    # Skipped as near-blank by the page filter (see chandra.model.prefilter)
+    blank: bool = False
+    # Built from the PDF's text layer without a request (see chandra.text_layer)
+    text_layer: bool = False
+    # Region requests the page was split into (see chandra.model.regions); 0 when sent whole
+    regions: int = 0
+    error: bool = False
+
+    def stage_times(self) -> dict[str, float]:
+        return {
+            "render": self.render_time,
+            "scale": self.scale_time,
+            "encode": self.encode_time,
+            "queue": self.queue_wait,
+            "server": self.server_time,
+            "postprocess": self.postprocess_time,
+        }
+
+
+# Called with the metrics of each page once it is fully processed
+MetricsHook = Callable[[PageMetrics], None]
+
+
+def emit(hooks: List[MetricsHook], metrics: PageMetrics):
+    for hook in hooks:
+        try:
+            hook(metrics)
+        except Exception:
+            # Instrumentation must never fail a page
+            logger.exception("Metrics hook %r failed", hook)
+
+
+class PrometheusMetrics:
+    """
+    Metrics hook that exports page metrics as Prometheus counters and histograms.
+
+    Needs `prometheus_client` (`pip install "chandra-client[prometheus]"`). Metrics are
+    registered in `registry` (the default registry if None) under `namespace`:
+
+    - `<namespace>_pages_total{status="ok"|"error"|"cached"|"blank"|"text_layer"}`
+    - `<namespace>_retries_total{reason}`
+    - `<namespace>_tokens_total{kind="prompt"|"completion"}`
+    - `<namespace>_payload_bytes_total`
+    - `<namespace>_stage_seconds{stage}` histogram, one series per pipeline stage
+    """
+
+    def __init__(self, registry=None, namespace: str = "chandra", buckets=None):
+        try:
+            import prometheus_client
+        except ImportError as e:
+            raise ImportError(
+                'PrometheusMetrics needs prometheus_client: pip install "chandra-client[prometheus]"'
+            ) from e
+
+        kwargs = {"namespace": namespace}
+        if registry is not None:
+            kwargs["registry"] = registry
+        self.pages = prometheus_client.Counter(
+            "pages", "Pages processed", ["status"], **kwargs
+        )
+        self.retries = prometheus_client.Counter(
+            "retries", "Generation retries", ["reason"], **kwargs
+        )
+        self.tokens = prometheus_client.Counter(
+            "tokens", "Tokens reported by the server", ["kind"], **kwargs
+        )
+        self.payload_bytes = prometheus_client.Counter(
+            "payload_bytes", "Encoded image bytes sent", **kwargs
+        )
+        histogram_kwargs = dict(kwargs)
+        if buckets is not None:
+            histogram_kwargs["buckets"] = buckets
+        self.stage_seconds = prometheus_client.Histogram(
+            "stage_seconds",
+            "Time per page in each pipeline stage",
+            ["stage"],
+            **histogram_kwargs,
+        )
+
+    def __call__(self, metrics: PageMetrics):
+        if metrics.error:
+            status = "error"
+        elif metrics.blank:
+            status = "blank"
+        elif metrics.text_layer:
+            status = "text_layer"
+        else:
+            status = "cached" if metrics.cached else "ok"
+        self.pages.labels(status).inc()
+        for reason in metrics.retry_reasons:
+            self.retries.labels(reason).inc()
+        self.tokens.labels("prompt").inc(metrics.prompt_tokens)
+        self.tokens.labels("completion").inc(metrics.completion_tokens)
+        self.payload_bytes.inc(metrics.payload_bytes)
+        for stage, seconds in metrics.stage_times().items():
+            self.stage_seconds.labels(stage).observe(seconds)
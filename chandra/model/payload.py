@@ -0,0 +1,103 @@
+import base64
+import io
+import time
+from dataclasses import dataclass
+
+from PIL import Image, ImageChops
+
+PAYLOAD_FORMATS = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+
+
+@dataclass
+class PayloadConfig:
+    """How page images are encoded for the request body."""
+
+    format: str = "png"  # png, webp (lossless) or jpeg
+    png_compress_level: int = 6
+    jpeg_quality: int = 90
+    webp_method: int = 4
+    # Send effectively grayscale pages as L, and pages with few colors as a palette
+    reduce_colors: bool = False
+    # Max per-channel difference for a pixel to count as gray
+    grayscale_tolerance: int = 8
+
+
+@dataclass
+class ImagePayload:
+    data_url: str
+    mime_type: str
+    num_bytes: int
+    encode_time: float
+    mode: str
+    # Time spent scaling the page to the model input size before encoding
+    scale_time: float = 0.0
+
+
+def is_grayscale(image: Image.Image, tolerance: int = 8) -> bool:
+    if image.mode in ("L", "1"):
+        return True
+    sample = image.convert("RGB")
+    sample.thumbnail((256, 256))
+    r, g, b = sample.split()
+    max_diff = max(
+        ImageChops.difference(r, g).getextrema()[1],
+        ImageChops.difference(g, b).getextrema()[1],
+    )
+    return max_diff <= tolerance
+
+
+def reduce_image(image: Image.Image, config: PayloadConfig) -> Image.Image:
+    """Convert near-monochrome pages to L, and pages with <= 256 colors to a palette (PNG/WebP only)."""
+    if is_grayscale(image, config.grayscale_tolerance):
+        image = image.convert("L")
+
+    if (
+        config.format != "jpeg"
+        and image.mode != "L"
+        and image.getcolors(256) is not None
+    ):
+        image = image.convert("P", palette=Image.Palette.ADAPTIVE, colors=256)
+    return image
+
+
+def encode_image(
+    image: Image.Image, config: PayloadConfig | None = None
+) -> ImagePayload:
+    """Encode an image into a base64 data URL according to `config`."""
+    if config is None:
+        config = PayloadConfig()
+    if config.format not in PAYLOAD_FORMATS:
+        raise ValueError(
+            f"Unsupported payload format {config.format!r}, expected one of {list(PAYLOAD_FORMATS)}"
+        )
+
+    start = time.perf_counter()
+    if config.reduce_colors:
+        image = reduce_image(image, config)
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    buffered = io.BytesIO()
+    if config.format == "png":
+        image.save(buffered, format="PNG", compress_level=config.png_compress_level)
+    elif config.format == "webp":
+        image.save(buffered, format="WEBP", lossless=True, method=config.webp_method)
+    else:
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(buffered, format="JPEG", quality=config.jpeg_quality)
+
+    data = buffered.getvalue()
+    mime_type = PAYLOAD_FORMATS[config.format]
+    data_url = f"data:{mime_type};base64,{base64.b64encode(data).decode()}"
+    return ImagePayload(
+        data_url=data_url,
+        mime_type=mime_type,
+        num_bytes=len(data),
+        encode_time=time.perf_counter() - start,
+        mode=image.mode,
+    )
@@ -0,0 +1,295 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, wait
+from dataclasses import dataclass, replace
+from typing import Callable, List, Tuple
+
+from PIL import Image, ImageChops
+
+from chandra.model.metrics import PageMetrics
+from chandra.model.schema import BatchInputItem, GenerationResult
+
+# Prompt, aspect ratio, difference hash and (for exact matching) pixel digest of a page
+PageKey = Tuple[str, float, int, bytes | None]
+
+# Pages with more ink than this (as a fraction of the thumbnail) are never blank, which
+# keeps the mark search below cheap
+DENSE_INK_RATIO = 0.005
+
+
+@dataclass
+class PageFilterStats:
+    pages: int
+    # Near-blank pages answered with an empty result, without a request
+    blank: int
+    # Pages that reused the result of an earlier, identical (or near-identical) page
+    duplicates: int
+    # Distinct pages remembered for matching
+    entries: int
+
+
+class PageFilter:
+    """
+    Pre-filter between page rendering and generation that skips near-blank pages and sends
+    duplicate pages only once.
+
+    Pages are checked on a grayscale thumbnail of at most `thumbnail_size` pixels per
+    side, where ink is anything more than `ink_delta` levels away from the paper color.
+    Ink within `word_gap` of itself forms one mark (a word, a line, a figure), and a page
+    is blank when no mark looks like content: at least `min_mark_height` tall and
+    `min_word_ratio` times as wide as it is tall, or at least `min_figure_size` in both
+    directions. Sizes are fractions of the thumbnail's long side, and a word is judged by
+    its own height, so a single title or signature line in any font size is content while
+    specks, punch holes and a lone page number are not. Blank pages get an empty result
+    without a request.
+
+    Duplicates share one request, and every duplicate gets the result as its own page.
+    By default only pages with the same prompt and identical pixels match, such as a
+    page included twice. With `max_distance > 0`, pages with the same prompt and aspect
+    ratio also match when their difference hashes (`hash_size`² bits) differ in at most
+    `max_distance` bits, which catches re-encoded or rescaled copies. That is a risk:
+    pages from one template that differ in a single field, like an invoice total, a date
+    or a name, can be only a bit or two apart and would all get the first page's text.
+
+    The last `max_pages` distinct pages are remembered, also across calls, so share a
+    filter only between clients with the same model and sampling settings.
+    """
+
+    def __init__(
+        self,
+        skip_blank: bool = True,
+        dedup: bool = True,
+        thumbnail_size: int = 1024,
+        ink_delta: int = 32,
+        word_gap: float = 0.008,
+        min_mark_height: float = 0.004,
+        min_word_ratio: float = 2.5,
+        min_figure_size: float = 0.04,
+        hash_size: int = 64,
+        hash_tolerance: int = 8,
+        max_distance: int = 0,
+        max_pages: int = 4096,
+    ):
+        self.skip_blank = skip_blank
+        self.dedup = dedup
+        self.thumbnail_size = thumbnail_size
+        self.ink_delta = ink_delta
+        self.word_gap = word_gap
+        self.min_mark_height = min_mark_height
+        self.min_word_ratio = min_word_ratio
+        self.min_figure_size = min_figure_size
+        self.hash_size = hash_size
+        self.hash_tolerance = hash_tolerance
+        self.max_distance = max_distance
+        self.max_pages = max_pages
+        self.pages = 0
+        self.blank = 0
+        self.duplicates = 0
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[PageKey, Future] = OrderedDict()
+
+    def _thumbnail(self, image: Image.Image) -> Image.Image:
+        scale = min(1.0, self.thumbnail_size / max(image.size))
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return image.resize(size, Image.BOX).convert("L")
+
+    def is_blank(self, thumbnail: Image.Image) -> bool:
+        histogram = thumbnail.histogram()
+        paper = histogram.index(max(histogram))
+        low, high = max(0, paper - self.ink_delta), min(255, paper + self.ink_delta)
+        ink = sum(histogram) - sum(histogram[low : high + 1])
+        if ink == 0:
+            return True
+        if ink > DENSE_INK_RATIO * thumbnail.width * thumbnail.height:
+            return False
+
+        mask = thumbnail.point([0 if low <= v <= high else 255 for v in range(256)])
+        long_side = max(thumbnail.size)
+        min_height = self.min_mark_height * long_side
+        min_figure = self.min_figure_size * long_side
+        for x0, y0, x1, y1 in _marks(mask, max(1, round(self.word_gap * long_side))):
+            width, height = x1 - x0, y1 - y0
+            if height >= min_height and width >= self.min_word_ratio * height:
+                return False
+            if min(width, height) >= min_figure:
+                return False
+        return True
+
+    def difference_hash(self, thumbnail: Image.Image) -> int:
+        """One bit per pixel pair: whether the left pixel is brighter by more than `hash_tolerance`."""
+        small = thumbnail.resize((self.hash_size + 1, self.hash_size), Image.BOX)
+        left = small.crop((0, 0, self.hash_size, self.hash_size))
+        right = small.crop((1, 0, self.hash_size + 1, self.hash_size))
+        # Small differences in flat areas are scanner noise and compression artifacts
+        brighter = ImageChops.subtract(left, right, offset=-self.hash_tolerance)
+        bits = brighter.point(lambda v: 255 if v else 0).convert("1")
+        return int.from_bytes(bits.tobytes(), "big")
+
+    def analyze(self, item: BatchInputItem) -> Tuple[bool, PageKey | None]:
+        """Whether the page is blank, and its key for duplicate matching (None without `dedup`)."""
+        thumbnail = self._thumbnail(item.image)
+        blank = self.skip_blank and self.is_blank(thumbnail)
+        with self._lock:
+            self.pages += 1
+            self.blank += blank
+        if blank or not self.dedup:
+            return blank, None
+        prompt = item.prompt or item.prompt_type or ""
+        aspect = round(item.image.width / item.image.height, 3)
+        digest = None
+        if self.max_distance <= 0:
+            digest = hashlib.blake2b(
+                f"{item.image.mode} {item.image.size}".encode() + item.image.tobytes(),
+                digest_size=16,
+            ).digest()
+        return False, (prompt, aspect, self.difference_hash(thumbnail), digest)
+
+    def _match(self, key: PageKey) -> Future | None:
+        future = self._entries.get(key)
+        if future is not None or self.max_distance <= 0:
+            return future
+        prompt, aspect, bits, _ = key
+        for (
+            other_prompt,
+            other_aspect,
+            other_bits,
+            _,
+        ), future in self._entries.items():
+            if (
+                other_prompt == prompt
+                and abs(other_aspect - aspect) <= 0.01 * aspect
+                and (other_bits ^ bits).bit_count() <= self.max_distance
+            ):
+                return future
+        return None
+
+    def claim(self, key: PageKey) -> Tuple[Future, bool]:
+        """
+        Find the page matching `key`, or register this page as a new distinct one.
+
+        Returns the matching page's future and whether the caller owns it. The owner must
+        finish it with `resolve` or `fail`; duplicates wait on it and then call `share`.
+        """
+        with self._lock:
+            future = self._match(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._entries[key] = future
+            while len(self._entries) > self.max_pages:
+                self._entries.popitem(last=False)
+            return future, True
+
+    def resolve(self, key: PageKey, future: Future, result: GenerationResult):
+        if result.error:
+            # Later duplicates get a request of their own
+            with self._lock:
+                self._entries.pop(key, None)
+        future.set_result(result)
+
+    def fail(self, key: PageKey, future: Future, exc: BaseException):
+        with self._lock:
+            self._entries.pop(key, None)
+        future.set_exception(exc)
+
+    def share(self, future: Future) -> GenerationResult | None:
+        """A duplicate's copy of the finished original's result; None if the original failed."""
+        if future.exception() is not None or future.result().error:
+            return None
+        with self._lock:
+            self.duplicates += 1
+        return replace(future.result(), cached=True, retries=0, tokens_saved=0)
+
+    def get_or_compute(
+        self, item: BatchInputItem, compute: Callable[[], GenerationResult]
+    ) -> GenerationResult:
+        blank, key = self.analyze(item)
+        if blank:
+            return blank_result()
+        if key is None:
+            return compute()
+
+        future, owner = self.claim(key)
+        if not owner:
+            wait([future])
+            shared = self.share(future)
+            return shared if shared is not None else compute()
+
+        try:
+            result = compute()
+        except BaseException as e:
+            self.fail(key, future, e)
+            raise
+        self.resolve(key, future, result)
+        return result
+
+    def stats(self) -> PageFilterStats:
+        with self._lock:
+            return PageFilterStats(
+                pages=self.pages,
+                blank=self.blank,
+                duplicates=self.duplicates,
+                entries=len(self._entries),
+            )
+
+
+def _marks(mask: Image.Image, gap: int) -> List[Tuple[int, int, int, int]]:
+    """
+    Bounding boxes of the ink in `mask` (255 = ink), grouping ink that is at most `gap`
+    pixels apart. Works on runs of ink per row, which are few on a sparse page.
+    """
+    width, height = mask.size
+    data = mask.tobytes()
+    parent: List[int] = []
+    boxes: List[List[int]] = []
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # Runs of the last `gap` rows with ink: (row, [(start, end, run id)])
+    recent = deque()
+    for y in range(height):
+        row = data[y * width : (y + 1) * width]
+        while recent and y - recent[0][0] > gap:
+            recent.popleft()
+        if b"\xff" not in row:
+            continue
+        runs = []
+        for match in re.finditer(rb"\xff+", row):
+            if runs and match.start() - runs[-1][1] <= gap:
+                runs[-1][1] = match.end()
+            else:
+                runs.append([match.start(), match.end()])
+
+        row_runs = []
+        for x0, x1 in runs:
+            run = len(parent)
+            parent.append(run)
+            boxes.append([x0, y, x1, y + 1])
+            for _, previous in recent:
+                for px0, px1, other in previous:
+                    if px0 - gap <= x1 and x0 <= px1 + gap:
+                        parent[find(other)] = find(run)
+            row_runs.append((x0, x1, run))
+        recent.append((y, row_runs))
+
+    marks = {}
+    for run, box in enumerate(boxes):
+        root = find(run)
+        mark = marks.get(root)
+        if mark is None:
+            marks[root] = list(box)
+        else:
+            mark[0], mark[1] = min(mark[0], box[0]), min(mark[1], box[1])
+            mark[2], mark[3] = max(mark[2], box[2]), max(mark[3], box[3])
+    return [tuple(mark) for mark in marks.values()]
+
+
+def blank_result() -> GenerationResult:
+    return GenerationResult(raw="", token_count=0, metrics=PageMetrics(blank=True))
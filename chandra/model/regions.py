@@ -0,0 +1,338 @@
+"""
+Region splitting: dense or oversized pages are cut at whitespace into overlapping bands and
+columns, each region is sent as its own request, and the regions' layout blocks are
+stitched back into the layout HTML of the whole page.
+"""
+
+import json
+import logging
+import math
+import re
+from typing import List, Tuple
+
+from bs4 import BeautifulSoup
+from PIL import Image, ImageStat
+
+from chandra.model.schema import BatchInputItem
+from chandra.model.util import MAX_IMAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# (left, top, right, bottom) in pixels of the page image
+Box = Tuple[int, int, int, int]
+
+# Only layout output carries the bboxes needed to put regions back together
+SPLIT_PROMPT_TYPES = ("ocr_layout",)
+
+
+def _runs(mask: int, length: int) -> int:
+    """Bits of `mask` that start a run of at least `length` set bits (towards higher bits)."""
+    covered = 1
+    while covered < length:
+        step = min(covered, length - covered)
+        mask &= mask >> step
+        covered += step
+    return mask
+
+
+def _gaps(profile: List[float], min_length: int) -> List[Tuple[int, int]]:
+    """Runs of empty entries in an ink profile, as (start, end) with `end` exclusive."""
+    gaps = []
+    start = None
+    for index, value in enumerate(profile + [1.0]):
+        if value == 0 and start is None:
+            start = index
+        elif value != 0 and start is not None:
+            if index - start >= min_length:
+                gaps.append((start, index))
+            start = None
+    return gaps
+
+
+class RegionSplitter:
+    """
+    Cuts pages whose single request would be slow or blurry into regions that are sent as
+    parallel requests.
+
+    A page is split when its ink covers more than `ink_per_region` of a grayscale thumbnail
+    (at most `thumbnail_size` pixels per side), a cheap proxy for a long decode, or when it
+    has more pixels than one request's image budget. It gets one region per
+    `ink_per_region` of ink and per image budget, up to `max_regions`.
+
+    The thumbnail's text lines are grouped into column segments, runs of lines at least
+    `min_column_height` of the page tall that share vertical gutters at least `min_gutter`
+    of the page wide, and full-width bands in between. Each column becomes a region unless
+    one would be narrower than `min_column_width` of the page, which is more likely a
+    table than text. Regions with the most ink are then halved at the whitespace
+    row nearest their middle until there are enough. All cuts run through whitespace, and
+    regions are grown by `overlap` of the page on each side so nothing near a cut is lost.
+    """
+
+    def __init__(
+        self,
+        ink_per_region: float = 0.05,
+        max_regions: int = 6,
+        overlap: float = 0.01,
+        min_gutter: float = 0.015,
+        min_column_width: float = 0.2,
+        min_column_height: float = 0.15,
+        thumbnail_size: int = 1024,
+        ink_delta: int = 64,
+        duplicate_overlap: float = 0.6,
+    ):
+        self.ink_per_region = ink_per_region
+        self.max_regions = max_regions
+        self.overlap = overlap
+        self.min_gutter = min_gutter
+        self.min_column_width = min_column_width
+        self.min_column_height = min_column_height
+        self.thumbnail_size = thumbnail_size
+        self.ink_delta = ink_delta
+        # Blocks from different regions overlapping by this share of the smaller one are the same block
+        self.duplicate_overlap = duplicate_overlap
+
+    def _ink(self, image: Image.Image) -> Image.Image:
+        """Grayscale thumbnail that is 255 where the page has ink and 0 on paper."""
+        scale = min(1.0, self.thumbnail_size / max(image.size))
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        thumbnail = image.resize(size, Image.BOX).convert("L")
+        histogram = thumbnail.histogram()
+        paper = histogram.index(max(histogram))
+        threshold = paper - self.ink_delta
+        return thumbnail.point(lambda v: 255 if v < threshold else 0)
+
+    def regions_wanted(self, image: Image.Image, ink_ratio: float) -> int:
+        max_width, max_height = MAX_IMAGE_SIZE
+        oversize = math.ceil(image.width * image.height / (max_width * max_height))
+        dense = (
+            math.ceil(ink_ratio / self.ink_per_region) if self.ink_per_region > 0 else 1
+        )
+        return min(self.max_regions, max(oversize, dense))
+
+    @staticmethod
+    def _rows(ink: Image.Image, box: Box) -> List[float]:
+        # Averaged in floating point, so a single ink pixel in a row still counts
+        region = ink.crop(box).convert("F")
+        return list(region.resize((1, region.height), Image.BOX).getdata())
+
+    @staticmethod
+    def _empty_columns(ink: Image.Image, top: int, bottom: int) -> int:
+        """Bitmask of the thumbnail columns without ink between `top` and `bottom`."""
+        strip = ink.crop((0, top, ink.width, bottom)).convert("F")
+        columns = strip.resize((ink.width, 1), Image.BOX).getdata()
+        return int("".join("0" if v else "1" for v in reversed(list(columns))), 2)
+
+    def _layout(self, ink: Image.Image) -> List[Box]:
+        """Full-width bands and columns in reading order, in thumbnail pixels."""
+        width, height = ink.size
+        # Runs of rows with ink: text lines, or lines of both columns side by side
+        lines = _gaps(
+            [0.0 if v else 1.0 for v in self._rows(ink, (0, 0, width, height))], 1
+        )
+        if not lines:
+            return [(0, 0, width, height)]
+        left, _, right, _ = ink.getbbox()
+        # A gutter has ink on both sides, so it lies well inside the text block
+        margin = (right - left) // 10
+        inner = ((1 << (right - margin)) - 1) ^ ((1 << (left + margin)) - 1)
+        gutter = max(1, round(self.min_gutter * width))
+        masks = [self._empty_columns(ink, top, bottom) & inner for top, bottom in lines]
+
+        def shared(first: int) -> Tuple[int, int]:
+            """End of the run of lines from `first` that share a gutter, and their empty columns."""
+            common, end = masks[first], first + 1
+            while end < len(lines) and _runs(common & masks[end], gutter):
+                common &= masks[end]
+                end += 1
+            return end, common
+
+        # Column segments: maximal runs of lines that share gutters
+        segments = []
+        index = 0
+        while index < len(lines):
+            end, common = shared(index)
+            if index + 1 < len(lines):
+                # A full-width title sharing one of several gutters must not merge the columns
+                next_end, next_common = shared(index + 1)
+                if next_end >= end and len(
+                    self._gutters(next_common, gutter, width)
+                ) > len(self._gutters(common, gutter, width)):
+                    end, common = index + 1, 0
+            cuts = self._column_cuts(common, gutter, width)
+            if (
+                cuts
+                and lines[end - 1][1] - lines[index][0]
+                >= self.min_column_height * height
+            ):
+                segments.append((index, end, cuts))
+                index = end
+            else:
+                if segments and segments[-1][2] is None:
+                    segments[-1] = (segments[-1][0], index + 1, None)
+                else:
+                    segments.append((index, index + 1, None))
+                index += 1
+
+        boxes = []
+        for number, (first, end, cuts) in enumerate(segments):
+            # Segments meet halfway between their outer lines
+            top = 0 if number == 0 else (lines[first - 1][1] + lines[first][0]) // 2
+            bottom = (
+                height
+                if end == len(lines)
+                else (lines[end - 1][1] + lines[end][0]) // 2
+            )
+            if cuts is None:
+                boxes.append((0, top, width, bottom))
+                continue
+            edges = [0] + cuts + [width]
+            boxes.extend((x0, top, x1, bottom) for x0, x1 in zip(edges, edges[1:]))
+        return boxes
+
+    @staticmethod
+    def _gutters(empty: int, gutter: int, width: int) -> List[Tuple[int, int]]:
+        """Runs of at least `gutter` empty columns in an empty-column mask."""
+        bits = format(empty, f"0{width}b")[::-1]
+        return [match.span() for match in re.finditer(f"1{{{gutter},}}", bits)]
+
+    def _column_cuts(self, empty: int, gutter: int, width: int) -> List[int] | None:
+        """Middles of the gutters in an empty-column mask; None unless every column is wide enough."""
+        cuts = [
+            (start + end) // 2 for start, end in self._gutters(empty, gutter, width)
+        ]
+        edges = [0] + cuts + [width]
+        # Narrow columns are more likely table columns, which must stay together
+        if (
+            not cuts
+            or min(b - a for a, b in zip(edges, edges[1:]))
+            < self.min_column_width * width
+        ):
+            return None
+        return cuts
+
+    def _halve(self, ink: Image.Image, box: Box) -> List[Box] | None:
+        """Cut `box` at the whitespace row nearest the middle of its ink; None without one."""
+        left, top, right, bottom = box
+        rows = self._rows(ink, box)
+        total = sum(rows)
+        cumulative, middle = 0.0, None
+        for offset, value in enumerate(rows):
+            cumulative += value
+            if middle is None and cumulative >= total / 2:
+                middle = offset
+        gaps = [
+            (start + end) // 2
+            for start, end in _gaps(rows, 1)
+            # Leave some ink on both sides
+            if 0.1 * total <= sum(rows[:start]) <= 0.9 * total
+        ]
+        if not gaps:
+            return None
+        cut = top + min(gaps, key=lambda row: abs(row - middle))
+        return [(left, top, right, cut), (left, cut, right, bottom)]
+
+    def split(self, item: BatchInputItem) -> List[Box]:
+        """Regions to send for the page in reading order, or an empty list to send it whole."""
+        if item.prompt or item.prompt_type not in SPLIT_PROMPT_TYPES:
+            return []
+        image = item.image
+        ink = self._ink(image)
+        wanted = self.regions_wanted(image, ImageStat.Stat(ink).mean[0] / 255)
+        if wanted <= 1:
+            return []
+
+        boxes = self._layout(ink)
+        unsplittable = set()
+        while len(boxes) < wanted:
+            candidates = [box for box in boxes if box not in unsplittable]
+            if not candidates:
+                break
+            densest = max(
+                candidates, key=lambda box: ImageStat.Stat(ink.crop(box)).sum[0]
+            )
+            halves = self._halve(ink, densest)
+            if halves is None:
+                unsplittable.add(densest)
+                continue
+            index = boxes.index(densest)
+            boxes[index : index + 1] = halves
+        if len(boxes) <= 1 or len(boxes) > self.max_regions:
+            logger.debug("Sending page whole: layout gave %d regions", len(boxes))
+            return []
+
+        scale_x, scale_y = image.width / ink.width, image.height / ink.height
+        pad_x, pad_y = self.overlap * image.width, self.overlap * image.height
+        return [
+            (
+                max(0, math.floor(x0 * scale_x - pad_x)),
+                max(0, math.floor(y0 * scale_y - pad_y)),
+                min(image.width, math.ceil(x1 * scale_x + pad_x)),
+                min(image.height, math.ceil(y1 * scale_y + pad_y)),
+            )
+            for x0, y0, x1, y1 in boxes
+        ]
+
+    def stitch(
+        self, image_size: Tuple[int, int], boxes: List[Box], raws: List[str]
+    ) -> str:
+        """
+        Layout HTML of the whole page from each region's output: bboxes are mapped from the
+        region's 0-1024 space to the page's, and blocks repeated in an overlap are kept once.
+        """
+        width, height = image_size
+        blocks = []  # (region, page bbox, div)
+        for region, (box, raw) in enumerate(zip(boxes, raws)):
+            x0, y0, x1, y1 = box
+            soup = BeautifulSoup(raw, "html.parser")
+            for div in soup.find_all("div", recursive=False):
+                try:
+                    bbox = [float(v) for v in json.loads(div.get("data-bbox"))][:4]
+                except (TypeError, ValueError):
+                    bbox = [0.0, 0.0, 1024.0, 1024.0]
+                if len(bbox) < 4:
+                    bbox = [0.0, 0.0, 1024.0, 1024.0]
+                page_bbox = [
+                    max(
+                        0, math.floor((x0 + bbox[0] / 1024 * (x1 - x0)) / width * 1024)
+                    ),
+                    max(
+                        0, math.floor((y0 + bbox[1] / 1024 * (y1 - y0)) / height * 1024)
+                    ),
+                    min(
+                        1024,
+                        math.ceil((x0 + bbox[2] / 1024 * (x1 - x0)) / width * 1024),
+                    ),
+                    min(
+                        1024,
+                        math.ceil((y0 + bbox[3] / 1024 * (y1 - y0)) / height * 1024),
+                    ),
+                ]
+                div["data-bbox"] = json.dumps(page_bbox)
+                duplicate = self._duplicate(blocks, region, page_bbox)
+                if duplicate is None:
+                    blocks.append((region, page_bbox, div))
+                elif _area(page_bbox) > _area(blocks[duplicate][1]):
+                    # The larger copy is the one the cut did not clip
+                    blocks[duplicate] = (region, page_bbox, div)
+        return "".join(str(div) for _, _, div in blocks)
+
+    def _duplicate(self, blocks, region: int, bbox: List[int]) -> int | None:
+        for index, (other_region, other, _) in enumerate(blocks):
+            if other_region == region:
+                continue
+            overlap = _area(
+                [
+                    max(bbox[0], other[0]),
+                    max(bbox[1], other[1]),
+                    min(bbox[2], other[2]),
+                    min(bbox[3], other[3]),
+                ]
+            )
+            smaller = min(_area(bbox), _area(other))
+            if smaller and overlap >= self.duplicate_overlap * smaller:
+                return index
+        return None
+
+
+def _area(bbox: List[int]) -> int:
+    return max(0, bbox[2] - bbox[0]) * max(0, bbox[3] - bbox[1])
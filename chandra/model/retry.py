@@ -0,0 +1,102 @@
+import random
+import threading
+from dataclasses import dataclass
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+from chandra.model.schema import GenerationResult
+from chandra.model.util import find_repeat
+
+# Network errors, timeouts, 5xx, 408/409/429: back off, then retry
+TRANSIENT = "transient"
+# Other 4xx (e.g. an oversize image): retrying cannot help
+PERMANENT = "permanent"
+# The server answered but the output loops: resample right away
+DEGENERATE = "degenerate"
+
+RETRYABLE_STATUS_CODES = (408, 409, 429)
+
+
+def classify_error(error: BaseException) -> str:
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return TRANSIENT
+    if isinstance(error, APIStatusError):
+        status = error.status_code
+        if 400 <= status < 500 and status not in RETRYABLE_STATUS_CODES:
+            return PERMANENT
+    return TRANSIENT
+
+
+@dataclass
+class RetryStats:
+    first_attempts: int
+    retries: int
+    denied: int
+
+
+class RetryBudget:
+    """
+    Batch-wide cap on transient retries: at most `min_retries` plus `ratio` times the number
+    of first attempts, so a struggling server sees a bounded amount of extra load.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.first_attempts = 0
+        self.retries = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def record_attempt(self):
+        with self._lock:
+            self.first_attempts += 1
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.retries < self.min_retries + self.ratio * self.first_attempts:
+                self.retries += 1
+                return True
+            self.denied += 1
+            return False
+
+    def stats(self) -> RetryStats:
+        with self._lock:
+            return RetryStats(self.first_attempts, self.retries, self.denied)
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Decides whether and when a failed generation is retried.
+
+    Transient errors are retried after an exponential backoff with full jitter
+    (`base_delay * 2**retry`, capped at `max_delay`) and only while the batch's retry budget
+    allows. Degenerate output is resampled immediately and permanent errors are never
+    retried. Subclass and override `classify_error` to change how exceptions are treated.
+    """
+
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    # Transient retries allowed per first attempt across a batch; None disables the budget
+    budget_ratio: float | None = 0.2
+    min_budget: int = 10
+
+    def classify_error(self, error: BaseException) -> str:
+        return classify_error(error)
+
+    def classify(self, result: GenerationResult) -> str | None:
+        """Failure kind of a result, or None if it can be used as is."""
+        if result.error:
+            return result.failure or TRANSIENT
+        if result.aborted or find_repeat(result.raw, cut_from_end=50):
+            return DEGENERATE
+        return None
+
+    def delay(self, retry: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**retry))
+
+    def new_budget(self) -> RetryBudget | None:
+        if self.budget_ratio is None:
+            return None
+        return RetryBudget(self.budget_ratio, self.min_budget)
@@ -0,0 +1,247 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterator, List, Sequence
+
+from chandra.model.endpoints import LatencyWindow
+from chandra.model.limiter import AdaptiveLimiter, is_overload_error
+
+DEFAULT_CLASSES = ("interactive", "default", "batch")
+DEFAULT_TENANT = "default"
+
+
+@dataclass
+class ClassStats:
+    # Requests dispatched, and requests waiting for a slot now
+    dispatched: int
+    queued: int
+    # Seconds spent waiting for a slot, over the most recent dispatched requests
+    mean_wait: float | None
+    p95_wait: float | None
+    max_wait: float | None
+
+
+@dataclass
+class SchedulerStats:
+    limit: int
+    in_flight: int
+    classes: Dict[str, ClassStats]
+
+
+class _Waiter:
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None):
+        self.enqueued = time.perf_counter()
+        self.granted = False
+        self.cancelled = False
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(_wake, self.future)
+
+
+class Scheduler:
+    """
+    Orders requests from many callers against one global in-flight limit.
+
+    Every request has a priority class, one of `classes` from highest to lowest, and a
+    tenant (a user, job or backfill ID). A free slot goes to the highest class with
+    waiting requests; classes are strict, so lower ones only run on capacity the higher
+    ones leave free. Within a class, tenants share slots by weighted fair queueing: each
+    request gets a virtual finish time of `1 / weight` after its tenant's previous one (or
+    after the class's current virtual time, for a tenant that was idle), and the earliest
+    finish time goes first. A tenant with weight 2 gets twice the slots of a busy tenant
+    with weight 1, and a tenant that just arrived is not stuck behind another's backlog.
+
+    The in-flight limit is `max_in_flight`, or the adaptive `limiter.current_limit`, in
+    which case request outcomes feed the limiter as well; such a limiter must only be used
+    through the scheduler. Requests without a class go to
+    `default_class`; tenants missing from `weights` have weight 1.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 64,
+        classes: Sequence[str] = DEFAULT_CLASSES,
+        default_class: str = "default",
+        weights: Dict[str, float] | None = None,
+        limiter: AdaptiveLimiter | None = None,
+        window_size: int = 1024,
+    ):
+        if default_class not in classes:
+            raise ValueError(
+                f"Default class {default_class!r} is not one of {list(classes)}"
+            )
+        self.max_in_flight = max(1, max_in_flight)
+        self.classes = list(classes)
+        self.default_class = default_class
+        self.weights = dict(weights or {})
+        self.limiter = limiter
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._sequence = itertools.count()
+        # Per class: heap of (virtual finish time, arrival order, virtual start time, waiter)
+        self._queues: Dict[str, List] = {name: [] for name in self.classes}
+        self._virtual_time = {name: 0.0 for name in self.classes}
+        self._last_finish: Dict[str, Dict[str, float]] = {
+            name: {} for name in self.classes
+        }
+        self._dispatched = {name: 0 for name in self.classes}
+        self._waits = {name: LatencyWindow(window_size) for name in self.classes}
+
+    @property
+    def limit(self) -> int:
+        return (
+            self.limiter.current_limit
+            if self.limiter is not None
+            else self.max_in_flight
+        )
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _enqueue(
+        self,
+        priority: str | None,
+        tenant: str | None,
+        loop: asyncio.AbstractEventLoop | None = None,
+    ) -> _Waiter:
+        priority = priority or self.default_class
+        if priority not in self._queues:
+            raise ValueError(
+                f"Unknown priority class {priority!r}, expected one of {self.classes}"
+            )
+        tenant = tenant or DEFAULT_TENANT
+        waiter = _Waiter(loop)
+        with self._lock:
+            finishes = self._last_finish[priority]
+            start = max(self._virtual_time[priority], finishes.get(tenant, 0.0))
+            finish = start + 1.0 / self.weights.get(tenant, 1.0)
+            finishes[tenant] = finish
+            heapq.heappush(
+                self._queues[priority], (finish, next(self._sequence), start, waiter)
+            )
+            self._dispatch()
+        return waiter
+
+    def _take_slot(self) -> bool:
+        if self.limiter is not None:
+            if not self.limiter.try_acquire():
+                return False
+        elif self._in_flight >= self.max_in_flight:
+            return False
+        self._in_flight += 1
+        return True
+
+    def _dispatch(self):
+        """Hand free slots to the best waiting requests; called with the lock held."""
+        for priority in self.classes:
+            queue = self._queues[priority]
+            while queue:
+                if queue[0][3].cancelled:
+                    heapq.heappop(queue)
+                    continue
+                if not self._take_slot():
+                    return
+                _, _, start, waiter = heapq.heappop(queue)
+                self._virtual_time[priority] = max(self._virtual_time[priority], start)
+                self._dispatched[priority] += 1
+                self._waits[priority].add(time.perf_counter() - waiter.enqueued)
+                waiter.grant()
+            # Once a class has drained, every tenant starts over on an equal footing
+            self._last_finish[priority].clear()
+
+    def acquire(self, priority: str | None = None, tenant: str | None = None):
+        self._enqueue(priority, tenant).event.wait()
+
+    async def acquire_async(
+        self, priority: str | None = None, tenant: str | None = None
+    ):
+        waiter = self._enqueue(priority, tenant, asyncio.get_running_loop())
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                granted = waiter.granted
+            if granted:
+                # The slot was handed over just as the caller gave up
+                self.release(None)
+            raise
+
+    def release(self, latency: float | None, overloaded: bool = False):
+        """Free one slot; `latency` is None when the request failed."""
+        with self._lock:
+            self._in_flight -= 1
+            if self.limiter is not None:
+                self.limiter.release(latency, overloaded=overloaded)
+            self._dispatch()
+
+    def _outcome(self, start: float, error: BaseException | None):
+        if error is None:
+            self.release(time.perf_counter() - start)
+        else:
+            self.release(None, overloaded=is_overload_error(error))
+
+    @contextmanager
+    def request(
+        self, priority: str | None = None, tenant: str | None = None
+    ) -> Iterator[None]:
+        """Hold a slot for one request, waiting for its turn first."""
+        self.acquire(priority, tenant)
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self._outcome(start, e)
+            raise
+        self._outcome(start, None)
+
+    @asynccontextmanager
+    async def request_async(
+        self, priority: str | None = None, tenant: str | None = None
+    ) -> AsyncIterator[None]:
+        await self.acquire_async(priority, tenant)
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self._outcome(start, e)
+            raise
+        self._outcome(start, None)
+
+    def stats(self) -> SchedulerStats:
+        with self._lock:
+            queued = {
+                name: sum(not entry[3].cancelled for entry in queue)
+                for name, queue in self._queues.items()
+            }
+            dispatched = dict(self._dispatched)
+            in_flight = self._in_flight
+        classes = {}
+        for name in self.classes:
+            waits = self._waits[name]
+            classes[name] = ClassStats(
+                dispatched=dispatched[name],
+                queued=queued[name],
+                mean_wait=waits.mean(),
+                p95_wait=waits.percentile(95),
+                max_wait=waits.percentile(100),
+            )
+        return SchedulerStats(limit=self.limit, in_flight=in_flight, classes=classes)
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
@@ -1,14 +1,33 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List
 
 from PIL import Image
 
+from chandra.model.metrics import PageMetrics
+
 
 @dataclass
 class GenerationResult:
     raw: str
     token_count: int
     error: bool = False
+    # Kind of failure for retries (see chandra.model.retry), set when error is True
+    failure: str | None = None
+    # Size and encode time of the image payload sent for this page
+    payload_bytes: int = 0
+    encode_time: float = 0.0
+    # Served from the result cache, or shared with an identical in-flight page, instead of the server
+    cached: bool = False
+    # Streaming mode: generation was stopped early on a confirmed repetition loop
+    aborted: bool = False
+    # Output tokens not generated thanks to early aborts, summed over attempts
+    tokens_saved: int = 0
+    # Attempts after the first
+    retries: int = 0
+    # Base URL of the replica that served the last attempt
+    endpoint: str | None = None
+    # Per-stage timings and token usage; per attempt until the page's attempts are done
+    metrics: PageMetrics = field(default_factory=PageMetrics)
 
 
 @dataclass
@@ -16,6 +35,14 @@ class BatchInputItem:
     image: Image.Image
     prompt: str | None = None
     prompt_type: str | None = None
+    # Time taken to produce `image` (rendering or loading), for metrics
+    render_time: float = 0.0
+    # Layout HTML built from the PDF's embedded text (see chandra.text_layer); such pages
+    # are answered with it instead of a request
+    text_layer: str | None = None
+    # Scheduling class and tenant (see chandra.model.scheduler); None for the defaults
+    priority: str | None = None
+    tenant: str | None = None
 
 
 @dataclass
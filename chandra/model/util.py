@@ -1,23 +1,30 @@
+import logging
 import math
-from typing import Tuple
+from dataclasses import dataclass
+from typing import List, Tuple
 
 from PIL import Image
 
 from chandra.output import parse_markdown
 
+logger = logging.getLogger(__name__)
 
-def scale_to_fit(
-    img: Image.Image,
-    max_size: Tuple[int, int] = (3072, 2048),
-    min_size: Tuple[int, int] = (28, 28),
-):
-    resample_method = Image.Resampling.LANCZOS
 
-    width, height = img.size
+# Pixel budget for images sent to the model
+MAX_IMAGE_SIZE = (3072, 2048)
+MIN_IMAGE_SIZE = (28, 28)
+
 
+def fit_size(
+    width: int,
+    height: int,
+    max_size: Tuple[int, int] = MAX_IMAGE_SIZE,
+    min_size: Tuple[int, int] = MIN_IMAGE_SIZE,
+) -> Tuple[int, int]:
+    """Size an image of `width` x `height` is resized to by `scale_to_fit`."""
     # Check for empty or invalid image
     if width == 0 or height == 0:
-        return img
+        return width, height
 
     max_width, max_height = max_size
     min_width, min_height = min_size
@@ -37,9 +44,23 @@ def scale_to_fit(
         new_width = math.ceil(width * scale_factor)
         new_height = math.ceil(height * scale_factor)
     else:
+        return width, height
+
+    return new_width, new_height
+
+
+def scale_to_fit(
+    img: Image.Image,
+    max_size: Tuple[int, int] = MAX_IMAGE_SIZE,
+    min_size: Tuple[int, int] = MIN_IMAGE_SIZE,
+):
+    resample_method = Image.Resampling.LANCZOS
+
+    new_size = fit_size(img.width, img.height, max_size, min_size)
+    if new_size == img.size:
         return img
 
-    return img.resize((new_width, new_height), resample=resample_method)
+    return img.resize(new_size, resample=resample_method)
 
 
 def detect_repeat_token(
@@ -51,7 +72,7 @@ def detect_repeat_token(
     try:
         predicted_tokens = parse_markdown(predicted_tokens)
     except Exception as e:
-        print(f"Error parsing markdown: {e}")
+        logger.warning("Error parsing markdown: %s", e)
         return True
 
     if cut_from_end > 0:
@@ -80,3 +101,67 @@ def detect_repeat_token(
             return True
 
     return False
+
+
+@dataclass
+class RepeatMatch:
+    period: int
+    count: int
+    # Number of characters skipped at the end before the repeat was found
+    offset: int = 0
+
+
+def _z_function(s: str) -> List[int]:
+    """z[i] is the length of the longest common prefix of s and s[i:]."""
+    n = len(s)
+    z = [0] * n
+    if n:
+        z[0] = n
+    left = right = 0
+    for i in range(1, n):
+        if i < right:
+            z[i] = min(right - i, z[i - left])
+        while i + z[i] < n and s[z[i]] == s[i + z[i]]:
+            z[i] += 1
+        if i + z[i] > right:
+            left, right = i, i + z[i]
+    return z
+
+
+def find_repeat(
+    text: str,
+    max_repeats: int = 4,
+    window_size: int = 500,
+    cut_from_end: int = 50,
+) -> RepeatMatch | None:
+    """
+    Find a unit of up to `window_size // 2` characters repeated more than `max_repeats` times
+    at the end of raw model output, or at the end once `cut_from_end` characters are dropped.
+
+    Runs in linear time: a Z-function over the reversed tail gives, for every period p, how far
+    the text keeps repeating its last p characters. Only the last
+    `(max_repeats + 1) * window_size // 2 + cut_from_end` characters can affect the result.
+    """
+    text = text.rstrip()
+    max_period = window_size // 2
+    tail = text[-((max_repeats + 1) * max_period + cut_from_end) :][::-1]
+
+    offsets = [0]
+    if cut_from_end > 0 and len(text) > cut_from_end:
+        offsets.append(cut_from_end)
+
+    for offset in offsets:
+        reversed_tail = tail[offset:]
+        z = _z_function(reversed_tail)
+        for period in range(1, min(max_period, len(reversed_tail) - 1) + 1):
+            if 1 + z[period] // period > max_repeats:
+                end = len(text) - offset
+                count = 1
+                while (
+                    end - (count + 1) * period >= 0
+                    and text[end - (count + 1) * period : end - count * period]
+                    == text[end - period : end]
+                ):
+                    count += 1
+                return RepeatMatch(period=period, count=count, offset=offset)
+    return None
@@ -1,28 +1,226 @@
-import base64
-import io
-from concurrent.futures import ThreadPoolExecutor
-from itertools import repeat
-from typing import List
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from dataclasses import replace
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Iterable, Iterator, List, Tuple
 
-from PIL import Image
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
+from chandra.model.cache import ResultCache, cache_key
+from chandra.model.endpoints import EndpointPool, RequestCancel, RequestCancelled
+from chandra.model.hedge import HedgePolicy
+from chandra.model.limiter import AdaptiveLimiter
+from chandra.model.metrics import PageMetrics
+from chandra.model.payload import ImagePayload, PayloadConfig, encode_image
+from chandra.model.prefilter import PageFilter, blank_result
+from chandra.model.regions import Box, RegionSplitter
+from chandra.model.retry import PERMANENT, TRANSIENT, RetryPolicy
+from chandra.model.scheduler import Scheduler
 from chandra.model.schema import BatchInputItem, GenerationResult
-from chandra.model.util import scale_to_fit, detect_repeat_token
+from chandra.model.util import find_repeat, scale_to_fit
 from chandra.prompts import PROMPT_MAPPING
 from chandra.settings import settings
 
+logger = logging.getLogger(__name__)
 
-def image_to_base64(image: Image.Image) -> str:
-    """Convert PIL Image to base64 string."""
-    buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode()
+# Streaming mode: how often (in characters) the growing output is checked for loops, and how
+# long a repeated run has to be before it is treated as a loop and the stream is closed.
+STREAM_CHECK_INTERVAL = 256
+STREAM_MIN_LOOP_CHARS = 1000
+# Only the end of the output is searched: enough for a loop of STREAM_MIN_LOOP_CHARS in
+# units as long as `find_repeat` looks for, plus trailing whitespace
+STREAM_TAIL_CHARS = 2 * STREAM_MIN_LOOP_CHARS
 
 
-def generate_vllm(
-    batch: List[BatchInputItem],
-    client: OpenAI | None = None,
+class StreamAccumulator:
+    """Collects streamed deltas and runs incremental repetition detection on the output."""
+
+    def __init__(self, check_loops: bool = True):
+        self.check_loops = check_loops
+        self.parts = []
+        self.length = 0
+        self.chunks = 0
+        self.completion_tokens = None
+        self.prompt_tokens = 0
+        self._checked_at = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def add(self, chunk) -> bool:
+        """Add a stream chunk; returns True once a repetition loop is confirmed."""
+        if chunk.usage is not None:
+            self.completion_tokens = chunk.usage.completion_tokens
+            self.prompt_tokens = chunk.usage.prompt_tokens
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            return False
+
+        delta = chunk.choices[0].delta.content
+        self.parts.append(delta)
+        self.length += len(delta)
+        self.chunks += 1
+        if not self.check_loops or self.length - self._checked_at < STREAM_CHECK_INTERVAL:
+            return False
+
+        self._checked_at = self.length
+        match = find_repeat(self._tail(), cut_from_end=0)
+        return match is not None and match.period * match.count >= STREAM_MIN_LOOP_CHARS
+
+    def _tail(self) -> str:
+        parts, length = [], 0
+        for part in reversed(self.parts):
+            parts.append(part)
+            length += len(part)
+            if length >= STREAM_TAIL_CHARS:
+                break
+        return "".join(reversed(parts))[-STREAM_TAIL_CHARS:]
+
+    def result(self, max_output_tokens: int, aborted: bool) -> GenerationResult:
+        # vLLM sends roughly one token per chunk; usage is only reported on complete streams
+        token_count = self.completion_tokens
+        if token_count is None:
+            token_count = self.chunks
+        tokens_saved = max(0, max_output_tokens - token_count) if aborted else 0
+        return GenerationResult(
+            raw=self.text,
+            token_count=token_count,
+            aborted=aborted,
+            tokens_saved=tokens_saved,
+            metrics=PageMetrics(
+                prompt_tokens=self.prompt_tokens,
+                aborted=int(aborted),
+                tokens_saved=tokens_saved,
+            ),
+        )
+
+
+def build_content(
+    item: BatchInputItem,
+    payload_config: PayloadConfig | None = None,
+    region: Box | None = None,
+) -> Tuple[list, ImagePayload]:
+    """Build the chat message content (scaled, encoded image + prompt) for an item, or one region of it."""
+    prompt = item.prompt
+    if not prompt:
+        prompt = PROMPT_MAPPING[item.prompt_type]
+
+    content = []
+    start = time.perf_counter()
+    image = item.image if region is None else item.image.crop(region)
+    image = scale_to_fit(image)
+    scale_time = time.perf_counter() - start
+    payload = encode_image(image, payload_config)
+    payload.scale_time = scale_time
+    content.append(
+        {
+            "type": "image_url",
+            "image_url": {"url": payload.data_url},
+        }
+    )
+
+    content.append({"type": "text", "text": prompt})
+    return content, payload
+
+
+def _with_payload_stats(
+    result: GenerationResult,
+    payload: ImagePayload | None,
+    item: BatchInputItem,
+    queue_wait: float,
+) -> GenerationResult:
+    """
+    Add the page's own costs to the metrics of the attempts that produced `result`.
+    `payload` is None for pages the page filter answered without encoding them.
+    """
+    result.payload_bytes = payload.num_bytes if payload else 0
+    result.encode_time = payload.encode_time if payload else 0.0
+    # A cached or shared result made no request for this page
+    metrics = PageMetrics(cached=True) if result.cached else result.metrics
+    result.metrics = replace(
+        metrics,
+        render_time=item.render_time,
+        scale_time=payload.scale_time if payload else 0.0,
+        encode_time=result.encode_time,
+        payload_bytes=result.payload_bytes,
+        queue_wait=metrics.queue_wait + queue_wait,
+        retry_reasons=list(metrics.retry_reasons),
+        error=result.error,
+    )
+    return result
+
+
+def text_layer_result(item: BatchInputItem) -> GenerationResult:
+    return GenerationResult(
+        raw=item.text_layer, token_count=0, metrics=PageMetrics(text_layer=True)
+    )
+
+
+def _merge_regions(
+    splitter: RegionSplitter,
+    item: BatchInputItem,
+    regions: List[Box],
+    outcomes: List[Tuple[GenerationResult, ImagePayload]],
+) -> Tuple[GenerationResult, ImagePayload]:
+    """One result and payload for a page from those of its regions."""
+    results = [result for result, _ in outcomes]
+    payloads = [payload for _, payload in outcomes]
+    metrics = PageMetrics(regions=len(regions))
+    for result in results:
+        _add_attempt(metrics, result)
+        metrics.retries += result.metrics.retries
+        metrics.retry_reasons += result.metrics.retry_reasons
+    failed = [result for result in results if result.error]
+    result = GenerationResult(
+        raw=splitter.stitch(item.image.size, regions, [result.raw for result in results]),
+        token_count=sum(result.token_count for result in results),
+        error=bool(failed),
+        failure=failed[0].failure if failed else None,
+        cached=all(result.cached for result in results),
+        aborted=any(result.aborted for result in results),
+        tokens_saved=sum(result.tokens_saved for result in results),
+        retries=metrics.retries,
+        endpoint=results[-1].endpoint,
+        metrics=metrics,
+    )
+    payload = ImagePayload(
+        data_url="",
+        mime_type=payloads[0].mime_type,
+        num_bytes=sum(payload.num_bytes for payload in payloads),
+        encode_time=sum(payload.encode_time for payload in payloads),
+        mode=payloads[0].mode,
+        scale_time=sum(payload.scale_time for payload in payloads),
+    )
+    return result, payload
+
+
+def _timed(result: GenerationResult, start: float, sent: float | None) -> GenerationResult:
+    """Record how long an attempt waited for a slot and how long its request took."""
+    end = time.perf_counter()
+    if sent is None:
+        sent = end
+    result.metrics.queue_wait = sent - start
+    result.metrics.server_time = end - sent
+    result.metrics.completion_tokens = result.token_count
+    return result
+
+
+def _add_attempt(metrics: PageMetrics, attempt: GenerationResult):
+    metrics.queue_wait += attempt.metrics.queue_wait
+    metrics.server_time += attempt.metrics.server_time
+    metrics.prompt_tokens += attempt.metrics.prompt_tokens
+    metrics.completion_tokens += attempt.metrics.completion_tokens
+    metrics.aborted += attempt.metrics.aborted
+    metrics.tokens_saved += attempt.metrics.tokens_saved
+
+
+def generate_vllm_iter(
+    batch: Iterable[BatchInputItem],
+    client: OpenAI | EndpointPool | None = None,
     model_name: str | None = None,
     max_output_tokens: int | None = None,
     max_retries: int | None = None,
@@ -31,87 +229,732 @@ def generate_vllm(
     top_p: float = 0.1,
     retry_temperature: float = 0.3,
     retry_top_p: float = 0.95,
-) -> List[GenerationResult]:
+    window_size: int | None = None,
+    ordered: bool = True,
+    payload_config: PayloadConfig | None = None,
+    cache: ResultCache | None = None,
+    stream: bool = False,
+    limiter: AdaptiveLimiter | None = None,
+    retry_policy: RetryPolicy | None = None,
+    hedging: HedgePolicy | None = None,
+    page_filter: PageFilter | None = None,
+    region_splitter: RegionSplitter | None = None,
+    scheduler: Scheduler | None = None,
+) -> Iterator[Tuple[int, BatchInputItem, GenerationResult]]:
+    """
+    Generate results for a stream of items, yielding (index, item, result) as pages finish.
+
+    Items are pulled from `batch` lazily, so at most `window_size` items (default: twice
+    `max_workers`) are held between being pulled and being yielded. With `ordered=False`,
+    results are yielded in completion order instead of input order.
+
+    Each page image is scaled and encoded once (per `payload_config`), and the same payload
+    is reused for every retry. With a `cache`, results are looked up by request content
+    first, and identical requests in flight at the same time share one call.
+
+    With `stream=True`, completions are streamed and checked for repetition as they grow; a
+    confirmed loop closes the stream and goes straight to a retry.
+
+    `client` may be an `EndpointPool` to spread requests over several replicas; retries are
+    then sent to a different replica than the failed attempt.
+
+    With a `limiter`, the number of requests in flight follows `limiter.current_limit`
+    instead of `max_workers`, which then defaults to the limiter's ceiling.
+
+    Failed attempts are retried up to `max_retries` times per page as `retry_policy`
+    decides: transient errors after a jittered backoff and within a retry budget shared by
+    the whole batch, degenerate output at once with the retry sampling parameters, permanent
+    errors never. Clients should be created with `max_retries=0` so the SDK does not retry
+    on its own as well.
+
+    With `hedging`, an attempt that is slower than usual gets a second, identical request
+    and the first answer wins. Hedged attempts are always streamed, and the loser's
+    connection is shut down, which stops its generation on the server.
+
+    With a `page_filter`, near-blank pages get an empty result and duplicate pages share
+    one request before anything is encoded; each still comes out with its own index.
+    Items with a `text_layer` are answered with it, without a request.
+
+    With a `region_splitter`, dense or oversized layout pages are sent as several region
+    requests in parallel and their output is stitched back into one page. A page then has
+    up to `region_splitter.max_regions` requests in flight, unless a `limiter` caps them.
+
+    With a `scheduler`, every attempt waits for a slot from it instead of the `limiter`,
+    in the order given by each item's `priority` and `tenant`, so batches sharing the
+    scheduler take turns against one global in-flight limit.
+    """
     if client is None:
         client = OpenAI(
             api_key=settings.VLLM_API_KEY,
             base_url=settings.VLLM_API_BASE,
+            max_retries=0,
         )
-    
+
     if model_name is None:
         model_name = settings.VLLM_MODEL_NAME
 
     if max_retries is None:
         max_retries = settings.MAX_VLLM_RETRIES
 
+    if max_workers is None and limiter is not None:
+        max_workers = limiter.max_limit
     if max_workers is None:
-        max_workers = min(64, len(batch))
+        max_workers = min(64, len(batch)) if hasattr(batch, "__len__") else 64
+    max_workers = max(1, max_workers)
+
+    if window_size is None:
+        window_size = max_workers * 2
+    window_size = max(1, window_size)
 
     if max_output_tokens is None:
         max_output_tokens = settings.MAX_OUTPUT_TOKENS
 
+    endpoints = client if isinstance(client, EndpointPool) else EndpointPool.from_client(client)
+    if retry_policy is None:
+        retry_policy = RetryPolicy()
+    budget = retry_policy.new_budget()
+    # Set when the consumer stops early, so work already running stops retrying
+    stopping = threading.Event()
+
     if model_name is None:
-        models = client.models.list()
+        models = endpoints.endpoints[0].client.models.list()
         model_name = models.data[0].id
 
+    def request_slot(item: BatchInputItem):
+        if scheduler is not None:
+            return scheduler.request(item.priority, item.tenant)
+        return limiter.request() if limiter is not None else nullcontext()
+
     def _generate(
-        item: BatchInputItem, temp: float = 0, top_p_val: float = 0.1
+        content: list,
+        item: BatchInputItem,
+        temp: float = 0,
+        top_p_val: float = 0.1,
+        exclude: str | None = None,
+        cancel: RequestCancel | None = None,
     ) -> GenerationResult:
-        prompt = item.prompt
-        if not prompt:
-            prompt = PROMPT_MAPPING[item.prompt_type]
-
-        content = []
-        image = scale_to_fit(item.image)
-        image_b64 = image_to_base64(image)
-        content.append(
-            {
-                "type": "image_url",
-                "image_url": {"url": f"data:image/png;base64,{image_b64}"},
-            }
+        endpoint = None
+        slot = request_slot(item)
+        start = time.perf_counter()
+        sent = None
+        try:
+            with slot, endpoints.route(exclude, retry_policy.classify_error) as endpoint:
+                sent = time.perf_counter()
+                # A hedged attempt is always streamed, so that if it loses, its connection
+                # can be shut down while it waits, which stops generation on the server
+                if stream or cancel is not None:
+                    result = _generate_stream(
+                        endpoint.client, content, temp, top_p_val, cancel
+                    )
+                else:
+                    completion = endpoint.client.chat.completions.create(
+                        model=model_name,
+                        messages=[{"role": "user", "content": content}],
+                        max_tokens=max_output_tokens,
+                        temperature=temp,
+                        top_p=top_p_val,
+                    )
+                    result = GenerationResult(
+                        raw=completion.choices[0].message.content,
+                        token_count=completion.usage.completion_tokens,
+                        error=False,
+                        metrics=PageMetrics(prompt_tokens=completion.usage.prompt_tokens),
+                    )
+        except RequestCancelled:
+            # Lost a hedge; the result is never used
+            result = GenerationResult(raw="", token_count=0, error=True)
+        except Exception as e:
+            logger.warning("Error during VLLM generation: %s", e)
+            result = GenerationResult(
+                raw="", token_count=0, error=True, failure=retry_policy.classify_error(e)
+            )
+
+        result.endpoint = endpoint.base_url if endpoint else None
+        return _timed(result, start, sent)
+
+    def _generate_stream(
+        client: OpenAI,
+        content: list,
+        temp: float,
+        top_p_val: float,
+        cancel: RequestCancel | None,
+    ) -> GenerationResult:
+        # Loops only end the stream early when streaming was asked for
+        accumulator = StreamAccumulator(check_loops=stream)
+        with client.chat.completions.create(
+            model=model_name,
+            messages=[{"role": "user", "content": content}],
+            max_tokens=max_output_tokens,
+            temperature=temp,
+            top_p=top_p_val,
+            stream=True,
+            stream_options={"include_usage": True},
+        ) as response:
+            if cancel is not None and not cancel.attach(response.response):
+                raise RequestCancelled()
+            try:
+                for chunk in response:
+                    if cancel is not None and cancel.is_set():
+                        raise RequestCancelled()
+                    if accumulator.add(chunk):
+                        logger.info(
+                            "Repetition loop after %d tokens, aborting generation",
+                            accumulator.chunks,
+                        )
+                        # Leaving the block closes the connection, which stops decoding
+                        # server-side
+                        return accumulator.result(max_output_tokens, aborted=True)
+            except Exception:
+                if cancel is not None and cancel.is_set():
+                    raise RequestCancelled() from None
+                raise
+            # A connection shut down by the cancel can also just end the stream
+            if cancel is not None and cancel.is_set():
+                raise RequestCancelled()
+        return accumulator.result(max_output_tokens, aborted=False)
+
+    def _generate_hedged(
+        content: list,
+        item: BatchInputItem,
+        temp: float,
+        top_p_val: float,
+        exclude: str | None = None,
+    ) -> GenerationResult:
+        """`_generate`, plus a second request if the first is slower than usual."""
+        delay = hedging.hedge_delay()
+        start = time.perf_counter()
+        if delay is None:
+            result = _generate(content, item, temp, top_p_val, exclude)
+            latency = time.perf_counter() - start
+            hedging.record(latency)
+            hedging.record_first(latency)
+            return result
+
+        cancels = {}
+
+        def submit() -> Future:
+            cancel = RequestCancel()
+            future = hedge_executor.submit(
+                _generate, content, item, temp, top_p_val, exclude, cancel
+            )
+            cancels[future] = cancel
+            return future
+
+        first = submit()
+        # The first request's own latency, or its age when it loses and is cancelled
+        first.add_done_callback(lambda _: hedging.record_first(time.perf_counter() - start))
+        pending = {first}
+        done, pending = wait(pending, timeout=delay)
+        if not done and hedging.try_hedge():
+            pending.add(submit())
+
+        # The first successful answer wins; an error only if nothing else is left
+        winner = first if done else None
+        try:
+            while pending and (winner is None or winner.result().error):
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if winner is None or winner.result().error:
+                        winner = future
+        finally:
+            for future in pending:
+                cancels[future].set()
+                future.cancel()
+
+        latency = time.perf_counter() - start
+        hedging.record(latency, hedge_won=winner is not first)
+        return winner.result()
+
+    generate_attempt = _generate if hedging is None else _generate_hedged
+
+    def run_attempts(
+        content: list, item: BatchInputItem, max_retries_val: int
+    ) -> Tuple[GenerationResult, bool]:
+        """Generate with retries; returns the result and whether it passed the checks."""
+        if budget is not None:
+            budget.record_attempt()
+        sampling = (temperature, top_p)
+        result = generate_attempt(content, item, *sampling)
+        metrics = PageMetrics()
+        _add_attempt(metrics, result)
+        tokens_saved = result.tokens_saved
+        retries = 0
+
+        failure = retry_policy.classify(result)
+        while failure is not None and failure != PERMANENT and retries < max_retries_val:
+            if stopping.is_set():
+                break
+            if failure == TRANSIENT:
+                if budget is not None and not budget.try_spend():
+                    logger.warning("Retry budget exhausted, not retrying generation")
+                    break
+                if stopping.wait(retry_policy.delay(retries)):
+                    break
+            else:
+                sampling = (retry_temperature, retry_top_p)
+            logger.info("Retrying generation after %s failure (attempt %d)", failure, retries + 1)
+            metrics.retry_reasons.append(failure)
+            # Retry on a different replica when there is one
+            result = generate_attempt(content, item, *sampling, exclude=result.endpoint)
+            _add_attempt(metrics, result)
+            tokens_saved += result.tokens_saved
+            retries += 1
+            failure = retry_policy.classify(result)
+
+        result.tokens_saved = tokens_saved
+        result.retries = retries
+        metrics.retries = retries
+        result.metrics = metrics
+        return result, failure is None
+
+    def request(
+        item: BatchInputItem, max_retries_val: int, region: Box | None = None
+    ) -> Tuple[GenerationResult, ImagePayload]:
+        content, payload = build_content(item, payload_config, region)
+        if cache is None:
+            return run_attempts(content, item, max_retries_val)[0], payload
+        key = cache_key(
+            content,
+            model_name,
+            max_tokens=max_output_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            retry_temperature=retry_temperature,
+            retry_top_p=retry_top_p,
+        )
+        return (
+            cache.get_or_compute(key, lambda: run_attempts(content, item, max_retries_val)),
+            payload,
         )
 
-        content.append({"type": "text", "text": prompt})
+    def process_item(item, max_retries_val, queued):
+        queue_wait = time.perf_counter() - queued
+        payload = None
+
+        def generate() -> GenerationResult:
+            nonlocal payload
+            regions = region_splitter.split(item) if region_splitter is not None else []
+            if not regions:
+                result, payload = request(item, max_retries_val)
+                return result
+            futures = [
+                region_executor.submit(request, item, max_retries_val, region)
+                for region in regions
+            ]
+            outcomes = [future.result() for future in futures]
+            result, payload = _merge_regions(region_splitter, item, regions, outcomes)
+            return result
+
+        if item.text_layer is not None:
+            result = text_layer_result(item)
+        elif page_filter is None:
+            result = generate()
+        else:
+            result = page_filter.get_or_compute(item, generate)
+        return _with_payload_stats(result, payload, item, queue_wait)
+
+    items = enumerate(batch)
+    pending = deque()
+    # Attempts run here while hedging so the worker thread can wait on two of them
+    hedge_executor = (
+        ThreadPoolExecutor(max_workers=max_workers * 2) if hedging is not None else None
+    )
+    # Regions of split pages are requested here while the page's worker waits on them
+    region_executor = (
+        ThreadPoolExecutor(max_workers=max_workers * region_splitter.max_regions)
+        if region_splitter is not None
+        else None
+    )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def submit_next() -> bool:
+            try:
+                idx, item = next(items)
+            except StopIteration:
+                return False
+            future = executor.submit(process_item, item, max_retries, time.perf_counter())
+            pending.append((future, idx, item))
+            return True
 
         try:
-            completion = client.chat.completions.create(
-                model=model_name,
-                messages=[{"role": "user", "content": content}],
-                max_tokens=max_output_tokens,
-                temperature=temp,
-                top_p=top_p_val,
-            )
-        except Exception as e:
-            print(f"Error during VLLM generation: {e}")
-            return GenerationResult(raw="", token_count=0, error=True)
+            while len(pending) < window_size and submit_next():
+                pass
 
-        return GenerationResult(
-            raw=completion.choices[0].message.content,
-            token_count=completion.usage.completion_tokens,
-            error=False,
+            while pending:
+                if ordered:
+                    future, idx, item = pending.popleft()
+                    done = [(future, idx, item)]
+                else:
+                    wait([p[0] for p in pending], return_when=FIRST_COMPLETED)
+                    done = [p for p in pending if p[0].done()]
+                    for p in done:
+                        pending.remove(p)
+
+                for future, idx, item in done:
+                    result = future.result()
+                    submit_next()
+                    yield idx, item, result
+        finally:
+            # Abandon queued work if the consumer stops early
+            stopping.set()
+            for future, _, _ in pending:
+                future.cancel()
+            if hedge_executor is not None:
+                hedge_executor.shutdown(wait=False)
+            if region_executor is not None:
+                region_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def generate_vllm(
+    batch: List[BatchInputItem],
+    client: OpenAI | EndpointPool | None = None,
+    model_name: str | None = None,
+    max_output_tokens: int | None = None,
+    max_retries: int | None = None,
+    max_workers: int | None = None,
+    temperature: float = 0.0,
+    top_p: float = 0.1,
+    retry_temperature: float = 0.3,
+    retry_top_p: float = 0.95,
+    window_size: int | None = None,
+    payload_config: PayloadConfig | None = None,
+    cache: ResultCache | None = None,
+    stream: bool = False,
+    limiter: AdaptiveLimiter | None = None,
+    retry_policy: RetryPolicy | None = None,
+    hedging: HedgePolicy | None = None,
+    page_filter: PageFilter | None = None,
+    region_splitter: RegionSplitter | None = None,
+    scheduler: Scheduler | None = None,
+) -> List[GenerationResult]:
+    """Generate results for a batch, in input order. See `generate_vllm_iter` for the options."""
+    if window_size is None:
+        window_size = len(batch)
+    results = generate_vllm_iter(
+        batch,
+        client=client,
+        model_name=model_name,
+        max_output_tokens=max_output_tokens,
+        max_retries=max_retries,
+        max_workers=max_workers,
+        temperature=temperature,
+        top_p=top_p,
+        retry_temperature=retry_temperature,
+        retry_top_p=retry_top_p,
+        window_size=window_size,
+        payload_config=payload_config,
+        cache=cache,
+        stream=stream,
+        limiter=limiter,
+        retry_policy=retry_policy,
+        hedging=hedging,
+        page_filter=page_filter,
+        region_splitter=region_splitter,
+        scheduler=scheduler,
+    )
+    return [result for _, _, result in results]
+
+
+async def generate_vllm_async(
+    batch: List[BatchInputItem],
+    client: AsyncOpenAI | EndpointPool | None = None,
+    model_name: str | None = None,
+    max_output_tokens: int | None = None,
+    max_retries: int | None = None,
+    max_concurrency: int | None = None,
+    temperature: float = 0.0,
+    top_p: float = 0.1,
+    retry_temperature: float = 0.3,
+    retry_top_p: float = 0.95,
+    executor: Executor | None = None,
+    payload_config: PayloadConfig | None = None,
+    cache: ResultCache | None = None,
+    stream: bool = False,
+    limiter: AdaptiveLimiter | None = None,
+    retry_policy: RetryPolicy | None = None,
+    hedging: HedgePolicy | None = None,
+    on_result: Callable[[int, BatchInputItem, GenerationResult], Awaitable[None]]
+    | None = None,
+    page_filter: PageFilter | None = None,
+    region_splitter: RegionSplitter | None = None,
+    scheduler: Scheduler | None = None,
+) -> List[GenerationResult]:
+    """
+    Asyncio counterpart of `generate_vllm`, built on `AsyncOpenAI`.
+
+    At most `max_concurrency` requests are in flight at once. Image encoding and repeat
+    detection run in `executor` (the loop's default executor if None) so they never block
+    the event loop. `on_result(index, item, result)` is awaited as soon as each item
+    finishes, outside the concurrency limit. A `limiter` additionally caps the requests in
+    flight at its adaptive `current_limit`. Retries follow `retry_policy`, hedging
+    follows `hedging`, `page_filter` filters pages and `region_splitter` splits them as in
+    `generate_vllm_iter`; losing hedged requests are cancelled. The regions of a split page
+    share its concurrency slot. A `scheduler` hands out request slots as in
+    `generate_vllm_iter`.
+    """
+    if client is None:
+        client = AsyncOpenAI(
+            api_key=settings.VLLM_API_KEY,
+            base_url=settings.VLLM_API_BASE,
+            max_retries=0,
         )
 
-    def process_item(item, max_retries_val):
-        result = _generate(item, temp=temperature, top_p_val=top_p)
-        retries = 0
+    if model_name is None:
+        model_name = settings.VLLM_MODEL_NAME
+
+    if max_retries is None:
+        max_retries = settings.MAX_VLLM_RETRIES
+
+    if max_concurrency is None:
+        max_concurrency = max(1, min(256, len(batch)))
+
+    if max_output_tokens is None:
+        max_output_tokens = settings.MAX_OUTPUT_TOKENS
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    endpoints = client if isinstance(client, EndpointPool) else EndpointPool.from_client(client)
+    if retry_policy is None:
+        retry_policy = RetryPolicy()
+    budget = retry_policy.new_budget()
+
+    def request_slot(item: BatchInputItem):
+        if scheduler is not None:
+            return scheduler.request_async(item.priority, item.tenant)
+        return limiter.request_async() if limiter is not None else nullcontext()
 
-        while retries < max_retries_val and (
-            detect_repeat_token(result.raw)
-            or (
-                len(result.raw) > 50
-                and detect_repeat_token(result.raw, cut_from_end=50)
+    async def _generate(
+        content: list,
+        item: BatchInputItem,
+        temp: float = 0,
+        top_p_val: float = 0.1,
+        exclude: str | None = None,
+    ) -> GenerationResult:
+        endpoint = None
+        slot = request_slot(item)
+        start = time.perf_counter()
+        sent = None
+        try:
+            async with slot:
+                with endpoints.route(exclude, retry_policy.classify_error) as endpoint:
+                    sent = time.perf_counter()
+                    if stream:
+                        result = await _generate_stream(
+                            endpoint.client, content, temp, top_p_val
+                        )
+                    else:
+                        completion = await endpoint.client.chat.completions.create(
+                            model=model_name,
+                            messages=[{"role": "user", "content": content}],
+                            max_tokens=max_output_tokens,
+                            temperature=temp,
+                            top_p=top_p_val,
+                        )
+                        result = GenerationResult(
+                            raw=completion.choices[0].message.content,
+                            token_count=completion.usage.completion_tokens,
+                            error=False,
+                            metrics=PageMetrics(prompt_tokens=completion.usage.prompt_tokens),
+                        )
+        except Exception as e:
+            logger.warning("Error during VLLM generation: %s", e)
+            result = GenerationResult(
+                raw="", token_count=0, error=True, failure=retry_policy.classify_error(e)
             )
-            or result.error
-        ):
-            print(
-                f"Detected repeat token or error, retrying generation (attempt {retries + 1})..."
+
+        result.endpoint = endpoint.base_url if endpoint else None
+        return _timed(result, start, sent)
+
+    async def _generate_hedged(
+        content: list,
+        item: BatchInputItem,
+        temp: float,
+        top_p_val: float,
+        exclude: str | None = None,
+    ) -> GenerationResult:
+        delay = hedging.hedge_delay()
+        start = time.perf_counter()
+        if delay is None:
+            result = await _generate(content, item, temp, top_p_val, exclude)
+            latency = time.perf_counter() - start
+            hedging.record(latency)
+            hedging.record_first(latency)
+            return result
+
+        first = asyncio.ensure_future(_generate(content, item, temp, top_p_val, exclude))
+        first.add_done_callback(lambda _: hedging.record_first(time.perf_counter() - start))
+        done, pending = await asyncio.wait({first}, timeout=delay)
+        if not done and hedging.try_hedge():
+            pending.add(
+                asyncio.ensure_future(_generate(content, item, temp, top_p_val, exclude))
             )
-            result = _generate(item, temp=retry_temperature, top_p_val=retry_top_p)
+
+        winner = first if done else None
+        try:
+            while pending and (winner is None or winner.result().error):
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if winner is None or winner.result().error:
+                        winner = task
+        finally:
+            # Cancelling the loser closes its connection, which stops decoding server-side
+            for task in pending:
+                task.cancel()
+
+        latency = time.perf_counter() - start
+        hedging.record(latency, hedge_won=winner is not first)
+        return winner.result()
+
+    async def _generate_stream(
+        client: AsyncOpenAI, content: list, temp: float, top_p_val: float
+    ) -> GenerationResult:
+        accumulator = StreamAccumulator()
+        async with await client.chat.completions.create(
+            model=model_name,
+            messages=[{"role": "user", "content": content}],
+            max_tokens=max_output_tokens,
+            temperature=temp,
+            top_p=top_p_val,
+            stream=True,
+            stream_options={"include_usage": True},
+        ) as response:
+            async for chunk in response:
+                if accumulator.add(chunk):
+                    logger.info(
+                        "Repetition loop after %d tokens, aborting generation", accumulator.chunks
+                    )
+                    return accumulator.result(max_output_tokens, aborted=True)
+        return accumulator.result(max_output_tokens, aborted=False)
+
+    generate_attempt = _generate if hedging is None else _generate_hedged
+
+    async def run_attempts(content: list, item: BatchInputItem) -> Tuple[GenerationResult, bool]:
+        if budget is not None:
+            budget.record_attempt()
+        sampling = (temperature, top_p)
+        result = await generate_attempt(content, item, *sampling)
+        metrics = PageMetrics()
+        _add_attempt(metrics, result)
+        tokens_saved = result.tokens_saved
+        retries = 0
+
+        failure = await loop.run_in_executor(executor, retry_policy.classify, result)
+        while failure is not None and failure != PERMANENT and retries < max_retries:
+            if failure == TRANSIENT:
+                if budget is not None and not budget.try_spend():
+                    logger.warning("Retry budget exhausted, not retrying generation")
+                    break
+                await asyncio.sleep(retry_policy.delay(retries))
+            else:
+                sampling = (retry_temperature, retry_top_p)
+            logger.info("Retrying generation after %s failure (attempt %d)", failure, retries + 1)
+            metrics.retry_reasons.append(failure)
+            result = await generate_attempt(content, item, *sampling, exclude=result.endpoint)
+            _add_attempt(metrics, result)
+            tokens_saved += result.tokens_saved
             retries += 1
+            failure = await loop.run_in_executor(executor, retry_policy.classify, result)
+
+        result.tokens_saved = tokens_saved
+        result.retries = retries
+        metrics.retries = retries
+        result.metrics = metrics
+        return result, failure is None
+
+    async def run_cached(content: list, item: BatchInputItem) -> GenerationResult:
+        key = cache_key(
+            content,
+            model_name,
+            max_tokens=max_output_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            retry_temperature=retry_temperature,
+            retry_top_p=retry_top_p,
+        )
+        while True:
+            future, owner = cache.claim(key)
+            if owner:
+                break
+            shared = await asyncio.wrap_future(future)
+            if shared is not None:
+                return replace(shared, cached=True)
 
+        cached = await loop.run_in_executor(executor, cache.get, key)
+        if cached is not None:
+            cache.share(key, future, cached)
+            return cached
+
+        try:
+            result, cacheable = await run_attempts(content, item)
+        except BaseException:
+            cache.fail(key, future)
+            raise
+        await loop.run_in_executor(executor, cache.resolve, key, future, result, cacheable)
         return result
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        results = list(executor.map(process_item, batch, repeat(max_retries)))
+    async def run_filtered(item: BatchInputItem, generate) -> GenerationResult:
+        blank, key = await loop.run_in_executor(executor, page_filter.analyze, item)
+        if blank:
+            return blank_result()
+        if key is None:
+            return await generate()
+
+        future, owner = page_filter.claim(key)
+        if not owner:
+            await asyncio.wait([asyncio.wrap_future(future)])
+            shared = page_filter.share(future)
+            return shared if shared is not None else await generate()
+
+        try:
+            result = await generate()
+        except BaseException as e:
+            page_filter.fail(key, future, e)
+            raise
+        page_filter.resolve(key, future, result)
+        return result
+
+    async def process_item(idx: int, item: BatchInputItem) -> GenerationResult:
+        queued = time.perf_counter()
+        async with semaphore:
+            queue_wait = time.perf_counter() - queued
+            payload = None
+
+            async def request(region: Box | None = None) -> Tuple[GenerationResult, ImagePayload]:
+                content, payload = await loop.run_in_executor(
+                    executor, build_content, item, payload_config, region
+                )
+                if cache is None:
+                    return (await run_attempts(content, item))[0], payload
+                return await run_cached(content, item), payload
+
+            async def generate() -> GenerationResult:
+                nonlocal payload
+                regions = []
+                if region_splitter is not None:
+                    regions = await loop.run_in_executor(executor, region_splitter.split, item)
+                if not regions:
+                    result, payload = await request()
+                    return result
+                outcomes = await asyncio.gather(*(request(region) for region in regions))
+                result, payload = await loop.run_in_executor(
+                    executor, _merge_regions, region_splitter, item, regions, outcomes
+                )
+                return result
+
+            if item.text_layer is not None:
+                result = text_layer_result(item)
+            elif page_filter is None:
+                result = await generate()
+            else:
+                result = await run_filtered(item, generate)
+            result = _with_payload_stats(result, payload, item, queue_wait)
+
+        if on_result is not None:
+            await on_result(idx, item, result)
+        return result
 
-    return results
+    return list(
+        await asyncio.gather(*(process_item(idx, item) for idx, item in enumerate(batch)))
+    )
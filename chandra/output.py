@@ -1,14 +1,20 @@
 import hashlib
 import json
+import logging
 import re
 from dataclasses import dataclass, asdict
 from functools import lru_cache
+from typing import TYPE_CHECKING, List, Tuple
 
 import six
-from PIL import Image
-from bs4 import BeautifulSoup, NavigableString
+from bs4 import BeautifulSoup, CData, NavigableString
 from markdownify import MarkdownConverter, re_whitespace
 
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
 
 @lru_cache
 def _hash_html(html: str):
@@ -20,7 +26,7 @@ def get_image_name(html: str, div_idx: int):
     return f"{html_hash}_{div_idx}_img.webp"
 
 
-def extract_images(html: str, chunks: dict, image: Image.Image):
+def extract_images(html: str, chunks: dict, image: "Image.Image"):
     images = {}
     div_idx = 0
     for idx, chunk in enumerate(chunks):
@@ -96,7 +102,13 @@ def get_formatted_table_text(element):
     return full_text
 
 
+# Ancestors inside which text is not escaped
+NO_ESCAPE_TAGS = {"pre", "code", "kbd", "samp", "math"}
+
+
 class Markdownify(MarkdownConverter):
+    """Markdown converter for Chandra HTML. Holds no per-document state."""
+
     def __init__(
         self,
         inline_math_delimiters,
@@ -107,6 +119,12 @@ class Markdownify(MarkdownConverter):
         self.inline_math_delimiters = inline_math_delimiters
         self.block_math_delimiters = block_math_delimiters
 
+    def process_tag(self, node, parent_tags=None):
+        if node.name == "table":
+            # Tables are emitted as raw HTML, so converting their cells would be wasted work
+            return self.convert_table(node, "", parent_tags)
+        return super().process_tag(node, parent_tags)
+
     def convert_math(self, el, text, parent_tags):
         block = el.has_attr("display") and el["display"] == "block"
         if block:
@@ -142,14 +160,18 @@ class Markdownify(MarkdownConverter):
         return text
 
     def process_text(self, el, parent_tags=None):
+        # parent_tags holds the names of all ancestors, collected while walking down the tree
+        if parent_tags is None:
+            parent_tags = set()
+
         text = six.text_type(el) or ""
 
         # normalize whitespace if we're not inside a preformatted element
-        if not el.find_parent("pre"):
+        if "pre" not in parent_tags:
             text = re_whitespace.sub(" ", text)
 
         # escape special characters if we're not inside a preformatted or code element
-        if not el.find_parent(["pre", "code", "kbd", "samp", "math"]):
+        if NO_ESCAPE_TAGS.isdisjoint(parent_tags):
             text = self.escape(text)
 
         # remove trailing whitespaces if any of the following condition is true:
@@ -163,12 +185,10 @@ class Markdownify(MarkdownConverter):
         return text
 
 
-def parse_markdown(
-    html: str, include_headers_footers: bool = False
-):
-    html = parse_html(html, include_headers_footers)
-
-    md_cls = Markdownify(
+@lru_cache(maxsize=None)
+def _markdown_converter() -> Markdownify:
+    """Shared converter instance; Markdownify is stateless between conversions."""
+    return Markdownify(
         heading_style="ATX",
         bullets="-",
         escape_misc=False,
@@ -180,10 +200,17 @@ def parse_markdown(
         inline_math_delimiters=("$", "$"),
         block_math_delimiters=("$$", "$$"),
     )
+
+
+def parse_markdown(
+    html: str, include_headers_footers: bool = False
+):
+    html = parse_html(html, include_headers_footers)
+
     try:
-        markdown = md_cls.convert(html)
+        markdown = _markdown_converter().convert(html)
     except Exception as e:
-        print(f"Error converting HTML to Markdown: {e}")
+        logger.warning("Error converting HTML to Markdown: %s", e)
         markdown = ""
     return markdown.strip()
 
@@ -195,35 +222,39 @@ class LayoutBlock:
     content: str
 
 
-def parse_layout(html: str, image: Image.Image):
+def _block_bbox(div, width: int, height: int) -> list[int]:
+    width_scaler = width / 1024
+    height_scaler = height / 1024
+    bbox = div.get("data-bbox")
+    try:
+        bbox = json.loads(bbox)
+    except Exception:
+        bbox = [0, 0, 1, 1]  # Fallback to a default bbox if parsing fails
+
+    bbox = list(map(int, bbox))
+    # Normalize bbox
+    return [
+        max(0, int(bbox[0] * width_scaler)),
+        max(0, int(bbox[1] * height_scaler)),
+        min(int(bbox[2] * width_scaler), width),
+        min(int(bbox[3] * height_scaler), height),
+    ]
+
+
+def parse_layout(html: str, image: "Image.Image"):
     soup = BeautifulSoup(html, "html.parser")
     top_level_divs = soup.find_all("div", recursive=False)
     width, height = image.size
-    width_scaler = width / 1024
-    height_scaler = height / 1024
     layout_blocks = []
     for div in top_level_divs:
-        bbox = div.get("data-bbox")
-        try:
-            bbox = json.loads(bbox)
-        except Exception:
-            bbox = [0, 0, 1, 1]  # Fallback to a default bbox if parsing fails
-
-        bbox = list(map(int, bbox))
-        # Normalize bbox
-        bbox = [
-            max(0, int(bbox[0] * width_scaler)),
-            max(0, int(bbox[1] * height_scaler)),
-            min(int(bbox[2] * width_scaler), width),
-            min(int(bbox[3] * height_scaler), height),
-        ]
+        bbox = _block_bbox(div, width, height)
         label = div.get("data-label", "block")
         content = str(div.decode_contents())
         layout_blocks.append(LayoutBlock(bbox=bbox, label=label, content=content))
     return layout_blocks
 
 
-def parse_chunks(html: str, image: Image.Image):
+def parse_chunks(html: str, image: "Image.Image"):
     layout = parse_layout(html, image)
     chunks = [asdict(block) for block in layout]
     return chunks
@@ -286,6 +317,11 @@ def html_to_latex(html: str) -> str:
     return "\n".join(parts)
 
 
+TABLE_LABELS = {"Table"}
+FORMULA_LABELS = {"Formula", "Equation", "Math"}
+PICTURE_LABELS = {"Image", "Figure", "Picture"}
+
+
 def extract_text_from_cell(label: str, html: str) -> str:
     """
     Extract appropriate text representation based on cell label.
@@ -295,12 +331,193 @@ def extract_text_from_cell(label: str, html: str) -> str:
     - Formula: LaTeX
     - Image/Figure/Picture: empty string
     """
-    if label == "Table":
+    if label in TABLE_LABELS:
         return html_to_table_html(html)
-    elif label in {"Formula", "Equation", "Math"}:
+    elif label in FORMULA_LABELS:
         return html_to_latex(html)
-    elif label in {"Image", "Figure", "Picture"}:
+    elif label in PICTURE_LABELS:
         return ""
     else:
         # Default: extract plain text
         return html_to_plain_text(html)
+
+
+# ========== Single-parse page post-processing ==========
+
+_TEXT_TYPES = (NavigableString, CData)
+
+
+def _tag_text(tag) -> str:
+    """`get_text()` of a tag, as seen after `html_to_plain_text` replaced <br> with newlines."""
+    parts = []
+    for node in tag.descendants:
+        if type(node) in _TEXT_TYPES:
+            parts.append(str(node))
+        elif getattr(node, "name", None) == "br":
+            parts.append("\n")
+    return "".join(parts)
+
+
+def _text_pieces(tag):
+    for child in tag.children:
+        if type(child) in _TEXT_TYPES:
+            yield str(child)
+        elif getattr(child, "name", None) == "br":
+            yield "\n"
+        elif getattr(child, "name", None) == "math":
+            yield _tag_text(child).strip()
+        elif getattr(child, "children", None) is not None:
+            yield from _text_pieces(child)
+
+
+def _plain_text(tag) -> str:
+    """Same as `html_to_plain_text(tag.decode_contents())`, without reparsing or mutating."""
+    pieces = [piece.strip() for piece in _text_pieces(tag)]
+    text = " ".join(piece for piece in pieces if piece)
+    text = re_whitespace.sub(" ", text)
+    text = re.sub(r" ?\n ?", "\n", text)
+    return text.strip()
+
+
+def _has_split_text(tag) -> bool:
+    """Whether `tag` holds adjacent text nodes, left by stray end tags the parser dropped."""
+    return any(
+        type(node) is NavigableString and type(node.next_sibling) is NavigableString
+        for node in tag.descendants
+    )
+
+
+def _cell_text(label: str, div, content: str) -> str:
+    """Same as `extract_text_from_cell(label, content)`, where `content` is the div's HTML."""
+    if _has_split_text(div):
+        # A reparse of the chunk joins the split text (and collapses whitespace-only runs),
+        # which the tree walks below would not
+        return extract_text_from_cell(label, content)
+    if label in TABLE_LABELS:
+        tables = div.find_all("table")
+        if not tables:
+            return _plain_text(div)
+        return "\n\n".join(str(table) for table in tables)
+    elif label in FORMULA_LABELS:
+        maths = div.find_all("math")
+        if not maths:
+            return _plain_text(div)
+        parts = []
+        for math_tag in maths:
+            latex = math_tag.get_text().strip()
+            if latex:
+                parts.append(latex)
+        return "\n".join(parts)
+    elif label in PICTURE_LABELS:
+        return ""
+    return _plain_text(div)
+
+
+def _merge_text_nodes(tag, preserve_whitespace: bool = False):
+    """
+    Join adjacent text nodes, as reparsing the serialized HTML would. They come from block
+    boundaries and from stray end tags (like `</b>` with no open `<b>`) that the parser
+    drops, and they change whitespace handling in markdown conversion.
+    """
+    preserve_whitespace = preserve_whitespace or tag.name in ("pre", "textarea")
+    run = []
+    for child in list(tag.contents) + [None]:
+        if type(child) is NavigableString:
+            run.append(child)
+            continue
+        if len(run) > 1:
+            text = "".join(str(node) for node in run)
+            # The parser collapses whitespace-only strings to one space or newline
+            if not preserve_whitespace and not text.strip(BeautifulSoup.ASCII_SPACES):
+                text = "\n" if "\n" in text else " "
+            run[0].replace_with(NavigableString(text))
+            for node in run[1:]:
+                node.extract()
+        run = []
+        if getattr(child, "contents", None) is not None:
+            _merge_text_nodes(child, preserve_whitespace)
+
+
+@dataclass
+class ParsedPage:
+    blocks: List[LayoutBlock]
+    cell_texts: List[str]
+    html: str
+    markdown: str
+
+    @property
+    def chunks(self):
+        return [asdict(block) for block in self.blocks]
+
+
+def parse_page(
+    html: str,
+    image_size: Tuple[int, int],
+    include_headers_footers: bool = False,
+    parser: str = "html.parser",
+) -> ParsedPage:
+    """
+    Parse a page's raw output once and derive everything the clients need from that tree.
+
+    Equivalent to calling `parse_layout`, `extract_text_from_cell` on each block, `parse_html`
+    and `parse_markdown`, which each parse the HTML again, and byte-identical to them with
+    the default parser, malformed HTML included. `parser` selects the BeautifulSoup
+    backend, e.g. "lxml" when installed; other backends repair malformed HTML (such as a
+    `<tr>` outside a `<table>`) in their own way, so their output can differ there.
+    """
+    soup = BeautifulSoup(html, parser)
+    root = soup
+    if parser != "html.parser" and soup.body is not None:
+        # lxml and html5lib wrap fragments in <html><body>
+        root = soup.body
+    top_level_divs = root.find_all("div", recursive=False)
+
+    width, height = image_size
+    blocks = []
+    cell_texts = []
+    markdown_divs = []
+    out_html = ""
+    for div in top_level_divs:
+        label = div.get("data-label")
+        content = str(div.decode_contents())
+        blocks.append(
+            LayoutBlock(
+                bbox=_block_bbox(div, width, height),
+                label=label if label is not None else "block",
+                content=content,
+            )
+        )
+        cell_texts.append(_cell_text(blocks[-1].label, div, content))
+
+        # Skip headers and footers if not included
+        if label and not include_headers_footers:
+            if label in ["Page-Header", "Page-Footer"]:
+                continue
+
+        if label in ["Image", "Figure"]:
+            # Replace image content with text placeholder
+            placeholder = f"[{label}]"
+            out_html += placeholder
+            markdown_divs.append([NavigableString(placeholder)])
+        else:
+            out_html += content
+            markdown_divs.append(div.contents)
+
+    # Markdown conversion consumes the tree, so it runs last
+    fragment = BeautifulSoup("", "html.parser")
+    for contents in markdown_divs:
+        for node in list(contents):
+            fragment.append(node)
+    _merge_text_nodes(fragment)
+    try:
+        markdown = _markdown_converter().convert_soup(fragment)
+    except Exception as e:
+        logger.warning("Error converting HTML to Markdown: %s", e)
+        markdown = ""
+
+    return ParsedPage(
+        blocks=blocks,
+        cell_texts=cell_texts,
+        html=out_html,
+        markdown=markdown.strip(),
+    )
@@ -1,11 +1,46 @@
-from typing import List, TypedDict
+import abc
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import time
+from contextlib import closing
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import asdict
+from typing import Iterable, Iterator, List, Sequence, Tuple, TypedDict
 from PIL import Image
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
-from chandra.model.schema import BatchInputItem
-from chandra.model.vllm import generate_vllm
-from chandra.output import parse_markdown, parse_chunks, extract_text_from_cell
-from chandra.input import load_file
+from chandra.model.cache import ResultCache
+from chandra.model.endpoints import EndpointPool, normalize_base_url
+from chandra.model.hedge import HedgePolicy
+from chandra.model.limiter import AdaptiveLimiter
+from chandra.model.metrics import MetricsHook, PageMetrics, emit
+from chandra.model.retry import RetryPolicy
+from chandra.model.scheduler import Scheduler
+from chandra.model.payload import PayloadConfig
+from chandra.model.prefilter import PageFilter
+from chandra.model.regions import RegionSplitter
+from chandra.model.schema import BatchInputItem, GenerationResult
+from chandra.model.vllm import generate_vllm_async, generate_vllm_iter
+from chandra.output import extract_images as crop_images, parse_page
+from chandra.input import (
+    DocumentSource,
+    iter_file,
+    load_file,
+    render_executor,
+    source_name,
+)
+from chandra.text_layer import TEXT_LAYER_KEY, TextLayerConfig
+
+logger = logging.getLogger(__name__)
 
 
 class CellDict(TypedDict):
@@ -20,6 +55,16 @@ class PageResultDict(TypedDict):
     input_height: int
     cells: List[CellDict]
     md_content: str
+    token_count: int
+    retries: int
+    # `PageMetrics` fields
+    metrics: dict
+
+
+class DocumentResultDict(TypedDict):
+    path: str
+    pages: List[PageResultDict]
+    error: str | None
 
 
 PROMPT_MODE_MAP = {
@@ -28,12 +73,75 @@ PROMPT_MODE_MAP = {
 }
 
 
-class ChandraOCRClient:
-    """High-level client for Chandra OCR vLLM API."""
+class _DocumentState:
+    """Progress of one document in `parse_many`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.submitted = 0
+        self.pages: List[PageResultDict] = []
+        self.loaded = False
+        self.error: str | None = None
+
+    @property
+    def complete(self) -> bool:
+        return self.loaded and len(self.pages) == self.submitted
+
+    def result(self) -> DocumentResultDict:
+        return {
+            "path": self.path,
+            # A failed document keeps no partial pages
+            "pages": sorted(self.pages, key=lambda page: page["page_no"])
+            if not self.error
+            else [],
+            "error": self.error,
+        }
+
+
+def _page_result(
+    page_no: int,
+    image_size: Tuple[int, int],
+    raw_html: str,
+    include_headers_footers: bool,
+    html_parser: str,
+    token_count: int = 0,
+    retries: int = 0,
+    metrics: dict | None = None,
+) -> PageResultDict:
+    # Module-level so it can be shipped to post-processing worker processes
+    start = time.perf_counter()
+    page = parse_page(
+        raw_html,
+        image_size,
+        include_headers_footers=include_headers_footers,
+        parser=html_parser,
+    )
+    width, height = image_size
+    return {
+        "page_no": page_no,
+        "input_width": width,
+        "input_height": height,
+        "cells": [
+            {
+                "bbox": block.bbox,
+                "category": block.label,
+                "text": text,
+            }
+            for block, text in zip(page.blocks, page.cell_texts)
+        ],
+        "md_content": page.markdown,
+        "token_count": token_count,
+        "retries": retries,
+        "metrics": {**(metrics or {}), "postprocess_time": time.perf_counter() - start},
+    }
+
+
+class _ChandraClientBase(abc.ABC):
+    """Configuration and page assembly shared by the sync and async clients."""
 
     def __init__(
         self,
-        base_url: str = "http://localhost:8000",
+        base_url: str | List[str | Tuple[str, float]] = "http://localhost:8000",
         api_key: str = "EMPTY",
         model_name: str = "chandra",
         temperature: float = 0.0,
@@ -44,11 +152,24 @@ class ChandraOCRClient:
         include_headers_footers: bool = False,
         image_dpi: int = 200,
         min_image_dim: int = 1024,
+        render_workers: int = 1,
+        render_at_target: bool = True,
+        payload_config: PayloadConfig | None = None,
+        cache: ResultCache | None = None,
+        stream: bool = False,
+        html_parser: str = "html.parser",
+        postprocess_workers: int = 0,
+        limiter: AdaptiveLimiter | None = None,
+        retry_policy: RetryPolicy | None = None,
+        hedging: HedgePolicy | None = None,
+        metrics_hooks: Sequence[MetricsHook] = (),
+        page_filter: PageFilter | None = None,
+        text_layer: TextLayerConfig | None = None,
+        region_splitter: RegionSplitter | None = None,
+        scheduler: Scheduler | None = None,
     ):
-        # Ensure base_url ends with /v1
-        if not base_url.rstrip("/").endswith("/v1"):
-            base_url = f"{base_url.rstrip('/')}/v1"
-        
+        if isinstance(base_url, str):
+            base_url = normalize_base_url(base_url)
         self.base_url = base_url
         self.api_key = api_key
         self.model_name = model_name
@@ -60,82 +181,577 @@ class ChandraOCRClient:
         self.include_headers_footers = include_headers_footers
         self.image_dpi = image_dpi
         self.min_image_dim = min_image_dim
+        self.render_workers = render_workers
+        self.render_at_target = render_at_target
+        self.payload_config = payload_config
+        self.cache = cache
+        self.stream = stream
+        self.html_parser = html_parser
+        self.postprocess_workers = postprocess_workers
+        self.limiter = limiter
+        self.retry_policy = retry_policy
+        self.hedging = hedging
+        self.metrics_hooks = list(metrics_hooks)
+        self.page_filter = page_filter
+        self.text_layer = text_layer
+        self.region_splitter = region_splitter
+        self.scheduler = scheduler
+        self._postprocess_pool = None
+        # Pages handed to the model whose results have not been returned yet
+        self.pages_in_flight = 0
 
-        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.client = self._create_client()
 
-    def parse_images(
+    @abc.abstractmethod
+    def _create_client(self):
+        """Build the OpenAI client, or an endpoint pool for several replicas."""
+
+    def _endpoint_pool(self, async_clients: bool) -> EndpointPool:
+        # Several replicas: route each request to the least-loaded healthy one
+        return EndpointPool(
+            self.base_url, api_key=self.api_key, async_clients=async_clients
+        )
+
+    def _batch_items(
         self,
-        images: List[Image.Image],
-        prompt_mode: str = "layout",
-        prompt: str | None = None,
-    ) -> List[PageResultDict]:
+        images: Iterable[Image.Image],
+        prompt_mode: str,
+        prompt: str | None,
+        priority: str | None = None,
+        tenant: str | None = None,
+    ) -> Iterator[BatchInputItem]:
         prompt_type = PROMPT_MODE_MAP.get(prompt_mode, prompt_mode)
-
-        batch = [
-            BatchInputItem(
+        images = iter(images)
+        while True:
+            # Lazily rendered pages are produced here, so this times the rendering
+            start = time.perf_counter()
+            img = next(images, None)
+            if img is None:
+                return
+            self.pages_in_flight += 1
+            yield BatchInputItem(
                 image=img,
                 prompt=prompt,
                 prompt_type=prompt_type if not prompt else None,
+                render_time=time.perf_counter() - start,
+                # Custom prompts always go to the model
+                text_layer=img.info.get(TEXT_LAYER_KEY) if not prompt else None,
+                priority=priority,
+                tenant=tenant,
+            )
+
+    def _finish_page(self, page: PageResultDict) -> PageResultDict:
+        self.pages_in_flight -= 1
+        if self.metrics_hooks:
+            emit(self.metrics_hooks, PageMetrics(**page["metrics"]))
+        return page
+
+    def _page_result(
+        self, page_no: int, image: Image.Image, result: GenerationResult
+    ) -> PageResultDict:
+        return _page_result(*self._page_args(page_no, image, result))
+
+    def _submit_page_result(
+        self,
+        executor: Executor,
+        page_no: int,
+        image: Image.Image,
+        result: GenerationResult,
+    ) -> Future:
+        return executor.submit(_page_result, *self._page_args(page_no, image, result))
+
+    def _page_args(
+        self, page_no: int, image: Image.Image, result: GenerationResult
+    ) -> tuple:
+        # Only the image size is sent, so pixels never cross the process boundary
+        return (
+            page_no,
+            image.size,
+            result.raw,
+            self.include_headers_footers,
+            self.html_parser,
+            result.token_count,
+            result.retries,
+            asdict(result.metrics),
+        )
+
+    def _postprocess_executor(self) -> ProcessPoolExecutor | None:
+        """Process pool for HTML post-processing, started on first use; None when disabled."""
+        if self.postprocess_workers <= 0:
+            return None
+        if self._postprocess_pool is None:
+            self._postprocess_pool = ProcessPoolExecutor(
+                max_workers=self.postprocess_workers,
+                mp_context=multiprocessing.get_context("spawn"),
             )
-            for img in images
-        ]
+        return self._postprocess_pool
+
+    def _shutdown_postprocess_pool(self):
+        if self._postprocess_pool is not None:
+            self._postprocess_pool.shutdown(wait=False, cancel_futures=True)
+            self._postprocess_pool = None
 
-        results = generate_vllm(
-            batch,
+    def _load_config(self, page_range: str | None) -> dict:
+        return {
+            "page_range": page_range,
+            "image_dpi": self.image_dpi,
+            "min_image_dim": self.min_image_dim,
+            "render_workers": self.render_workers,
+            # Regions are cut from the rendered page, so splitting needs the full-DPI render
+            "render_at_target": self.render_at_target and self.region_splitter is None,
+            "text_layer": self.text_layer,
+        }
+
+
+class ChandraOCRClient(_ChandraClientBase):
+    """High-level client for Chandra OCR vLLM API."""
+
+    def _create_client(self) -> OpenAI | EndpointPool:
+        if not isinstance(self.base_url, str):
+            return self._endpoint_pool(async_clients=False)
+        # Retries are handled by the retry policy, so the SDK must not retry on its own
+        return OpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+
+    def iter_images(
+        self,
+        images: Iterable[Image.Image],
+        prompt_mode: str = "layout",
+        prompt: str | None = None,
+        ordered: bool = True,
+        window_size: int | None = None,
+        priority: str | None = None,
+        tenant: str | None = None,
+    ) -> Iterator[PageResultDict]:
+        """
+        Stream page results for an iterable of images.
+
+        Images are consumed lazily, keeping at most `window_size` pages (default: twice
+        `num_threads`) in memory. Results are yielded in page order, or as soon as each
+        page completes when `ordered=False`; `page_no` always refers to the input position.
+
+        With a `scheduler`, the pages' requests are queued under the `priority` class and
+        `tenant` given here (the scheduler's defaults if None).
+        """
+        results = self._iter_results(
+            images, prompt_mode, prompt, ordered, window_size, priority, tenant
+        )
+        for page, _, _ in results:
+            yield page
+
+    def _iter_results(
+        self,
+        images: Iterable[Image.Image],
+        prompt_mode: str,
+        prompt: str | None,
+        ordered: bool,
+        window_size: int | None,
+        priority: str | None = None,
+        tenant: str | None = None,
+    ) -> Iterator[Tuple[PageResultDict, BatchInputItem, GenerationResult]]:
+        """`iter_images`, also yielding each page's input item and generation result."""
+        pool = self._postprocess_executor()
+        # An adaptive limiter sizes the pool to its ceiling and gates requests itself
+        max_workers = self.limiter.max_limit if self.limiter else self.num_threads
+        if window_size is None:
+            window_size = max_workers * 2
+        # Pages taken from `images` and pages handed back, so that pages which never come
+        # back (after an error, or when the consumer stops early) leave `pages_in_flight`
+        pulled = delivered = 0
+
+        def items() -> Iterator[BatchInputItem]:
+            nonlocal pulled
+            for item in self._batch_items(
+                images, prompt_mode, prompt, priority, tenant
+            ):
+                pulled += 1
+                yield item
+
+        results = generate_vllm_iter(
+            items(),
             client=self.client,
             model_name=self.model_name,
             max_output_tokens=self.max_tokens,
             max_retries=self.max_retries,
-            max_workers=self.num_threads,
+            max_workers=max_workers,
             temperature=self.temperature,
             top_p=self.top_p,
+            window_size=window_size,
+            ordered=ordered,
+            payload_config=self.payload_config,
+            cache=self.cache,
+            stream=self.stream,
+            limiter=self.limiter,
+            retry_policy=self.retry_policy,
+            hedging=self.hedging,
+            page_filter=self.page_filter,
+            region_splitter=self.region_splitter,
+            scheduler=self.scheduler,
         )
+        try:
+            # Close the generator explicitly so an error here stops its in-flight work
+            # right away
+            with closing(results):
+                if pool is None:
+                    for idx, input_item, result in results:
+                        page = self._finish_page(
+                            self._page_result(idx, input_item.image, result)
+                        )
+                        delivered += 1
+                        yield page, input_item, result
+                else:
+                    with closing(
+                        self._postprocess_in_pool(pool, results, ordered, window_size)
+                    ) as pages:
+                        for output in pages:
+                            delivered += 1
+                            yield output
+        finally:
+            self.pages_in_flight -= pulled - delivered
 
-        pages = []
-        for idx, (result, input_item) in enumerate(zip(results, batch)):
-            chunks = parse_chunks(result.raw, input_item.image)
-            raw_html = result.raw
-
-            page_result: PageResultDict = {
-                "page_no": idx,
-                "input_width": input_item.image.width,
-                "input_height": input_item.image.height,
-                "cells": [
-                    {
-                        "bbox": c["bbox"],
-                        "category": c["label"],
-                        "text": extract_text_from_cell(c["label"], c["content"]),
-                    }
-                    for c in chunks
-                ],
-                "md_content": parse_markdown(
-                    raw_html,
-                    include_headers_footers=self.include_headers_footers
-                ),
-            }
-            pages.append(page_result)
+    def _postprocess_in_pool(
+        self,
+        pool: ProcessPoolExecutor,
+        results: Iterator[Tuple[int, BatchInputItem, GenerationResult]],
+        ordered: bool,
+        window_size: int,
+    ) -> Iterator[Tuple[PageResultDict, BatchInputItem, GenerationResult]]:
+        """
+        Parse pages in `pool` as they come out of generation, which is in page order when
+        `ordered`. No more results are pulled while `window_size` pages are being parsed.
+        """
+        pending = {}
+        next_idx = 0
 
-        return pages
+        def pop(idx: int):
+            nonlocal next_idx
+            next_idx = idx + 1
+            future, input_item, result = pending.pop(idx)
+            return self._finish_page(future.result()), input_item, result
+
+        def ready() -> List[int]:
+            if not ordered:
+                return [i for i, p in pending.items() if p[0].done()]
+            # Pages arrive in order, so the earliest pending one is always next
+            idx = next_idx
+            while idx in pending and pending[idx][0].done():
+                idx += 1
+            return list(range(next_idx, idx))
+
+        def wait_for_page():
+            if ordered:
+                wait([pending[next_idx][0]])
+            else:
+                wait([p[0] for p in pending.values()], return_when=FIRST_COMPLETED)
+
+        try:
+            for idx, input_item, result in results:
+                future = self._submit_page_result(pool, idx, input_item.image, result)
+                pending[idx] = (future, input_item, result)
+                for done_idx in ready():
+                    yield pop(done_idx)
+                while len(pending) >= window_size:
+                    wait_for_page()
+                    for done_idx in ready():
+                        yield pop(done_idx)
+
+            while pending:
+                wait_for_page()
+                for done_idx in ready():
+                    yield pop(done_idx)
+        finally:
+            for future, _, _ in pending.values():
+                future.cancel()
+
+    def parse_images(
+        self,
+        images: List[Image.Image],
+        prompt_mode: str = "layout",
+        prompt: str | None = None,
+        priority: str | None = None,
+        tenant: str | None = None,
+    ) -> List[PageResultDict]:
+        return list(
+            self.iter_images(
+                images,
+                prompt_mode,
+                prompt,
+                window_size=len(images),
+                priority=priority,
+                tenant=tenant,
+            )
+        )
 
     def parse_image(
         self,
         image: Image.Image,
         prompt_mode: str = "layout",
         prompt: str | None = None,
+        priority: str | None = None,
+        tenant: str | None = None,
     ) -> PageResultDict:
-        return self.parse_images([image], prompt_mode, prompt)[0]
+        return self.parse_images([image], prompt_mode, prompt, priority, tenant)[0]
+
+    def parse_file_iter(
+        self,
+        path: DocumentSource,
+        prompt_mode: str = "layout",
+        prompt: str | None = None,
+        page_range: str | None = None,
+        ordered: bool = True,
+        window_size: int | None = None,
+        priority: str | None = None,
+        tenant: str | None = None,
+    ) -> Iterator[PageResultDict]:
+        """
+        Stream page results for a file.
+
+        `path` can also be the document itself, already in memory: `bytes`,
+        `bytearray`, `memoryview`, `mmap` or a binary file object. PDFs are read from
+        the buffer in place (see `chandra.input.open_pdf`), without a temporary file.
+        Pages are rendered on demand, so peak memory is bounded by `window_size`
+        rather than by the page count.
+        """
+        images = iter_file(path, self._load_config(page_range))
+        yield from self.iter_images(
+            images, prompt_mode, prompt, ordered, window_size, priority, tenant
+        )
 
     def parse_file(
         self,
-        path: str,
+        path: DocumentSource,
         prompt_mode: str = "layout",
         prompt: str | None = None,
         page_range: str | None = None,
+        priority: str | None = None,
+        tenant: str | None = None,
     ) -> List[PageResultDict]:
-        config = {
-            "page_range": page_range,
-            "image_dpi": self.image_dpi,
-            "min_image_dim": self.min_image_dim,
-        }
-        images = load_file(path, config)
-        return self.parse_images(images, prompt_mode, prompt)
+        return list(
+            self.parse_file_iter(
+                path, prompt_mode, prompt, page_range, priority=priority, tenant=tenant
+            )
+        )
+
+    def parse_many(
+        self,
+        paths: Iterable[DocumentSource],
+        prompt_mode: str = "layout",
+        prompt: str | None = None,
+        page_range: str | None = None,
+        window_size: int | None = None,
+        extract_images: bool = False,
+        priority: str | None = None,
+        tenant: str | None = None,
+    ) -> Iterator[DocumentResultDict]:
+        """
+        Parse many files through one shared, bounded page queue.
+
+        Pages from consecutive documents are rendered, generated and post-processed
+        back to back, with at most `window_size` pages in flight across all documents.
+        Each document is yielded once all of its pages are done, so documents can finish
+        out of order. A file that fails to load is yielded with `error` set and no pages,
+        without affecting the rest of the batch. Entries can be in-memory documents as
+        in `parse_file_iter`; their `path` is the file object's name or `<document N>`. With `extract_images`, each page also
+        gets an `images` dict of cropped Image/Figure blocks keyed by file name.
+        """
+        config = self._load_config(page_range)
+        render_pool = None
+        if self.render_workers > 1:
+            # One pool for the whole batch, so each file skips starting worker processes
+            render_pool = render_executor(self.render_workers)
+            config["render_executor"] = render_pool
+        documents: List[_DocumentState] = []
+        # Position in the shared page queue -> (document, page number)
+        page_owners: dict[int, Tuple[_DocumentState, int]] = {}
+        queue_positions = itertools.count()
+
+        def images() -> Iterator[Image.Image]:
+            for index, path in enumerate(paths):
+                document = _DocumentState(source_name(path, index))
+                documents.append(document)
+                try:
+                    for page_no, image in enumerate(iter_file(path, config)):
+                        page_owners[next(queue_positions)] = (document, page_no)
+                        document.submitted += 1
+                        yield image
+                except Exception as e:
+                    logger.error("Error loading %s: %s", document.path, e)
+                    document.error = str(e)
+                document.loaded = True
+
+        def finished() -> Iterator[DocumentResultDict]:
+            for document in [d for d in documents if d.complete]:
+                documents.remove(document)
+                yield document.result()
+
+        results = self._iter_results(
+            images(),
+            prompt_mode,
+            prompt,
+            ordered=False,
+            window_size=window_size,
+            priority=priority,
+            tenant=tenant,
+        )
+        try:
+            with closing(results):
+                for page, item, result in results:
+                    document, page_no = page_owners.pop(page["page_no"])
+                    page = {**page, "page_no": page_no}
+                    if extract_images:
+                        page["images"] = self._page_images(page, item.image, result)
+                    document.pages.append(page)
+                    yield from finished()
+            yield from finished()
+        finally:
+            if render_pool is not None:
+                render_pool.shutdown(wait=False, cancel_futures=True)
+
+    def _page_images(
+        self, page: PageResultDict, image: Image.Image, result: GenerationResult
+    ) -> dict[str, Image.Image]:
+        # Only pages with image blocks need their layout again
+        if not any(cell["category"] in ("Image", "Figure") for cell in page["cells"]):
+            return {}
+        chunks = parse_page(result.raw, image.size, parser=self.html_parser).chunks
+        return crop_images(result.raw, chunks, image)
+
+    def close(self):
+        self.client.close()
+        self._shutdown_postprocess_pool()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncChandraOCRClient(_ChandraClientBase):
+    """
+    Asyncio client for Chandra OCR vLLM API, built on `AsyncOpenAI`.
+
+    Takes the same options as `ChandraOCRClient`. Up to `max_concurrency` pages are in
+    flight at once; rendering and HTML parsing run on `executor` (by default a thread
+    pool with `num_threads` workers) so the event loop is never blocked. Each page is
+    parsed as soon as its generation finishes, in the post-processing process pool when
+    `postprocess_workers > 0`.
+    """
+
+    def __init__(
+        self,
+        *args,
+        max_concurrency: int = 64,
+        executor: Executor | None = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.max_concurrency = max_concurrency
+        self._owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=self.num_threads)
+
+    def _create_client(self) -> AsyncOpenAI | EndpointPool:
+        if not isinstance(self.base_url, str):
+            return self._endpoint_pool(async_clients=True)
+        return AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+
+    async def close(self):
+        if isinstance(self.client, EndpointPool):
+            await self.client.aclose()
+        else:
+            await self.client.close()
+        self._shutdown_postprocess_pool()
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def parse_images(
+        self,
+        images: List[Image.Image],
+        prompt_mode: str = "layout",
+        prompt: str | None = None,
+        priority: str | None = None,
+        tenant: str | None = None,
+    ) -> List[PageResultDict]:
+        return await self._parse_batch(
+            list(self._batch_items(images, prompt_mode, prompt, priority, tenant))
+        )
+
+    async def _parse_batch(self, batch: List[BatchInputItem]) -> List[PageResultDict]:
+        postprocess_executor = self._postprocess_executor() or self.executor
+        pages: List[PageResultDict | None] = [None] * len(batch)
+
+        async def on_result(
+            idx: int, item: BatchInputItem, result: GenerationResult
+        ) -> None:
+            pages[idx] = self._finish_page(
+                await asyncio.wrap_future(
+                    self._submit_page_result(
+                        postprocess_executor, idx, item.image, result
+                    )
+                )
+            )
+
+        try:
+            await generate_vllm_async(
+                batch,
+                client=self.client,
+                model_name=self.model_name,
+                max_output_tokens=self.max_tokens,
+                max_retries=self.max_retries,
+                max_concurrency=self.max_concurrency,
+                temperature=self.temperature,
+                top_p=self.top_p,
+                executor=self.executor,
+                payload_config=self.payload_config,
+                cache=self.cache,
+                stream=self.stream,
+                limiter=self.limiter,
+                retry_policy=self.retry_policy,
+                hedging=self.hedging,
+                on_result=on_result,
+                page_filter=self.page_filter,
+                region_splitter=self.region_splitter,
+                scheduler=self.scheduler,
+            )
+        finally:
+            # Pages whose results never arrived, after an error or a cancellation
+            self.pages_in_flight -= sum(page is None for page in pages)
+        return pages
+
+    async def parse_image(
+        self,
+        image: Image.Image,
+        prompt_mode: str = "layout",
+        prompt: str | None = None,
+        priority: str | None = None,
+        tenant: str | None = None,
+    ) -> PageResultDict:
+        return (
+            await self.parse_images([image], prompt_mode, prompt, priority, tenant)
+        )[0]
+
+    async def parse_file(
+        self,
+        path: DocumentSource,
+        prompt_mode: str = "layout",
+        prompt: str | None = None,
+        page_range: str | None = None,
+        priority: str | None = None,
+        tenant: str | None = None,
+    ) -> List[PageResultDict]:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        images = await loop.run_in_executor(
+            self.executor, load_file, path, self._load_config(page_range)
+        )
+        # Pages are loaded together, so the load time is split evenly between them
+        render_time = (time.perf_counter() - start) / max(1, len(images))
+        batch = list(self._batch_items(images, prompt_mode, prompt, priority, tenant))
+        for item in batch:
+            item.render_time = render_time
+        return await self._parse_batch(batch)
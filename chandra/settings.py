@@ -1,24 +1,62 @@
-from dotenv import find_dotenv
-from pydantic_settings import BaseSettings
 import os
+from functools import lru_cache
 
 
-class Settings(BaseSettings):
-    # Paths
-    BASE_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    IMAGE_DPI: int = 200
-    MIN_IMAGE_DIM: int = 1024
-    MAX_OUTPUT_TOKENS: int = 8192
+@lru_cache(maxsize=None)
+def _settings_class():
+    # pydantic-settings and the local.env lookup are only paid for on first use
+    from dotenv import find_dotenv
+    from pydantic_settings import BaseSettings
 
-    # vLLM server settings
-    VLLM_API_KEY: str = ""
-    VLLM_API_BASE: str = "http://localhost:8000/v1"
-    VLLM_MODEL_NAME: str = "chandra"
-    MAX_VLLM_RETRIES: int = 6
+    class Settings(BaseSettings):
+        # Paths
+        BASE_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        IMAGE_DPI: int = 200
+        MIN_IMAGE_DIM: int = 1024
+        MAX_OUTPUT_TOKENS: int = 8192
 
-    class Config:
-        env_file = find_dotenv("local.env")
-        extra = "ignore"
+        # vLLM server settings
+        VLLM_API_KEY: str = ""
+        VLLM_API_BASE: str = "http://localhost:8000/v1"
+        VLLM_MODEL_NAME: str = "chandra"
+        MAX_VLLM_RETRIES: int = 6
 
+        class Config:
+            env_file = find_dotenv("local.env")
+            extra = "ignore"
 
-settings = Settings()
+    return Settings
+
+
+class _LazySettings:
+    """Stands in for the `Settings` instance, which is created on first attribute access."""
+
+    def __init__(self):
+        object.__setattr__(self, "_instance", None)
+
+    def _load(self):
+        if self._instance is None:
+            object.__setattr__(self, "_instance", _settings_class()())
+        return self._instance
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __repr__(self):
+        return repr(self._load())
+
+
+settings = _LazySettings()
+
+
+def __getattr__(name):
+    if name == "Settings":
+        return _settings_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,285 @@
+"""
+Hybrid mode: pages of born-digital PDFs with a good embedded text layer are turned into
+Chandra-style layout HTML straight from the text layer, without OCR.
+"""
+
+import ctypes
+import html
+import logging
+import math
+from dataclasses import dataclass
+from statistics import median
+from typing import List, NamedTuple, Tuple
+
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
+from PIL import Image, ImageChops, ImageDraw
+
+logger = logging.getLogger(__name__)
+
+# Key in a rendered page's `Image.info` holding the layout HTML built from its text layer
+TEXT_LAYER_KEY = "text_layer"
+
+
+@dataclass
+class TextLayerConfig:
+    """
+    Thresholds a page's text layer must meet to be used instead of OCR.
+
+    - `min_chars`: visible, non-whitespace characters; invisible text (such as the OCR
+      layer of a scanned PDF) does not count.
+    - `min_unicode_ratio`: share of those characters whose glyphs map to real Unicode
+      text, so fonts without a usable ToUnicode map fall back to OCR.
+    - `min_coverage`: share of the rendered page's ink that lies inside character boxes.
+      Figures, scanned images, drawn tables and handwriting lower it.
+    """
+
+    min_chars: int = 100
+    min_unicode_ratio: float = 0.98
+    min_coverage: float = 0.9
+    # Rendered pixels darker than this count as ink
+    ink_threshold: int = 200
+    # Longest side of the thumbnail coverage is measured on
+    thumbnail_size: int = 512
+
+
+@dataclass
+class TextLayerScore:
+    chars: int
+    unicode_ratio: float
+    coverage: float
+
+    def passes(self, config: TextLayerConfig) -> bool:
+        return (
+            self.chars >= config.min_chars
+            and self.unicode_ratio >= config.min_unicode_ratio
+            and self.coverage >= config.min_coverage
+        )
+
+
+class _Char(NamedTuple):
+    text: str
+    # (x0, y0, x1, y1) as fractions of the rendered page, origin at the top left
+    box: Tuple[float, float, float, float]
+    size: float
+    hyphen: bool
+
+
+def _page_transform(page: pdfium.PdfPage):
+    """Map PDF user-space points to fractions of the rendered (cropped, rotated) page."""
+    left, bottom, right, top = page.get_cropbox()
+    width, height = right - left, top - bottom
+    rotation = page.get_rotation()
+
+    def transform(x: float, y: float) -> Tuple[float, float]:
+        u, v = (x - left) / width, (top - y) / height
+        if rotation == 90:
+            return 1 - v, u
+        if rotation == 180:
+            return 1 - u, 1 - v
+        if rotation == 270:
+            return v, 1 - u
+        return u, v
+
+    return transform
+
+
+def _is_mapped(codepoint: int, textpage, index: int) -> bool:
+    if codepoint in (0, 0xFFFD) or 0xE000 <= codepoint <= 0xF8FF:
+        return False
+    return chr(codepoint).isprintable() and not pdfium_c.FPDFText_HasUnicodeMapError(
+        textpage, index
+    )
+
+
+def _read_chars(page: pdfium.PdfPage) -> Tuple[List[_Char | None], int, int]:
+    """
+    Visible characters in reading order, with None marking line breaks, plus the number
+    of non-whitespace characters and how many of them map to Unicode.
+    """
+    transform = _page_transform(page)
+    textpage = page.get_textpage()
+    raw = textpage.raw
+    left, right, bottom, top = (ctypes.c_double() for _ in range(4))
+    chars: List[_Char | None] = []
+    counted = mapped = 0
+    try:
+        for index in range(textpage.count_chars()):
+            codepoint = pdfium_c.FPDFText_GetUnicode(raw, index)
+            text = chr(codepoint) if codepoint else ""
+            if text in ("\r", "\n"):
+                if chars and chars[-1] is not None:
+                    chars.append(None)
+                continue
+            obj = pdfium_c.FPDFText_GetTextObject(raw, index)
+            if (
+                obj
+                and pdfium_c.FPDFTextObj_GetTextRenderMode(obj)
+                == pdfium_c.FPDF_TEXTRENDERMODE_INVISIBLE
+            ):
+                continue
+            if text.isspace():
+                chars.append(_Char(" ", (0, 0, 0, 0), 0.0, False))
+                continue
+            counted += 1
+            mapped += _is_mapped(codepoint, raw, index)
+            pdfium_c.FPDFText_GetCharBox(raw, index, left, right, bottom, top)
+            x0, y0 = transform(left.value, top.value)
+            x1, y1 = transform(right.value, bottom.value)
+            box = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+            chars.append(
+                _Char(
+                    text,
+                    box,
+                    pdfium_c.FPDFText_GetFontSize(raw, index),
+                    pdfium_c.FPDFText_IsHyphen(raw, index) == 1,
+                )
+            )
+    finally:
+        textpage.close()
+    return chars, counted, mapped
+
+
+def _coverage(chars: List[_Char], image: Image.Image, config: TextLayerConfig) -> float:
+    """Share of the page's ink that falls inside (slightly grown) character boxes."""
+    scale = min(1.0, config.thumbnail_size / max(image.size))
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    ink = (
+        image.resize(size, Image.BOX)
+        .convert("L")
+        .point(lambda v: 255 if v < config.ink_threshold else 0)
+    )
+    ink_pixels = ink.histogram()[255]
+    # Near-empty pages are judged on their character count alone
+    if ink_pixels <= 0.0005 * size[0] * size[1]:
+        return 1.0
+
+    boxes = Image.new("L", size, 0)
+    draw = ImageDraw.Draw(boxes)
+    for char in chars:
+        x0, y0, x1, y1 = char.box
+        if x1 > x0:
+            draw.rectangle(
+                (
+                    x0 * size[0] - 1,
+                    y0 * size[1] - 1,
+                    x1 * size[0] + 1,
+                    y1 * size[1] + 1,
+                ),
+                fill=255,
+            )
+    return ImageChops.multiply(ink, boxes).histogram()[255] / ink_pixels
+
+
+class _Line(NamedTuple):
+    text: str
+    box: Tuple[float, float, float, float]
+    size: float
+    hyphenated: bool
+
+
+def _union(boxes) -> Tuple[float, float, float, float]:
+    boxes = list(boxes)
+    return (
+        min(b[0] for b in boxes),
+        min(b[1] for b in boxes),
+        max(b[2] for b in boxes),
+        max(b[3] for b in boxes),
+    )
+
+
+def _lines(chars: List[_Char | None]) -> List[_Line]:
+    lines = []
+    current: List[_Char] = []
+    for char in chars + [None]:
+        if char is not None:
+            current.append(char)
+            continue
+        glyphs = [c for c in current if c.text != " "]
+        if glyphs:
+            hyphenated = glyphs[-1].hyphen
+            text = "".join(c.text for c in current).strip()
+            if hyphenated:
+                text = text.rstrip("-\u00ad")
+            box = _union(c.box for c in glyphs)
+            lines.append(_Line(text, box, median(c.size for c in glyphs), hyphenated))
+        current = []
+    return lines
+
+
+def _starts_block(previous: _Line, line: _Line) -> bool:
+    height = max(previous.box[3] - previous.box[1], line.box[3] - line.box[1])
+    gap = line.box[1] - previous.box[3]
+    overlaps = line.box[0] < previous.box[2] and previous.box[0] < line.box[2]
+    same_size = abs(line.size - previous.size) <= 0.15 * max(previous.size, line.size)
+    # A line above the previous one starts a new column
+    return gap > 0.6 * height or gap < -0.5 * height or not overlaps or not same_size
+
+
+def _block_html(lines: List[_Line], body_size: float) -> str:
+    text = lines[0].text
+    for previous, line in zip(lines, lines[1:]):
+        # A word split by a hyphen at the end of the line is joined back up
+        text += line.text if previous.hyphenated else " " + line.text
+    box = _union(line.box for line in lines)
+    bbox = [
+        math.floor(box[0] * 1024),
+        math.floor(box[1] * 1024),
+        math.ceil(box[2] * 1024),
+        math.ceil(box[3] * 1024),
+    ]
+    size = median(line.size for line in lines)
+    label, tag = "Text", "p"
+    if len(lines) <= 2 and box[3] < 0.08:
+        label = "Page-Header"
+    elif len(lines) <= 2 and box[1] > 0.92:
+        label = "Page-Footer"
+    elif len(lines) <= 3 and size >= 1.2 * body_size:
+        label, tag = "Section-Header", "h2"
+    return f'<div data-bbox="{bbox}" data-label="{label}"><{tag}>{html.escape(text)}</{tag}></div>'
+
+
+def layout_html(lines: List[_Line]) -> str:
+    """Chandra layout HTML for the text lines of a page, bboxes in 0-1024 page space."""
+    if not lines:
+        return ""
+    body_size = median(line.size for line in lines)
+    blocks = [[lines[0]]]
+    for previous, line in zip(lines, lines[1:]):
+        if _starts_block(previous, line):
+            blocks.append([])
+        blocks[-1].append(line)
+    return "".join(_block_html(block, body_size) for block in blocks)
+
+
+def read_text_layer(
+    page: pdfium.PdfPage, image: Image.Image, config: TextLayerConfig
+) -> Tuple[TextLayerScore, str | None]:
+    """Score a page's text layer against its rendered `image`; the layout HTML if it passes."""
+    chars, counted, mapped = _read_chars(page)
+    glyphs = [char for char in chars if char is not None and char.text != " "]
+    score = TextLayerScore(
+        chars=counted,
+        unicode_ratio=mapped / counted if counted else 0.0,
+        coverage=_coverage(glyphs, image, config)
+        if counted >= config.min_chars
+        else 0.0,
+    )
+    if not score.passes(config):
+        return score, None
+    return score, layout_html(_lines(chars))
+
+
+def attach_text_layer(
+    doc: pdfium.PdfDocument, page: int, image: Image.Image, config: TextLayerConfig
+) -> Image.Image:
+    """Store the page's text-layer HTML in `image.info` when the text layer is good enough."""
+    try:
+        score, layout = read_text_layer(doc[page], image, config)
+    except pdfium.PdfiumError as e:
+        logger.warning("Could not read the text layer of page %d: %s", page, e)
+        return image
+    logger.debug("Page %d text layer: %s", page, score)
+    if layout is not None:
+        image.info[TEXT_LAYER_KEY] = layout
+    return image
@@ -1,3 +1,10 @@
+import json
+import select
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import pytest
 from PIL import Image, ImageDraw
 
@@ -8,3 +15,158 @@ def simple_text_image() -> Image.Image:
     draw = ImageDraw.Draw(image)
     draw.text((50, 50), "Hello, World!", fill="black", font_size=32)
     return image
+
+
+STUB_RAW = '<div data-bbox="[0, 0, 500, 100]" data-label="Text"><p>Stub page.</p></div>'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible chat completions endpoint answering with `server.raw`."""
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.server.failing:
+            return self._send(503, {"error": "unavailable"})
+        self._send(
+            200, {"object": "list", "data": [{"id": "chandra", "object": "model"}]}
+        )
+
+    def _stream_headers(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        self.wfile.flush()
+
+    def _stream(self, raw: str):
+        # Server-sent events, one chunk per 8 characters, then usage and [DONE]
+        chunks = [
+            {"choices": [{"index": 0, "delta": {"content": raw[i : i + 8]}}]}
+            for i in range(0, len(raw), 8)
+        ]
+        usage = {
+            "prompt_tokens": 1,
+            "completion_tokens": len(chunks),
+            "total_tokens": 0,
+        }
+        chunks.append({"choices": [], "usage": usage})
+        body = {
+            "id": "stub",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "chandra",
+        }
+        try:
+            for chunk in chunks:
+                self.wfile.write(f"data: {json.dumps({**body, **chunk})}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early
+            pass
+
+    def _client_hung_up(self) -> bool:
+        # The request body has been read, so anything readable now is the end of the stream
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        return bool(readable) and self.connection.recv(1, socket.MSG_PEEK) == b""
+
+    def _hold(self) -> bool:
+        """Wait for `server.release`; False if the client hung up first."""
+        while not self.server.release.wait(0.005):
+            if self._client_hung_up():
+                with self.server.lock:
+                    self.server.hung_up += 1
+                return False
+        return True
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.active += 1
+            overloaded = (
+                server.max_active is not None and server.active > server.max_active
+            )
+        try:
+            if server.failing:
+                return self._send(500, {"error": "boom"})
+            if server.error_status is not None:
+                return self._send(server.error_status, {"error": "rejected"})
+            if overloaded:
+                server.rejected += 1
+                return self._send(429, {"error": "too many requests"})
+            time.sleep(server.delay)
+            held = server.hold is not None and server.hold(request)
+            if request.get("stream"):
+                self._stream_headers()
+                if held and not self._hold():
+                    return
+                return self._stream(server.raw)
+            if held and not self._hold():
+                return
+            self._send(
+                200,
+                {
+                    "id": "stub",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": "chandra",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": server.raw},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 1,
+                        "completion_tokens": 5,
+                        "total_tokens": 6,
+                    },
+                },
+            )
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+@pytest.fixture
+def stub_servers():
+    """Two local stub vLLM servers; tweak `failing`, `error_status`, `delay`, `raw`, `max_active` and `hold` per test."""
+    servers = []
+    for _ in range(2):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        server.lock = threading.Lock()
+        server.failing = False
+        # Status returned to every completion request, e.g. 400 for a permanent error
+        server.error_status = None
+        server.delay = 0.01
+        server.raw = STUB_RAW
+        # Answer 429 while more than `max_active` requests are being served
+        server.max_active = None
+        # Called with each request body; requests it returns True for get no answer (beyond
+        # stream headers) until `release` is set, or until the client hangs up, which is
+        # counted in `hung_up`
+        server.hold = None
+        server.release = threading.Event()
+        server.hung_up = 0
+        server.requests = 0
+        server.active = 0
+        server.rejected = 0
+        server.url = f"http://127.0.0.1:{server.server_port}"
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    yield servers
+    for server in servers:
+        server.release.set()
+        server.shutdown()
+        server.server_close()
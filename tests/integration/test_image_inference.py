@@ -1,8 +1,24 @@
+import urllib.request
+
+import pytest
+
 from chandra.model import InferenceManager, BatchInputItem
+from chandra.settings import settings
+
+
+def server_available() -> bool:
+    try:
+        with urllib.request.urlopen(f"{settings.VLLM_API_BASE}/models", timeout=2):
+            return True
+    except OSError:
+        return False
 
 
+@pytest.mark.skipif(
+    not server_available(), reason=f"no Chandra vLLM server at {settings.VLLM_API_BASE}"
+)
 def test_inference_image(simple_text_image):
-    manager = InferenceManager(method="hf")
+    manager = InferenceManager(method="vllm")
     batch = [
         BatchInputItem(
             image=simple_text_image,
@@ -0,0 +1,142 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from chandra.model.cache import ResultCache
+from chandra.model.schema import GenerationResult
+from chandra.parser import ChandraOCRClient
+
+
+def result(raw: str, **kwargs) -> GenerationResult:
+    return GenerationResult(raw=raw, token_count=len(raw), **kwargs)
+
+
+def test_hits_misses_and_lru_eviction(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResultCache(path, max_bytes=3 * (1 + 100))
+    computed = []
+
+    def compute(key):
+        computed.append(key)
+        return result(key * 100), True
+
+    for key in "abc":
+        assert not cache.get_or_compute(key, lambda: compute(key)).cached
+    hit = cache.get_or_compute("a", lambda: compute("a"))
+    assert hit.cached and hit.raw == "a" * 100
+    assert computed == ["a", "b", "c"]
+
+    # "b" is now the least recently used entry
+    time.sleep(0.01)
+    cache.get_or_compute("d", lambda: compute("d"))
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.evictions) == (1, 4, 1)
+    assert (stats.entries, stats.size_bytes) == (3, 3 * 101)
+    assert cache.get("b") is None and cache.get("a") is not None
+    cache.close()
+
+    # The running totals pick up where the file left off
+    reopened = ResultCache(path, max_bytes=3 * 101)
+    assert (reopened.stats().entries, reopened.stats().size_bytes) == (3, 3 * 101)
+    reopened.put("a", result("a" * 50))
+    assert reopened.stats().size_bytes == 2 * 101 + 51
+    reopened.close()
+
+
+def run_concurrently(cache, compute, n: int):
+    """Call `get_or_compute` from `n` threads, the first owning the key while the rest wait."""
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def owner_compute():
+        calls.append(None)
+        if len(calls) == 1:
+            started.set()
+            release.wait(5)
+        return compute()
+
+    results = [None] * n
+
+    def call(i):
+        try:
+            results[i] = cache.get_or_compute("key", owner_compute)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while cache.coalesced < n - 1:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return results, len(calls)
+
+
+def test_concurrent_requests_share_one_computation(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+    results, calls = run_concurrently(cache, lambda: (result("<p>page</p>"), True), 4)
+    assert calls == 1
+    assert [r.cached for r in results] == [False, True, True, True]
+    assert all(r.raw == "<p>page</p>" for r in results)
+    assert cache.stats().coalesced == 3
+
+
+@pytest.mark.parametrize(
+    "outcome",
+    [result("", error=True), result("<p>loop loop", aborted=True)],
+    ids=["error", "degenerate"],
+)
+def test_failed_results_are_neither_cached_nor_shared(tmp_path, outcome):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+    results, calls = run_concurrently(cache, lambda: (outcome, False), 3)
+    # Every waiter makes its own attempt instead of taking the owner's failure as a hit
+    assert calls == 3
+    assert not any(r.cached for r in results)
+    assert cache.stats().entries == 0
+
+
+def test_waiters_recompute_after_the_owner_raises(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+    attempts = []
+
+    def compute():
+        attempts.append(None)
+        if len(attempts) == 1:
+            raise RuntimeError("boom")
+        return result("<p>page</p>"), True
+
+    (error, *results), calls = run_concurrently(cache, compute, 3)
+    assert isinstance(error, RuntimeError)
+    # One waiter takes over the key, the other gets its result
+    assert calls == 2
+    assert sorted(r.cached for r in results) == [False, True]
+
+
+def test_client_skips_errors_and_leaves_cache_open(tmp_path, stub_servers):
+    server = stub_servers[0]
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+    image = Image.new("RGB", (200, 100), "white")
+    with ChandraOCRClient(base_url=server.url, cache=cache, max_retries=0) as client:
+        server.error_status = 400
+        assert client.parse_image(image)["md_content"] == ""
+        assert cache.stats().entries == 0
+
+        server.error_status = None
+        assert not client.parse_image(image)["metrics"]["cached"]
+        assert client.parse_image(image)["metrics"]["cached"]
+        assert server.requests == 2
+
+    # The cache is the caller's: a second client picks up where the first left off
+    with ChandraOCRClient(base_url=server.url, cache=cache) as client:
+        assert client.parse_image(image)["metrics"]["cached"]
+    assert server.requests == 2 and cache.stats().hits == 2
+    cache.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        cache.get("key")
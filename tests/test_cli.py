@@ -0,0 +1,83 @@
+import json
+
+from click.testing import CliRunner
+from PIL import Image
+
+from chandra.cli import expand_inputs, main, parse_endpoint
+
+FIGURE_RAW = (
+    '<div data-bbox="[0, 0, 1024, 100]" data-label="Text"><p>Caption text.</p></div>'
+    '<div data-bbox="[0, 100, 512, 512]" data-label="Figure"><img alt="chart"/></div>'
+)
+
+
+def write_inputs(root):
+    pages = [Image.new("RGB", (300, 400), "white") for _ in range(3)]
+    pages[0].save(root / "report.pdf", save_all=True, append_images=pages[1:])
+    (root / "scans").mkdir()
+    Image.new("RGB", (300, 300), "white").save(root / "scans" / "report.png")
+    (root / "scans" / "notes.txt").write_text("not a document")
+
+
+def test_expand_inputs(tmp_path):
+    write_inputs(tmp_path)
+    patterns = [
+        str(tmp_path / "scans"),
+        str(tmp_path / "*.pdf"),
+        str(tmp_path / "*.pdf"),
+    ]
+    paths = expand_inputs(patterns)
+    assert paths == [
+        str(tmp_path / "scans" / "report.png"),
+        str(tmp_path / "report.pdf"),
+    ]
+    assert parse_endpoint("http://gpu-a:8000=2") == ("http://gpu-a:8000", 2.0)
+    assert parse_endpoint("http://gpu-a:8000") == "http://gpu-a:8000"
+
+
+def test_dry_run_renders_without_a_server(tmp_path):
+    write_inputs(tmp_path)
+    result = CliRunner().invoke(
+        main, [str(tmp_path), "--dry-run", "--min-image-dim", "64"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "docs 2/2 | pages 4 |" in result.output
+
+
+def test_jsonl_output(tmp_path, stub_servers):
+    write_inputs(tmp_path)
+    out = tmp_path / "out.jsonl"
+    args = [str(tmp_path), "-o", str(out), "--min-image-dim", "64", "-c", "2"]
+    for server in stub_servers:
+        args += ["-e", server.url]
+    result = CliRunner().invoke(main, args)
+    assert result.exit_code == 0, result.output
+
+    documents = {
+        doc["path"]: doc for doc in map(json.loads, out.read_text().splitlines())
+    }
+    assert [len(documents[p]["pages"]) for p in sorted(documents)] == [3, 1]
+    page = documents[str(tmp_path / "report.pdf")]["pages"][0]
+    assert page["md_content"] == "Stub page."
+    assert page["token_count"] == 5 and page["retries"] == 0
+    assert "pages 4 |" in result.output and "in flight 0" in result.output
+
+
+def test_directory_output_with_images(tmp_path, stub_servers):
+    write_inputs(tmp_path)
+    stub_servers[0].raw = FIGURE_RAW
+    out = tmp_path / "out"
+    args = [str(tmp_path), "--format", "dir", "-o", str(out), "--min-image-dim", "64"]
+    result = CliRunner().invoke(main, args + ["-e", stub_servers[0].url])
+    assert result.exit_code == 0, result.output
+
+    # Both inputs are named "report", so the second one gets a suffix
+    assert sorted(p.name for p in out.iterdir()) == ["report", "report_2"]
+    assert (out / "report_2" / "report_2.md").exists()
+    pdf_dir = out / "report"
+    assert (pdf_dir / "report.md").read_text().count("Caption text.") == 3
+    document = json.loads((pdf_dir / "report.json").read_text())
+    images = document["pages"][0]["images"]
+    assert len(images) == 1
+    with Image.open(pdf_dir / images[0]) as image:
+        assert image.size[0] > 0 and image.size[1] > 0
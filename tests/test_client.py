@@ -0,0 +1,265 @@
+import asyncio
+import base64
+import io
+import random
+import threading
+import time
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+from openai import OpenAI
+from PIL import Image
+
+from chandra import parser
+from chandra.input import render_executor
+from chandra.model.schema import BatchInputItem, GenerationResult
+from chandra.model.vllm import generate_vllm
+from chandra.parser import AsyncChandraOCRClient, ChandraOCRClient
+
+NUM_PAGES = 12
+
+
+def page_images():
+    # The width identifies the page in the fake server
+    return [Image.new("RGB", (200 + 10 * i, 100), "white") for i in range(NUM_PAGES)]
+
+
+def fake_completion(content) -> tuple[SimpleNamespace, float]:
+    data_url = content[0]["image_url"]["url"]
+    image = Image.open(io.BytesIO(base64.b64decode(data_url.split(",", 1)[1])))
+    page = (image.width - 200) // 10
+    raw = (
+        f'<div data-bbox="[0, 0, 500, 100]" data-label="Section-Header"><h2>Page {page}</h2></div>'
+        f'<div data-bbox="[0, 100, 500, 900]" data-label="Text"><p>Body of page {page}.</p></div>'
+    )
+    completion = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=raw))],
+        usage=SimpleNamespace(prompt_tokens=100, completion_tokens=10),
+    )
+    # Later pages finish first, so completion order is the reverse of page order
+    return completion, 0.002 * (NUM_PAGES - page)
+
+
+class FakeOpenAI:
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, **kwargs):
+        completion, delay = fake_completion(messages[0]["content"])
+        time.sleep(delay)
+        return completion
+
+    def close(self):
+        pass
+
+
+class FakeAsyncOpenAI(FakeOpenAI):
+    async def create(self, messages, **kwargs):
+        completion, delay = fake_completion(messages[0]["content"])
+        await asyncio.sleep(delay)
+        return completion
+
+    async def close(self):
+        pass
+
+
+def without_metrics(pages):
+    # Timings differ from run to run
+    return [
+        {key: value for key, value in page.items() if key != "metrics"}
+        for page in pages
+    ]
+
+
+def sync_pages(postprocess_workers: int, ordered: bool = True):
+    with ChandraOCRClient(postprocess_workers=postprocess_workers) as client:
+        client.client = FakeOpenAI()
+        pages = client.iter_images(page_images(), ordered=ordered, window_size=6)
+        return without_metrics(pages)
+
+
+@pytest.fixture(scope="module")
+def expected_pages():
+    return sync_pages(postprocess_workers=0)
+
+
+def test_expected_pages_are_in_order(expected_pages):
+    assert [page["page_no"] for page in expected_pages] == list(range(NUM_PAGES))
+    assert expected_pages[3]["md_content"] == "## Page 3\n\nBody of page 3."
+
+
+def test_postprocess_pool_matches_inline(expected_pages):
+    assert sync_pages(postprocess_workers=2) == expected_pages
+
+
+def test_postprocess_pool_unordered(expected_pages):
+    pages = sync_pages(postprocess_workers=2, ordered=False)
+    assert sorted(pages, key=lambda page: page["page_no"]) == expected_pages
+
+
+class StalledPool:
+    """Stands in for the post-processing pool; page 0 stays unparsed until `release`."""
+
+    def __init__(self):
+        self.stalled = Future()
+
+    def submit(self, fn, *args):
+        if args[0] == 0:
+            self.call = (fn, args)
+            return self.stalled
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def release(self):
+        fn, args = self.call
+        self.stalled.set_result(fn(*args))
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_postprocess_pool_pulls_at_most_a_window_ahead(ordered):
+    pulled = []
+
+    def results():
+        result = GenerationResult(raw="<p>Page</p>", token_count=1)
+        for idx, image in enumerate(page_images()):
+            pulled.append(idx)
+            yield idx, BatchInputItem(image=image), result
+
+    pool = StalledPool()
+    pages = []
+    with ChandraOCRClient() as client:
+        client.pages_in_flight = NUM_PAGES
+        iterator = client._postprocess_in_pool(pool, results(), ordered, window_size=3)
+        consumer = threading.Thread(
+            target=lambda: pages.extend(p for p, _, _ in iterator)
+        )
+        consumer.start()
+        if ordered:
+            # Stuck behind page 0 with the window full
+            time.sleep(0.1)
+            assert pulled == [0, 1, 2] and pages == []
+        else:
+            # Page 0 takes one slot; the rest flow past it
+            deadline = time.monotonic() + 5
+            while len(pages) < NUM_PAGES - 1 and time.monotonic() < deadline:
+                time.sleep(0.001)
+            assert [page["page_no"] for page in pages] == list(range(1, NUM_PAGES))
+        pool.release()
+        consumer.join(5)
+
+    assert sorted(page["page_no"] for page in pages) == list(range(NUM_PAGES))
+    if ordered:
+        assert [page["page_no"] for page in pages] == list(range(NUM_PAGES))
+
+
+@pytest.mark.parametrize("postprocess_workers", [0, 2])
+def test_async_postprocess_matches_sync(expected_pages, postprocess_workers):
+    async def run():
+        async with AsyncChandraOCRClient(
+            postprocess_workers=postprocess_workers
+        ) as client:
+            client.client = FakeAsyncOpenAI()
+            return await client.parse_images(page_images())
+
+    assert without_metrics(asyncio.run(run())) == expected_pages
+
+
+class EchoOpenAI(FakeOpenAI):
+    """Answers every page the same way, after a short random delay."""
+
+    def create(self, messages, **kwargs):
+        time.sleep(random.uniform(0, 0.01))
+        completion, _ = fake_completion(messages[0]["content"])
+        return completion
+
+
+def write_pdf(path, num_pages: int):
+    pages = [Image.new("RGB", (300, 400), "white") for _ in range(num_pages)]
+    pages[0].save(path, save_all=True, append_images=pages[1:])
+    return str(path)
+
+
+@pytest.mark.parametrize("render_workers", [1, 2])
+def test_parse_many_isolates_failed_documents(tmp_path, monkeypatch, render_workers):
+    pools = []
+
+    def counting_render_executor(workers):
+        pools.append(workers)
+        return render_executor(workers)
+
+    monkeypatch.setattr(parser, "render_executor", counting_render_executor)
+    corrupt = tmp_path / "corrupt.pdf"
+    corrupt.write_bytes(b"%PDF-1.7\nnot really a pdf")
+    image_path = tmp_path / "scan.png"
+    Image.new("RGB", (300, 400), "white").save(image_path)
+    paths = [
+        write_pdf(tmp_path / "three.pdf", 3),
+        str(corrupt),
+        write_pdf(tmp_path / "one.pdf", 1),
+        str(image_path),
+        write_pdf(tmp_path / "two.pdf", 2),
+    ]
+
+    with ChandraOCRClient(
+        num_threads=2, min_image_dim=64, render_workers=render_workers
+    ) as client:
+        client.client = EchoOpenAI()
+        documents = {
+            doc["path"]: doc for doc in client.parse_many(paths, window_size=3)
+        }
+
+    assert set(documents) == set(paths)
+    # One render pool for the whole batch, none without parallel rendering
+    assert pools == ([2] if render_workers > 1 else [])
+    assert documents[str(corrupt)]["error"] and documents[str(corrupt)]["pages"] == []
+    for path, num_pages in [(paths[0], 3), (paths[2], 1), (paths[3], 1), (paths[4], 2)]:
+        assert documents[path]["error"] is None
+        assert [page["page_no"] for page in documents[path]["pages"]] == list(
+            range(num_pages)
+        )
+
+
+def test_generate_vllm_takes_client_positionally(stub_servers):
+    client = OpenAI(base_url=f"{stub_servers[0].url}/v1", api_key="x", max_retries=0)
+    batch = [
+        BatchInputItem(image=Image.new("RGB", (200, 200), "white"), prompt_type="ocr")
+    ]
+    results = generate_vllm(batch, client)
+    assert [result.error for result in results] == [False]
+    assert "Stub page." in results[0].raw
+
+
+@pytest.mark.parametrize("postprocess_workers", [0, 2])
+def test_pages_in_flight_returns_to_zero(stub_servers, postprocess_workers):
+    def failing_images():
+        yield from page_images()[:3]
+        raise RuntimeError("render failed")
+
+    with ChandraOCRClient(
+        base_url=stub_servers[0].url,
+        num_threads=2,
+        postprocess_workers=postprocess_workers,
+    ) as client:
+        # The consumer stops after one page, with more already pulled
+        pages = client.iter_images(page_images())
+        next(pages)
+        pages.close()
+        assert client.pages_in_flight == 0
+
+        with pytest.raises(RuntimeError):
+            list(client.iter_images(failing_images()))
+        assert client.pages_in_flight == 0
+
+
+def test_async_pages_in_flight_returns_to_zero_on_cancel(stub_servers):
+    stub_servers[0].delay = 0.5
+
+    async def run():
+        async with AsyncChandraOCRClient(base_url=stub_servers[0].url) as client:
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.parse_images(page_images()), 0.1)
+            return client.pages_in_flight
+
+    assert asyncio.run(run()) == 0
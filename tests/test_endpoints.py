@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+from openai import OpenAI
+from PIL import Image
+
+from chandra.model.endpoints import EndpointPool
+from chandra.parser import AsyncChandraOCRClient, ChandraOCRClient
+
+
+def images(n: int):
+    return [Image.new("RGB", (200, 100), "white") for _ in range(n)]
+
+
+def test_acquire_follows_weights():
+    pool = EndpointPool([("http://a", 3), ("http://b", 1)], probe_interval=None)
+    picked = [pool.acquire().base_url for _ in range(8)]
+    assert picked.count("http://a/v1") == 6
+    assert picked.count("http://b/v1") == 2
+
+
+def test_acquire_skips_excluded_and_unhealthy():
+    pool = EndpointPool(["http://a", "http://b", "http://c"], probe_interval=None)
+    a, b, c = pool.endpoints
+    b.healthy = False
+    assert pool.acquire(exclude=a.base_url) is c
+    # With every replica unhealthy, requests still go somewhere
+    a.healthy = c.healthy = False
+    assert pool.acquire() in pool.endpoints
+
+
+def test_requests_spread_across_replicas(stub_servers):
+    with ChandraOCRClient(
+        base_url=[s.url for s in stub_servers], num_threads=4
+    ) as client:
+        pages = client.parse_images(images(8))
+        stats = client.client.stats()
+
+    assert [page["page_no"] for page in pages] == list(range(8))
+    assert all(s.requests > 0 for s in stub_servers)
+    assert sum(s.requests for s in stats) == 8
+    assert all(s.errors == 0 and s.mean_latency is not None for s in stats)
+
+
+def test_retries_fail_over_to_healthy_replica(stub_servers):
+    good, bad = stub_servers
+    bad.failing = True
+    with ChandraOCRClient(base_url=[good.url, bad.url], num_threads=2) as client:
+        pages = client.parse_images(images(6))
+        good_stats, bad_stats = client.client.stats()
+
+    assert all(page["md_content"] == "Stub page." for page in pages)
+    assert not bad_stats.healthy
+    assert bad_stats.errors == bad.requests >= client.client.failure_threshold
+    assert good_stats.healthy and good_stats.errors == 0
+
+
+def test_permanent_errors_do_not_mark_replicas_failed(stub_servers):
+    # Every replica rejects the request itself, e.g. an image the model cannot take
+    for server in stub_servers:
+        server.error_status = 400
+    with ChandraOCRClient(
+        base_url=[s.url for s in stub_servers], num_threads=2
+    ) as client:
+        pages = client.parse_images(images(8))
+        stats = client.client.stats()
+
+    assert all(page["metrics"]["error"] for page in pages)
+    assert sum(s.requests for s in stub_servers) == 8
+    assert all(
+        s.healthy and s.errors == 0 and s.consecutive_failures == 0 for s in stats
+    )
+    assert all(s.outstanding == 0 for s in stats)
+
+
+def test_from_client_wraps_an_existing_client():
+    client = OpenAI(base_url="http://a/v1/", api_key="key", max_retries=0)
+    pool = EndpointPool.from_client(client)
+    assert [(e.base_url, e.client) for e in pool.endpoints] == [("http://a/v1", client)]
+    assert pool.api_key == "key" and not pool.async_clients
+    with pool.route() as endpoint:
+        assert endpoint.client is client
+    assert pool.stats()[0].requests == 1
+    pool.close()
+
+
+def test_probe_restores_recovered_replica(stub_servers):
+    server = stub_servers[0]
+    server.failing = True
+    pool = EndpointPool([server.url], failure_threshold=1, probe_interval=0.05)
+    try:
+        with pytest.raises(RuntimeError):
+            with pool.route():
+                raise RuntimeError("request failed")
+        assert not pool.endpoints[0].healthy
+
+        server.failing = False
+        deadline = time.monotonic() + 5
+        while not pool.endpoints[0].healthy and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert pool.endpoints[0].healthy
+    finally:
+        pool.close()
+
+
+def test_async_client_routes_across_replicas(stub_servers):
+    async def run():
+        async with AsyncChandraOCRClient(
+            base_url=[s.url for s in stub_servers]
+        ) as client:
+            return await client.parse_images(images(6)), client.client.stats()
+
+    pages, stats = asyncio.run(run())
+    assert [page["page_no"] for page in pages] == list(range(6))
+    assert sum(s.requests for s in stats) == 6
@@ -0,0 +1,101 @@
+import asyncio
+import base64
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from chandra.model.hedge import HedgePolicy
+from chandra.parser import AsyncChandraOCRClient, ChandraOCRClient
+
+SLOW_PAGES = {15, 25, 35}
+
+
+def hold_first_requests(pages):
+    """Stub `hold` that stalls the first request for each of `pages`, but not its hedge."""
+    seen = set()
+    lock = threading.Lock()
+
+    def hold(request) -> bool:
+        data_url = request["messages"][0]["content"][0]["image_url"]["url"]
+        image = Image.open(io.BytesIO(base64.b64decode(data_url.split(",", 1)[1])))
+        # The width identifies the page
+        page = image.width - 200
+        with lock:
+            first = page not in seen
+            seen.add(page)
+        return first and page in pages
+
+    return hold
+
+
+def images(n: int):
+    return [Image.new("RGB", (200 + i, 100), "white") for i in range(n)]
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_hedge_delay_waits_for_samples():
+    hedging = HedgePolicy(percentile=50, min_samples=3, min_delay=0.05)
+    assert hedging.hedge_delay() is None
+    for latency in (0.01, 0.02, 0.03):
+        hedging.record_first(latency)
+    assert hedging.hedge_delay() == 0.05
+    for latency in (0.5, 0.6, 0.7, 0.8):
+        hedging.record_first(latency)
+    assert hedging.hedge_delay() == 0.5
+
+
+def test_hedges_are_capped():
+    hedging = HedgePolicy(max_hedge_ratio=0.1)
+    for _ in range(50):
+        hedging.hedge_delay()
+    assert sum(hedging.try_hedge() for _ in range(50)) == 5
+    assert hedging.stats().hedge_rate == 0.1
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_hedges_win_and_losers_are_cancelled(stub_servers, stream):
+    server = stub_servers[0]
+    # Held requests are never answered, so the pages only finish through their hedges
+    server.hold = hold_first_requests(SLOW_PAGES)
+    # The cap leaves no hedge to spare, so the delay is well above a loaded machine's
+    # jitter: a hedge spent on a fast page would leave a held page waiting forever
+    hedging = HedgePolicy(max_hedge_ratio=0.1, min_samples=5, min_delay=0.5)
+    with ChandraOCRClient(
+        base_url=server.url, num_threads=2, hedging=hedging, stream=stream
+    ) as client:
+        pages = client.parse_images(images(40))
+
+    assert all(page["md_content"] == "Stub page." for page in pages)
+    assert server.requests == 40 + len(SLOW_PAGES)
+    stats = hedging.stats()
+    assert stats.requests == 40
+    assert stats.hedges == stats.hedge_wins == len(SLOW_PAGES)
+    # Each loser's connection was dropped rather than left waiting for an answer
+    assert wait_for(lambda: server.hung_up == len(SLOW_PAGES))
+
+
+def test_async_hedges_win_and_losers_are_cancelled(stub_servers):
+    server = stub_servers[0]
+    server.hold = hold_first_requests(SLOW_PAGES)
+    hedging = HedgePolicy(max_hedge_ratio=0.1, min_samples=5, min_delay=0.5)
+
+    async def run():
+        async with AsyncChandraOCRClient(
+            base_url=server.url, max_concurrency=2, hedging=hedging
+        ) as client:
+            return await client.parse_images(images(40))
+
+    pages = asyncio.run(run())
+    assert all(page["md_content"] == "Stub page." for page in pages)
+    stats = hedging.stats()
+    assert stats.hedges == stats.hedge_wins == len(SLOW_PAGES)
+    assert wait_for(lambda: server.hung_up == len(SLOW_PAGES))
@@ -0,0 +1,51 @@
+import json
+import subprocess
+import sys
+
+# `import chandra` must stay cheap for short-lived workers; it was ~870 ms with eager imports
+IMPORT_BUDGET_MS = 100
+HEAVY_MODULES = [
+    "openai",
+    "bs4",
+    "markdownify",
+    "pypdfium2",
+    "PIL",
+    "pydantic_settings",
+    "dotenv",
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - start) * 1000
+from chandra.settings import settings
+print(json.dumps({{
+    "ms": elapsed,
+    "loaded": [m for m in {heavy!r} if m in sys.modules],
+    "settings": settings.__dict__["_instance"] is not None,
+}}))
+"""
+
+
+def probe(module: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(out.stdout)
+
+
+def test_import_chandra_is_lazy():
+    runs = [probe("chandra") for _ in range(3)]
+    assert runs[0]["loaded"] == []
+    assert not runs[0]["settings"]
+    assert min(run["ms"] for run in runs) < IMPORT_BUDGET_MS
+
+
+def test_postprocessing_import_skips_client_dependencies():
+    result = probe("chandra.output")
+    assert set(result["loaded"]) <= {"bs4", "markdownify"}
+    assert not result["settings"]
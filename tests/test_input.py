@@ -0,0 +1,143 @@
+import io
+import mmap
+
+import pypdfium2 as pdfium
+import pytest
+from PIL import Image, ImageDraw
+
+from chandra.input import (
+    load_file,
+    render_executor,
+    render_page,
+    sniff_type,
+    source_name,
+)
+from chandra.model.util import MAX_IMAGE_SIZE, scale_to_fit
+
+CONFIG = {"min_image_dim": 64}
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    pages = [Image.new("RGB", (300, 400), color) for color in ("white", "red", "blue")]
+    path = tmp_path / "doc.pdf"
+    pages[0].save(path, save_all=True, append_images=pages[1:])
+    return path
+
+
+class Unseekable(io.RawIOBase):
+    """A response body that can only be read front to back."""
+
+    def __init__(self, data: bytes):
+        self.data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self.data.readinto(buffer)
+
+
+@pytest.mark.parametrize(
+    "kind",
+    ["bytes", "bytearray", "memoryview", "mmap", "readonly-mmap", "file", "unseekable"],
+)
+def test_in_memory_sources_match_path(pdf_path, kind):
+    expected = [image.tobytes() for image in load_file(str(pdf_path), CONFIG)]
+    data = pdf_path.read_bytes()
+    with open(pdf_path, "r+b") as f:
+        sources = {
+            "bytes": lambda: data,
+            "bytearray": lambda: bytearray(data),
+            "memoryview": lambda: memoryview(bytearray(data))[:],
+            "mmap": lambda: mmap.mmap(f.fileno(), 0),
+            "readonly-mmap": lambda: mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ),
+            "file": lambda: io.BytesIO(data),
+            "unseekable": lambda: Unseekable(data),
+        }
+        source = sources[kind]()
+        if kind != "unseekable":
+            assert sniff_type(source) == "pdf"
+        assert [image.tobytes() for image in load_file(source, CONFIG)] == expected
+        if isinstance(source, mmap.mmap):
+            # pdfium has let go of the buffer
+            source.close()
+
+
+def test_parallel_render_from_bytes(pdf_path):
+    expected = [image.tobytes() for image in load_file(pdf_path, CONFIG)]
+    images = load_file(pdf_path.read_bytes(), {**CONFIG, "render_workers": 2})
+    assert [image.tobytes() for image in images] == expected
+
+
+def test_parallel_render_matches_serial(tmp_path):
+    # Distinct drawings and sizes, so a swapped or torn page cannot go unnoticed
+    pages = []
+    for i in range(7):
+        image = Image.new("RGB", (300 + 20 * i, 400), "white")
+        draw = ImageDraw.Draw(image)
+        draw.rectangle(
+            (10 * i, 20 * i, 100 + 10 * i, 150 + 20 * i), fill=(30 * i, 0, 255 - 30 * i)
+        )
+        draw.text((20, 300), f"page {i}", fill="black")
+        pages.append(image)
+    path = tmp_path / "mixed.pdf"
+    pages[0].save(path, save_all=True, append_images=pages[1:])
+
+    config = {**CONFIG, "page_range": "0,2-6"}
+    serial = load_file(str(path), config)
+    assert len(serial) == 6
+    for source in (str(path), path.read_bytes()):
+        parallel = load_file(source, {**config, "render_workers": 3})
+        assert [image.size for image in parallel] == [image.size for image in serial]
+        assert [image.tobytes() for image in parallel] == [
+            image.tobytes() for image in serial
+        ]
+
+
+def test_render_pool_is_shared_between_documents(pdf_path, tmp_path):
+    other = tmp_path / "other.pdf"
+    pages = [Image.new("RGB", (200, 250 + 10 * i), "green") for i in range(4)]
+    pages[0].save(other, save_all=True, append_images=pages[1:])
+    # Workers switch between documents, from paths and from memory, and back again
+    sources = [str(pdf_path), other.read_bytes(), str(other), pdf_path.read_bytes()]
+    expected = [
+        [image.tobytes() for image in load_file(source, CONFIG)] for source in sources
+    ]
+    with render_executor(2) as pool:
+        config = {**CONFIG, "render_workers": 2, "render_executor": pool}
+        rendered = [
+            [image.tobytes() for image in load_file(source, config)]
+            for source in sources
+        ]
+    assert rendered == expected
+
+
+@pytest.mark.parametrize("dpi", [72, 200])
+def test_render_at_target_matches_legacy_size(tmp_path, dpi):
+    # Points: letter, A4, a long receipt, tabloid landscape, a tiny label, an oversized
+    # drawing; the larger ones go over the pixel budget at 200 DPI
+    sizes = [(612, 792), (595, 842), (226, 2000), (1224, 792), (50, 60), (2000, 3000)]
+    pages = [Image.new("RGB", size, "white") for size in sizes]
+    path = tmp_path / "sizes.pdf"
+    pages[0].save(path, save_all=True, append_images=pages[1:], resolution=72)
+
+    doc = pdfium.PdfDocument(str(path))
+    try:
+        for page in range(len(sizes)):
+            direct = render_page(doc, page, dpi, 1024, render_at_target=True)
+            legacy = render_page(doc, page, dpi, 1024, render_at_target=False)
+            assert direct.mode == "RGB"
+            assert direct.size == scale_to_fit(legacy).size
+            assert direct.width * direct.height <= MAX_IMAGE_SIZE[0] * MAX_IMAGE_SIZE[1]
+    finally:
+        doc.close()
+
+
+def test_image_bytes_and_source_names(tmp_path):
+    buffer = io.BytesIO()
+    Image.new("RGB", (300, 200), "white").save(buffer, format="PNG")
+    assert sniff_type(buffer.getvalue()) == "png"
+    assert load_file(buffer.getvalue(), CONFIG)[0].size == (300, 200)
+    assert source_name(tmp_path / "a.pdf", 0) == str(tmp_path / "a.pdf")
+    assert source_name(buffer.getvalue(), 3) == "<document 3>"
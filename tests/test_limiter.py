@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+
+from PIL import Image
+
+from chandra.model.limiter import AdaptiveLimiter
+from chandra.model.retry import RetryPolicy
+from chandra.parser import ChandraOCRClient
+
+
+def saturate(limiter: AdaptiveLimiter):
+    while limiter.try_acquire():
+        pass
+
+
+def test_overload_backs_off_once_per_burst_and_respects_floor():
+    now = [0.0]
+    limiter = AdaptiveLimiter(
+        initial_limit=16, min_limit=3, max_limit=32, clock=lambda: now[0]
+    )
+    saturate(limiter)
+    limiter.release(0.5)
+    for _ in range(4):
+        limiter.release(None, overloaded=True)
+    assert limiter.current_limit == 8
+    assert limiter.stats().decreases == 1
+
+    # Later bursts, each more than one average latency (0.5 s) after the last decrease
+    for _ in range(5):
+        now[0] += 0.6
+        limiter.try_acquire()
+        limiter.release(None, overloaded=True)
+    assert limiter.current_limit == 3
+
+
+def test_successes_under_load_grow_to_ceiling():
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=5, latency_tolerance=None)
+    for _ in range(200):
+        saturate(limiter)
+        limiter.release(0.1)
+    assert limiter.current_limit == 5
+
+    # Requests below the limit say nothing about spare capacity
+    idle = AdaptiveLimiter(initial_limit=2, max_limit=5)
+    for _ in range(50):
+        idle.acquire()
+        idle.release(0.1)
+    assert idle.current_limit == 2
+
+
+def test_latency_spike_backs_off():
+    limiter = AdaptiveLimiter(initial_limit=8)
+    for _ in range(20):
+        limiter.try_acquire()
+        limiter.release(0.1)
+    for _ in range(5):
+        limiter.try_acquire()
+        limiter.release(2.0)
+    assert limiter.current_limit == 4
+
+
+def test_acquire_blocks_at_limit():
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=2)
+    peak = 0
+    lock = threading.Lock()
+
+    def work():
+        nonlocal peak
+        with limiter.request():
+            with lock:
+                peak = max(peak, limiter.in_flight)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak == 2 and limiter.in_flight == 0
+
+
+def test_async_acquire_waits_for_release():
+    async def run():
+        limiter = AdaptiveLimiter(initial_limit=1, max_limit=1)
+        order = []
+
+        async def work(name: str):
+            async with limiter.request_async():
+                order.append(f"start {name}")
+                await asyncio.sleep(0.01)
+                order.append(f"end {name}")
+
+        await asyncio.gather(work("a"), work("b"))
+        return order
+
+    assert asyncio.run(run()) == ["start a", "end a", "start b", "end b"]
+
+
+def test_limiter_backs_off_on_429(stub_servers):
+    server = stub_servers[0]
+    server.max_active = 3
+    server.delay = 0.02
+    limiter = AdaptiveLimiter(initial_limit=16, max_limit=16, latency_tolerance=None)
+    images = [Image.new("RGB", (200, 100), "white") for _ in range(24)]
+    retry_policy = RetryPolicy(base_delay=0.01, budget_ratio=None)
+    with ChandraOCRClient(
+        base_url=server.url, limiter=limiter, max_retries=20, retry_policy=retry_policy
+    ) as client:
+        pages = client.parse_images(images)
+
+    assert all(page["md_content"] == "Stub page." for page in pages)
+    stats = limiter.stats()
+    assert server.rejected > 0 and stats.overloads > 0
+    assert stats.decreases > 0 and limiter.current_limit < 16
@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from chandra.output import parse_markdown
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+# Recorded with the per-call converter that searched ancestors for every text node
+CASES = [
+    (html_path, include_headers_footers)
+    for html_path in sorted((FIXTURES_DIR / "outputs").glob("*.html"))
+    for include_headers_footers in (False, True)
+]
+
+
+def expected_markdown(html_path: Path, include_headers_footers: bool) -> str:
+    suffix = ".headers" if include_headers_footers else ""
+    return (FIXTURES_DIR / "markdown" / f"{html_path.stem}{suffix}.md").read_text()
+
+
+@pytest.mark.parametrize(
+    "html_path,include_headers_footers",
+    CASES,
+    ids=[f"{p.stem}-{'headers' if h else 'body'}" for p, h in CASES],
+)
+def test_markdown_matches_recorded_output(html_path, include_headers_footers):
+    markdown = parse_markdown(html_path.read_text(), include_headers_footers)
+    assert markdown == expected_markdown(html_path, include_headers_footers)
+
+
+def test_markdown_shared_converter_is_thread_safe():
+    jobs = CASES * 4
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(
+                lambda case: parse_markdown(case[0].read_text(), case[1]), jobs
+            )
+        )
+    assert results == [expected_markdown(*case) for case in jobs]
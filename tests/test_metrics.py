@@ -0,0 +1,84 @@
+import logging
+
+import pytest
+from PIL import Image
+
+from chandra.model.metrics import PageMetrics, PrometheusMetrics
+from chandra.model.retry import RetryPolicy
+from chandra.parser import ChandraOCRClient
+
+
+def page_images(n: int):
+    return [Image.new("RGB", (200 + i, 100), "white") for i in range(n)]
+
+
+def test_metrics_hook_and_page_metrics(stub_servers):
+    seen = []
+    with ChandraOCRClient(
+        base_url=stub_servers[0].url, num_threads=2, metrics_hooks=[seen.append]
+    ) as client:
+        pages = client.parse_images(page_images(4))
+
+    assert len(seen) == 4 and all(isinstance(m, PageMetrics) for m in seen)
+    for page in pages:
+        metrics = page["metrics"]
+        # Usage reported by the stub server
+        assert metrics["prompt_tokens"] == 1 and metrics["completion_tokens"] == 5
+        assert (
+            metrics["payload_bytes"] > 0
+            and metrics["server_time"] >= stub_servers[0].delay
+        )
+        assert (
+            metrics["retries"] == 0 and not metrics["error"] and not metrics["cached"]
+        )
+        assert metrics["encode_time"] > 0 and metrics["postprocess_time"] > 0
+
+
+def test_retry_reasons_and_errors_are_logged(stub_servers, caplog):
+    server = stub_servers[0]
+    server.error_status = 503
+    policy = RetryPolicy(base_delay=0.01)
+    with caplog.at_level(logging.INFO, logger="chandra"):
+        with ChandraOCRClient(
+            base_url=server.url, max_retries=2, retry_policy=policy
+        ) as client:
+            page = client.parse_image(Image.new("RGB", (200, 100), "white"))
+
+    metrics = page["metrics"]
+    assert metrics["error"] and metrics["retries"] == 2
+    assert metrics["retry_reasons"] == ["transient", "transient"]
+    assert metrics["completion_tokens"] == 0 and metrics["server_time"] > 0
+    messages = [record.getMessage() for record in caplog.records]
+    assert sum("Error during VLLM generation" in m for m in messages) == 3
+    assert (
+        sum("Retrying generation after transient failure" in m for m in messages) == 2
+    )
+
+
+def test_failing_hook_does_not_fail_pages(stub_servers):
+    def broken(metrics):
+        raise RuntimeError("boom")
+
+    with ChandraOCRClient(
+        base_url=stub_servers[0].url, metrics_hooks=[broken]
+    ) as client:
+        pages = client.parse_images(page_images(2))
+    assert [page["md_content"] for page in pages] == ["Stub page.", "Stub page."]
+
+
+def test_prometheus_metrics():
+    prometheus_client = pytest.importorskip("prometheus_client")
+    registry = prometheus_client.CollectorRegistry()
+    hook = PrometheusMetrics(registry=registry)
+    hook(PageMetrics(server_time=0.5, prompt_tokens=10, completion_tokens=20))
+    hook(PageMetrics(retries=1, retry_reasons=["degenerate"], error=True))
+
+    def value(name, **labels):
+        return registry.get_sample_value(name, labels)
+
+    assert value("chandra_pages_total", status="ok") == 1
+    assert value("chandra_pages_total", status="error") == 1
+    assert value("chandra_retries_total", reason="degenerate") == 1
+    assert value("chandra_tokens_total", kind="completion") == 20
+    assert value("chandra_stage_seconds_count", stage="server") == 2
+    assert value("chandra_stage_seconds_sum", stage="server") == 0.5
@@ -0,0 +1,86 @@
+import base64
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from chandra.model import vllm
+from chandra.model.payload import PayloadConfig, encode_image
+from chandra.model.retry import RetryPolicy
+from chandra.parser import ChandraOCRClient
+
+
+def scan(color=(20, 20, 20)) -> Image.Image:
+    image = Image.new("RGB", (400, 300), "white")
+    ImageDraw.Draw(image).text((40, 40), "Invoice 1234", fill=color, font_size=32)
+    return image
+
+
+def decode(data_url: str) -> Image.Image:
+    _, data = data_url.split(",", 1)
+    return Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+@pytest.mark.parametrize(
+    "fmt,mime,pil_format",
+    [
+        ("png", "image/png", "PNG"),
+        ("webp", "image/webp", "WEBP"),
+        ("jpeg", "image/jpeg", "JPEG"),
+    ],
+)
+def test_formats(fmt, mime, pil_format):
+    image = scan()
+    payload = encode_image(image, PayloadConfig(format=fmt))
+    assert payload.mime_type == mime
+    assert payload.data_url.startswith(f"data:{mime};base64,")
+    decoded = decode(payload.data_url)
+    assert decoded.format == pil_format and decoded.size == image.size
+    assert payload.num_bytes == len(base64.b64decode(payload.data_url.split(",", 1)[1]))
+    if fmt != "jpeg":
+        # Lossless formats give the page back pixel for pixel
+        assert decoded.convert("RGB").tobytes() == image.tobytes()
+
+    with pytest.raises(ValueError):
+        encode_image(image, PayloadConfig(format="gif"))
+
+
+def test_reduce_colors():
+    reduce = PayloadConfig(reduce_colors=True)
+    gray = encode_image(scan(), reduce)
+    assert gray.mode == "L"
+    assert gray.num_bytes < encode_image(scan()).num_bytes
+
+    # A few flat colors become a palette, except in JPEG
+    colored = scan(color=(200, 30, 30))
+    palette = encode_image(colored, reduce)
+    assert palette.mode == "P"
+    assert decode(palette.data_url).convert("RGB").tobytes() == colored.tobytes()
+    assert (
+        encode_image(colored, PayloadConfig(format="jpeg", reduce_colors=True)).mode
+        == "RGB"
+    )
+    # Off by default
+    assert encode_image(colored).mode == "RGB"
+
+
+def test_pages_are_encoded_once_across_retries(stub_servers, monkeypatch):
+    encoded = []
+
+    def counting_encode(image, config=None):
+        encoded.append(image.size)
+        return encode_image(image, config)
+
+    monkeypatch.setattr(vllm, "encode_image", counting_encode)
+    server = stub_servers[0]
+    server.error_status = 503
+    with ChandraOCRClient(
+        base_url=server.url,
+        max_retries=2,
+        retry_policy=RetryPolicy(base_delay=0, budget_ratio=None),
+    ) as client:
+        pages = client.parse_images([scan(), scan()])
+
+    assert server.requests == 6
+    assert len(encoded) == 2
+    assert all(page["metrics"]["payload_bytes"] > 0 for page in pages)
@@ -0,0 +1,83 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+from chandra.output import (
+    extract_text_from_cell,
+    parse_chunks,
+    parse_html,
+    parse_markdown,
+    parse_page,
+)
+from PIL import Image
+
+OUTPUTS_DIR = Path(__file__).parent / "fixtures" / "outputs"
+
+PARSERS = [
+    "html.parser",
+    pytest.param(
+        "lxml",
+        marks=pytest.mark.skipif(
+            importlib.util.find_spec("lxml") is None, reason="lxml not installed"
+        ),
+    ),
+]
+
+
+@pytest.mark.parametrize("parser", PARSERS)
+@pytest.mark.parametrize("include_headers_footers", [False, True])
+@pytest.mark.parametrize(
+    "path", sorted(OUTPUTS_DIR.glob("*.html")), ids=lambda p: p.stem
+)
+def test_parse_page_matches_individual_functions(path, include_headers_footers, parser):
+    raw = path.read_text()
+    image = Image.new("RGB", (1632, 2112))
+
+    page = parse_page(raw, image.size, include_headers_footers, parser=parser)
+
+    chunks = parse_chunks(raw, image)
+    assert page.chunks == chunks
+    assert page.cell_texts == [
+        extract_text_from_cell(chunk["label"], chunk["content"]) for chunk in chunks
+    ]
+    assert page.html == parse_html(raw, include_headers_footers)
+    assert page.markdown == parse_markdown(raw, include_headers_footers)
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        # Stray end tags split text the parser would join on a reparse
+        '<div data-label="Text" data-bbox="0 0 10 10">a</td></p><ul> </b>&amp;</div>',
+        '<div data-label="Text" data-bbox="0 0 10 10"><ul><table>\n</b> </p></div>',
+        # A whitespace-only run that spans blocks, followed by text
+        '<div data-label="Text" data-bbox="0 0 10 10"><sup>2</sup> </span></div>\n'
+        '<div data-label="Text" data-bbox="0 0 10 10">\n</div>\n'
+        '<div data-label="Text" data-bbox="0 0 10 10">*</h1>\n<th><br></div>',
+        # Rows and cells outside a table
+        '<div data-label="Text" data-bbox="0 0 10 10"><math>x</math><p>  text </tr>'
+        '  text </div>\n<div data-label="Table" data-bbox="0 0 10 10"><tr> $5</td>'
+        "<td>a</div>",
+        # Split text in cell text, for each kind of cell
+        '<div data-label="Text" data-bbox="[0,0,10,10]">x</b>&amp; y</div>\n'
+        '<div data-label="Table" data-bbox="0 0 10 10">\t*</li></td>$5</div>\n'
+        '<div data-label="Formula" data-bbox="0 0 10 10"><math>a</b> \n</i>b</math></div>',
+    ],
+    ids=[
+        "stray-end-tags",
+        "whitespace-in-table",
+        "whitespace-across-blocks",
+        "stray-rows",
+        "cell-text",
+    ],
+)
+def test_parse_page_matches_individual_functions_on_malformed_html(raw):
+    page = parse_page(raw, (1024, 1024))
+    chunks = parse_chunks(raw, Image.new("RGB", (1024, 1024)))
+    assert page.chunks == chunks
+    assert page.cell_texts == [
+        extract_text_from_cell(chunk["label"], chunk["content"]) for chunk in chunks
+    ]
+    assert page.html == parse_html(raw)
+    assert page.markdown == parse_markdown(raw)
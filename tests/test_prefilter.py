@@ -0,0 +1,145 @@
+import asyncio
+import io
+import random
+
+from PIL import Image, ImageDraw
+
+from chandra.model.prefilter import PageFilter
+from chandra.model.schema import BatchInputItem
+from chandra.parser import AsyncChandraOCRClient, ChandraOCRClient
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+
+def text_page(seed: int) -> Image.Image:
+    rng = random.Random(seed)
+    image = Image.new("RGB", (850, 1100), "white")
+    draw = ImageDraw.Draw(image)
+    for y in range(80, 1000, 20):
+        draw.text((60, y), " ".join(rng.choice(WORDS) for _ in range(14)), fill="black")
+    return image
+
+
+def recompressed(image: Image.Image) -> Image.Image:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=75)
+    return Image.open(buffer).convert("RGB")
+
+
+def batch():
+    blank = Image.new("RGB", (850, 1100), (250, 248, 240))
+    cover = text_page(1)
+    return [cover, blank, recompressed(cover), text_page(2), blank, cover]
+
+
+def sparse_page(text: str, font_size: int, xy=(300, 500)) -> Image.Image:
+    image = Image.new("RGB", (850, 1100), "white")
+    ImageDraw.Draw(image).text(xy, text, fill="black", font_size=font_size)
+    return image
+
+
+def invoice(total: str) -> Image.Image:
+    image = text_page(7)
+    ImageDraw.Draw(image).text((500, 1020), f"TOTAL DUE: {total}", fill="black")
+    return image
+
+
+def is_blank(image: Image.Image) -> bool:
+    return PageFilter().analyze(BatchInputItem(image=image))[0]
+
+
+def test_blank_and_duplicate_pages(stub_servers):
+    page_filter = PageFilter()
+    with ChandraOCRClient(
+        base_url=stub_servers[0].url, page_filter=page_filter
+    ) as client:
+        pages = client.parse_images(batch())
+
+    # The re-encoded cover is a page of its own unless near-duplicates are matched
+    assert stub_servers[0].requests == 3
+    assert [page["page_no"] for page in pages] == list(range(6))
+    assert [page["md_content"] for page in pages] == [
+        "Stub page.",
+        "",
+        "Stub page.",
+    ] * 2
+    assert [page["metrics"]["blank"] for page in pages] == [False, True, False] * 2
+    # Either copy of the cover may be the one that is sent
+    cached = [page["metrics"]["cached"] for page in pages]
+    assert cached[0] != cached[5] and not any(cached[1:5])
+    stats = page_filter.stats()
+    assert (stats.pages, stats.blank, stats.duplicates, stats.entries) == (6, 2, 1, 3)
+
+
+def test_near_duplicates_are_matched_when_enabled(stub_servers):
+    page_filter = PageFilter(max_distance=48)
+    with ChandraOCRClient(
+        base_url=stub_servers[0].url, page_filter=page_filter
+    ) as client:
+        pages = client.parse_images(batch())
+
+    assert stub_servers[0].requests == 2
+    assert sum(pages[i]["metrics"]["cached"] for i in (0, 2, 5)) == 2
+    assert page_filter.stats().duplicates == 2
+
+
+def test_async_client_filters_pages(stub_servers):
+    page_filter = PageFilter()
+
+    async def run():
+        async with AsyncChandraOCRClient(
+            base_url=stub_servers[0].url, page_filter=page_filter
+        ) as client:
+            return await client.parse_images(batch())
+
+    pages = asyncio.run(run())
+    assert stub_servers[0].requests == 3
+    assert [page["md_content"] for page in pages] == [
+        "Stub page.",
+        "",
+        "Stub page.",
+    ] * 2
+    assert page_filter.stats().duplicates == 1
+
+
+def test_pages_from_one_template_are_kept_apart():
+    page_filter = PageFilter()
+    first, second = (
+        page_filter.analyze(BatchInputItem(image=invoice(total)))[1]
+        for total in ("$1234", "$9876")
+    )
+    # Only the total differs, which the hash barely sees, so only exact matching keeps them apart
+    assert (first[2] ^ second[2]).bit_count() <= 48
+    assert first != second
+    assert page_filter.claim(first)[1] and page_filter.claim(second)[1]
+
+
+def test_different_pages_with_the_same_layout_are_kept_apart():
+    page_filter = PageFilter(max_distance=48)
+    keys = [
+        page_filter.analyze(BatchInputItem(image=text_page(seed)))[1]
+        for seed in range(6)
+    ]
+    distances = [
+        (a[2] ^ b[2]).bit_count() for i, a in enumerate(keys) for b in keys[:i]
+    ]
+    assert min(distances) > page_filter.max_distance
+    assert not page_filter.analyze(BatchInputItem(image=text_page(0)))[0]
+
+
+def test_sparse_pages_are_not_blank():
+    assert not is_blank(sparse_page("Chapter 5", font_size=24))
+    assert not is_blank(
+        sparse_page("Signature: ____________", font_size=12, xy=(80, 900))
+    )
+    assert not is_blank(sparse_page("Appendix", font_size=72))
+
+
+def test_pages_without_content_are_blank():
+    rng = random.Random(0)
+    specks = Image.new("RGB", (850, 1100), (250, 248, 240))
+    for _ in range(40):
+        specks.putpixel((rng.randrange(850), rng.randrange(1100)), (90, 90, 90))
+    assert is_blank(specks)
+    assert is_blank(sparse_page("12", font_size=12, xy=(420, 1050)))
+    assert is_blank(Image.new("RGB", (850, 1100), "white"))
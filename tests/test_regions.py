@@ -0,0 +1,117 @@
+import asyncio
+import random
+
+from PIL import Image, ImageDraw
+
+from chandra.model.regions import RegionSplitter
+from chandra.model.schema import BatchInputItem
+from chandra.parser import AsyncChandraOCRClient, ChandraOCRClient
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+
+def dense_page(columns: int, lines: int = 60) -> Image.Image:
+    """A letter page at 200 DPI: a full-width title over `columns` columns of 8pt text."""
+    rng = random.Random(columns)
+    image = Image.new("RGB", (1700, 2200), "white")
+    draw = ImageDraw.Draw(image)
+    draw.text((150, 80), "A Title Spanning The Columns", fill="black", font_size=48)
+    width = (1400 - 60 * (columns - 1)) // columns
+    for column in range(columns):
+        x = 150 + column * (width + 60)
+        for line in range(lines):
+            text = ""
+            while True:
+                word = rng.choice(WORDS)
+                if draw.textlength(text + word, font_size=22) > width:
+                    break
+                text += word + " "
+            # Columns' baselines do not line up
+            draw.text(
+                (x, 220 + 7 * column + 31 * line), text, fill="black", font_size=22
+            )
+    return image
+
+
+def layout_item(image: Image.Image) -> BatchInputItem:
+    return BatchInputItem(image=image, prompt_type="ocr_layout")
+
+
+def test_columns_become_regions_in_reading_order():
+    splitter = RegionSplitter()
+    boxes = splitter.split(layout_item(dense_page(3)))
+    # The title band, then one region per column, each cut through whitespace
+    assert len(boxes) == 4
+    title, *columns = boxes
+    assert title[:3] == (0, 0, 1700) and 150 < title[3] < 240
+    assert [box[0] for box in columns] == sorted(box[0] for box in columns)
+    width = (1400 - 2 * 60) // 3
+    for gutter, (left, right) in enumerate(zip(columns, columns[1:])):
+        # Neighbours overlap around the middle of the gutter between them
+        gutter_start = 150 + width + gutter * (width + 60)
+        assert right[0] < left[2]
+        assert gutter_start < (right[0] + left[2]) / 2 < gutter_start + 60
+
+    # Sparse pages and other prompts are sent whole
+    assert splitter.split(layout_item(dense_page(1, lines=10))) == []
+    assert splitter.split(BatchInputItem(image=dense_page(3), prompt_type="ocr")) == []
+
+
+def test_stitch_remaps_bboxes_and_drops_overlap_duplicates():
+    splitter = RegionSplitter()
+    boxes = [(0, 0, 1000, 600), (0, 500, 1000, 1000)]
+    top = (
+        '<div data-bbox="[0, 0, 1024, 512]" data-label="Text"><p>First</p></div>'
+        # Clipped by the cut, and repeated whole by the lower region
+        '<div data-bbox="[0, 870, 1024, 1024]" data-label="Text"><p>Cut</p></div>'
+    )
+    bottom = (
+        '<div data-bbox="[0, 0, 1024, 410]" data-label="Text"><p>Cut off</p></div>'
+        '<div data-bbox="[0, 512, 1024, 1024]" data-label="Text"><p>Last</p></div>'
+    )
+    html = splitter.stitch((1000, 1000), boxes, [top, bottom])
+    assert html == (
+        '<div data-bbox="[0, 0, 1024, 308]" data-label="Text"><p>First</p></div>'
+        '<div data-bbox="[0, 512, 1024, 717]" data-label="Text"><p>Cut off</p></div>'
+        '<div data-bbox="[0, 768, 1024, 1024]" data-label="Text"><p>Last</p></div>'
+    )
+
+
+def test_clients_stitch_region_requests(stub_servers):
+    page = dense_page(2)
+    boxes = RegionSplitter().split(layout_item(page))
+    with ChandraOCRClient(
+        base_url=stub_servers[0].url, region_splitter=RegionSplitter()
+    ) as client:
+        result = client.parse_image(page)
+
+    assert stub_servers[0].requests == len(boxes) == 3
+    assert result["metrics"]["regions"] == 3
+    assert result["token_count"] == 15
+    # The stub's block lands at the top left of each region, in page pixels (give or take
+    # the rounding of 0-1024 bboxes)
+    for cell, (x0, y0, _, _) in zip(result["cells"], boxes, strict=True):
+        assert abs(cell["bbox"][0] - x0) <= 2 and abs(cell["bbox"][1] - y0) <= 2
+    assert result["md_content"] == "\n\n".join(["Stub page."] * 3)
+
+    async def run():
+        async with AsyncChandraOCRClient(
+            base_url=stub_servers[1].url, region_splitter=RegionSplitter()
+        ) as client:
+            return await client.parse_image(page)
+
+    assert asyncio.run(run())["cells"] == result["cells"]
+    assert stub_servers[1].requests == 3
+
+
+def test_pdf_pages_are_split_at_full_resolution(stub_servers, tmp_path):
+    # A 17x22 inch sheet: only over one request's pixel budget when rendered at full DPI
+    path = tmp_path / "sheet.pdf"
+    dense_page(2, lines=8).save(path, resolution=100)
+    with ChandraOCRClient(
+        base_url=stub_servers[0].url, region_splitter=RegionSplitter()
+    ) as client:
+        (result,) = client.parse_file(path)
+
+    assert result["metrics"]["regions"] == 3
+    assert stub_servers[0].requests == 3
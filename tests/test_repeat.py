@@ -0,0 +1,122 @@
+import random
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from chandra.model.util import detect_repeat_token, find_repeat
+from chandra.model.vllm import STREAM_MIN_LOOP_CHARS, StreamAccumulator
+from chandra.parser import ChandraOCRClient
+
+OUTPUTS_DIR = Path(__file__).parent / "fixtures" / "outputs"
+
+
+def naive_repeat(text: str, max_repeats: int = 4, window_size: int = 500) -> bool:
+    for seq_len in range(1, window_size // 2 + 1):
+        if seq_len > len(text):
+            continue
+        candidate = text[-seq_len:]
+        count, pos = 0, len(text) - seq_len
+        while pos >= 0 and text[pos : pos + seq_len] == candidate:
+            count += 1
+            pos -= seq_len
+        if count > max_repeats:
+            return True
+    return False
+
+
+@pytest.mark.parametrize(
+    "path", sorted(OUTPUTS_DIR.glob("*.html")), ids=lambda p: p.stem
+)
+def test_find_repeat_matches_markdown_detector(path):
+    raw = path.read_text()
+    expected = detect_repeat_token(raw) or (
+        len(raw) > 50 and detect_repeat_token(raw, cut_from_end=50)
+    )
+    match = find_repeat(raw)
+    assert (match is not None) == expected
+    assert (match is not None) == path.stem.startswith("degenerate")
+
+
+def test_find_repeat_matches_naive_scan():
+    rng = random.Random(0)
+    for _ in range(500):
+        unit = "".join(rng.choice("ab<>/") for _ in range(rng.randint(1, 12)))
+        prefix = "".join(rng.choice("abc") for _ in range(rng.randint(0, 40)))
+        text = prefix + unit * rng.randint(1, 8) + unit[: rng.randint(0, len(unit))]
+        expected = naive_repeat(text) or (len(text) > 50 and naive_repeat(text[:-50]))
+        assert (find_repeat(text) is not None) == expected, text
+
+
+def test_find_repeat_reports_period_and_count():
+    match = find_repeat("<p>intro</p>" + "<td>0</td>" * 12)
+    assert match.period == 10
+    assert match.count == 12
+    assert match.offset == 0
+
+    match = find_repeat(
+        "xy" + "abc" * 20 + "<end of some longer trailing block!/>" + "0123456789abc"
+    )
+    assert match.offset == 50
+    assert match.period == 3
+
+
+def stream_chunks(text: str, size: int = 4):
+    for i in range(0, len(text), size):
+        delta = SimpleNamespace(content=text[i : i + size])
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+
+
+@pytest.mark.parametrize(
+    "path", sorted(OUTPUTS_DIR.glob("*.html")), ids=lambda p: p.stem
+)
+def test_stream_checks_only_the_tail(path):
+    raw = path.read_text()
+    # Bury the output under a long loop-free preamble, as a long page would be
+    rng = random.Random(0)
+    text = (
+        " ".join(rng.choice(["alpha", "beta", "gamma", "delta"]) for _ in range(2000))
+        + raw
+    )
+    accumulator = StreamAccumulator()
+    for chunk in stream_chunks(text):
+        checked = accumulator._checked_at
+        aborted = accumulator.add(chunk)
+        if accumulator._checked_at != checked:
+            match = find_repeat(accumulator.text, cut_from_end=0)
+            expected = (
+                match is not None
+                and match.period * match.count >= STREAM_MIN_LOOP_CHARS
+            )
+            assert aborted == expected
+        if aborted:
+            break
+
+    result = accumulator.result(max_output_tokens=8192, aborted=aborted)
+    assert result.tokens_saved == (8192 - accumulator.chunks if aborted else 0)
+    assert (result.metrics.aborted, result.metrics.tokens_saved) == (
+        aborted,
+        result.tokens_saved,
+    )
+
+
+def test_streamed_loops_are_aborted_and_counted(stub_servers):
+    server = stub_servers[0]
+    clean_raw, server.raw = server.raw, "<p>" + "the same words " * 400 + "</p>"
+    image = Image.new("RGB", (200, 100), "white")
+    with ChandraOCRClient(
+        base_url=server.url, stream=True, max_tokens=4096, max_retries=1
+    ) as client:
+        page = client.parse_image(image)
+        looping, server.raw = server.raw, clean_raw
+        clean = client.parse_image(image)
+
+    # The first attempt and its retry both loop, and each is cut off before the end
+    assert server.requests == 3
+    metrics = page["metrics"]
+    assert metrics["aborted"] == 2 and metrics["retries"] == 1
+    # The stub streams 8 characters per token
+    assert 2 * (4096 - len(looping) // 8) < metrics["tokens_saved"] < 2 * 4096
+    assert clean["md_content"] == "Stub page."
+    assert (clean["metrics"]["aborted"], clean["metrics"]["tokens_saved"]) == (0, 0)
@@ -0,0 +1,78 @@
+import pytest
+from PIL import Image
+
+from chandra.model.retry import (
+    DEGENERATE,
+    PERMANENT,
+    TRANSIENT,
+    RetryBudget,
+    RetryPolicy,
+)
+from chandra.model.schema import GenerationResult
+from chandra.parser import ChandraOCRClient
+
+
+def parse_pages(server, n: int, retry_policy: RetryPolicy, max_retries: int = 6):
+    images = [Image.new("RGB", (200, 100), "white") for _ in range(n)]
+    with ChandraOCRClient(
+        base_url=server.url, max_retries=max_retries, retry_policy=retry_policy
+    ) as client:
+        return client.parse_images(images)
+
+
+def test_classify_results():
+    policy = RetryPolicy()
+    assert policy.classify(GenerationResult(raw="<p>fine</p>", token_count=3)) is None
+    assert (
+        policy.classify(GenerationResult(raw="", token_count=0, error=True))
+        == TRANSIENT
+    )
+    assert (
+        policy.classify(
+            GenerationResult(raw="", token_count=0, error=True, failure=PERMANENT)
+        )
+        == PERMANENT
+    )
+    assert (
+        policy.classify(GenerationResult(raw="<p>cut", token_count=9, aborted=True))
+        == DEGENERATE
+    )
+    looping = "<p>" + "the same words " * 400 + "</p>"
+    assert (
+        policy.classify(GenerationResult(raw=looping, token_count=1200)) == DEGENERATE
+    )
+
+
+def test_backoff_uses_full_jitter():
+    policy = RetryPolicy(base_delay=0.5, max_delay=3.0)
+    for retry, cap in [(0, 0.5), (2, 2.0), (10, 3.0)]:
+        delays = [policy.delay(retry) for _ in range(200)]
+        assert all(0 <= d <= cap for d in delays)
+        assert max(delays) > cap / 2
+
+
+def test_budget_caps_retries():
+    budget = RetryBudget(ratio=0.2, min_retries=1)
+    for _ in range(10):
+        budget.record_attempt()
+    assert sum(budget.try_spend() for _ in range(10)) == 3
+    assert budget.stats().denied == 7
+
+
+def test_permanent_errors_are_not_retried(stub_servers):
+    server = stub_servers[0]
+    server.error_status = 400
+    pages = parse_pages(server, 5, RetryPolicy(base_delay=0))
+    assert server.requests == 5
+    assert all(page["md_content"] == "" for page in pages)
+
+
+@pytest.mark.parametrize(
+    "budget_ratio,expected_requests", [(0.2, 20 + 2 + 4), (None, 20 * 4)]
+)
+def test_transient_retries_within_budget(stub_servers, budget_ratio, expected_requests):
+    server = stub_servers[0]
+    server.error_status = 503
+    policy = RetryPolicy(base_delay=0, budget_ratio=budget_ratio, min_budget=2)
+    parse_pages(server, 20, policy, max_retries=3)
+    assert server.requests == expected_requests
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+
+from PIL import Image
+
+from chandra.model.scheduler import Scheduler
+from chandra.parser import ChandraOCRClient
+
+
+def test_strict_priority_then_weighted_fair_queueing():
+    scheduler = Scheduler(max_in_flight=1, weights={"b": 2.0})
+    order = []
+
+    async def request(priority, tenant):
+        await scheduler.acquire_async(priority, tenant)
+        order.append(tenant)
+        scheduler.release(0.01)
+
+    async def run():
+        await scheduler.acquire_async()
+        tasks = [asyncio.create_task(request("batch", "a")) for _ in range(6)]
+        tasks += [asyncio.create_task(request("batch", "b")) for _ in range(6)]
+        tasks.append(asyncio.create_task(request("interactive", "user")))
+        await asyncio.sleep(0.01)
+        assert scheduler.stats().classes["batch"].queued == 12
+        scheduler.release(0.01)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    # The interactive request jumps the backlog; tenant b gets twice a's share until it runs out
+    assert order == ["user"] + list("babbabbabaaa")
+    stats = scheduler.stats()
+    assert stats.in_flight == 0
+    assert (
+        stats.classes["interactive"].dispatched,
+        stats.classes["batch"].dispatched,
+    ) == (1, 12)
+    assert stats.classes["default"].mean_wait is not None
+
+
+def test_cancelled_waiters_give_their_turn_away():
+    scheduler = Scheduler(max_in_flight=1)
+
+    async def run():
+        await scheduler.acquire_async()
+        cancelled = asyncio.create_task(scheduler.acquire_async("interactive"))
+        waiting = asyncio.create_task(scheduler.acquire_async("batch"))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        await asyncio.sleep(0.01)
+        scheduler.release(0.01)
+        await asyncio.wait_for(waiting, 1)
+
+    asyncio.run(run())
+    assert scheduler.in_flight == 1
+
+
+def test_interactive_pages_skip_a_shared_backfill(stub_servers):
+    stub_servers[0].delay = 0.05
+    scheduler = Scheduler(max_in_flight=2)
+    pages = [Image.new("RGB", (200, 200), "white")] * 40
+    with ChandraOCRClient(base_url=stub_servers[0].url, scheduler=scheduler) as client:
+        backfill = threading.Thread(
+            target=client.parse_images,
+            args=(pages,),
+            kwargs={"priority": "batch", "tenant": "backfill"},
+        )
+        backfill.start()
+        while scheduler.stats().classes["batch"].queued == 0:
+            time.sleep(0.005)
+
+        start = time.perf_counter()
+        page = client.parse_image(pages[0], priority="interactive", tenant="user")
+        latency = time.perf_counter() - start
+        stats = scheduler.stats()
+        backfill.join()
+
+    assert page["md_content"] == "Stub page."
+    # Waits for one of the backfill's requests to finish, not for the backfill
+    assert latency < 0.5
+    assert stats.classes["interactive"].dispatched == 1
+    assert stats.classes["interactive"].max_wait < 0.2
+    assert stats.classes["batch"].dispatched < 40 and stats.classes["batch"].queued > 0
+    assert scheduler.stats().classes["batch"].dispatched == 40
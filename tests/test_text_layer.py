@@ -0,0 +1,124 @@
+import ctypes
+
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
+import pytest
+
+from chandra.input import load_file
+from chandra.parser import ChandraOCRClient
+from chandra.text_layer import TEXT_LAYER_KEY, TextLayerConfig, _page_transform
+
+BODY = [
+    (72, 670 - 14 * i, 11, f"Line {i} of the body text, with (some) words & <tags>.")
+    for i in range(20)
+]
+REPORT = [(72, 700, 20, "Quarterly Report")] + BODY + [(300, 30, 9, "Page 1")]
+
+
+def text_pdf(pages, size=(612, 792), rotate=0) -> bytes:
+    """
+    A born-digital PDF. Each page is (lines, extra content stream operators), lines being
+    (x, y, font size, text) in points from the bottom left; render mode 3 text is invisible.
+    """
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for lines, extra in pages:
+        ops = extra + "".join(
+            f"BT /F1 {size_pt} Tf {x} {y} Td ({text.replace('(', '[').replace(')', ']')}) Tj ET\n"
+            for x, y, size_pt, text in lines
+        )
+        objects.append(f"<< /Length {len(ops)} >>\nstream\n{ops}endstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {size[0]} {size[1]}] /Rotate {rotate} "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def test_text_layer_pages_skip_ocr(stub_servers):
+    pdf = text_pdf(
+        [
+            (REPORT, ""),
+            # A drawn table grid: ink outside the characters
+            (
+                BODY,
+                "2 w " + "".join(f"72 {y} m 540 {y} l S " for y in range(100, 400, 20)),
+            ),
+            # A scan with an invisible OCR layer
+            (
+                [],
+                "3 Tr "
+                + "".join(
+                    f"BT /F1 11 Tf 72 {y} Td (scanned words here) Tj ET "
+                    for y in range(100, 700, 14)
+                ),
+            ),
+        ]
+    )
+    with ChandraOCRClient(
+        base_url=stub_servers[0].url, min_image_dim=512, text_layer=TextLayerConfig()
+    ) as client:
+        pages = client.parse_file(pdf)
+
+    # Only the table page and the scan went to the model
+    assert stub_servers[0].requests == 2
+    assert [page["metrics"]["text_layer"] for page in pages] == [True, False, False]
+    page = pages[0]
+    assert page["token_count"] == 0 and page["metrics"]["payload_bytes"] == 0
+    assert [cell["category"] for cell in page["cells"]] == [
+        "Section-Header",
+        "Text",
+        "Page-Footer",
+    ]
+    assert page["md_content"].startswith(
+        "## Quarterly Report\n\nLine 0 of the body text"
+    )
+    assert "words & <tags>. Line 1" in page["cells"][1]["text"]
+    # Pixel bboxes, like parsed model output: the title starts 72pt from the left edge
+    x0, y0, x1, y1 = page["cells"][0]["bbox"]
+    assert abs(x0 - 72 / 612 * page["input_width"]) <= 2
+    assert 0 < y0 < y1 < page["input_height"] * 0.15
+
+
+@pytest.mark.parametrize("rotate", [0, 90, 180, 270])
+def test_char_boxes_follow_page_rotation(rotate):
+    doc = pdfium.PdfDocument(text_pdf([(REPORT, "")], rotate=rotate))
+    page = doc[0]
+    transform = _page_transform(page)
+    width, height = page.get_width(), page.get_height()
+    device_x, device_y = ctypes.c_int(), ctypes.c_int()
+    for x, y in [(72, 700), (300, 30), (500, 400)]:
+        pdfium_c.FPDF_PageToDevice(
+            page.raw, 0, 0, int(width), int(height), 0, x, y, device_x, device_y
+        )
+        u, v = transform(x, y)
+        assert (
+            abs(u * width - device_x.value) <= 1
+            and abs(v * height - device_y.value) <= 1
+        )
+
+
+def test_render_workers_carry_the_text_layer():
+    pdf = text_pdf([(REPORT, ""), (REPORT, "")])
+    config = {"min_image_dim": 512, "text_layer": TextLayerConfig()}
+    serial = load_file(pdf, config)
+    parallel = load_file(pdf, {**config, "render_workers": 2})
+    assert [image.info[TEXT_LAYER_KEY] for image in parallel] == [
+        image.info[TEXT_LAYER_KEY] for image in serial
+    ]